@@ -1,10 +1,13 @@
 from django.contrib import admin
 from . import models
+from .core import search
+from .core.articles_factory import translation_memory
 
 
 class SourceInline(admin.TabularInline):
     model = models.Source
     extra = 1
+    fields = ('root_url', 'url_filter', 'language', 'active')
 
 
 class TopicAdmin(admin.ModelAdmin):
@@ -14,6 +17,7 @@ class TopicAdmin(admin.ModelAdmin):
 
 class SourceAdmin(admin.ModelAdmin):
     list_display = ('root_url', 'topic', 'active')
+    readonly_fields = ('etag', 'last_modified', 'content_hash')
 
 
 class ArticleAdmin(admin.ModelAdmin):
@@ -21,6 +25,48 @@ class ArticleAdmin(admin.ModelAdmin):
         'original_title', 'topic', 'status', 'date_modified',
         'date_created')
     change_form_template = 'journalist/admin/article_change_form.html'
+    raw_id_fields = ('duplicate_of',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        search.set_keywords([obj])
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'kind', 'status', 'tasks_total', 'tasks_done', 'tasks_failed',
+        'articles_saved', 'date_created')
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'kind', 'url', 'status', 'state', 'attempts', 'not_before', 'job')
+    list_filter = ('kind', 'status', 'state')
+    raw_id_fields = ('job', 'source')
+
+
+class KeywordAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+    filter_horizontal = ('articles',)
+
+
+class TranslationMemoryAdmin(admin.ModelAdmin):
+    list_display = ('text_hash', 'languages', 'provider', 'hits', 'last_used')
+    list_filter = ('languages', 'provider')
+
+    def changelist_view(self, request, extra_context=None):
+        memory = translation_memory.stats()
+        extra_context = dict(extra_context or {})
+        extra_context['title'] = (
+            'Translation memory: {:.0%} hit rate ({} hits, {} misses)'.format(
+                memory['hit_rate'], memory['hits'], memory['misses']))
+        return super().changelist_view(request, extra_context)
+
+
+class StoredPageAdmin(admin.ModelAdmin):
+    list_display = ('url', 'sha256', 'size', 'fetched_on')
+    search_fields = ('url',)
 
 
 admin.site.register(models.Article, ArticleAdmin)
@@ -28,4 +74,8 @@ admin.site.register(models.Topic, TopicAdmin)
 admin.site.register(models.Source, SourceAdmin)
 admin.site.register(models.URLRecommendation)
 admin.site.register(models.GCCache)
-
+admin.site.register(models.Job, JobAdmin)
+admin.site.register(models.Task, TaskAdmin)
+admin.site.register(models.TranslationMemory, TranslationMemoryAdmin)
+admin.site.register(models.StoredPage, StoredPageAdmin)
+admin.site.register(models.Keyword, KeywordAdmin)
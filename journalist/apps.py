@@ -1,5 +1,22 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def restore_search_triggers(sender, using, verbosity=1, **kwargs):
+    """ Any migration that alters the articles table drops the triggers of
+    the full text index on SQLite, so they are created again after migrate.
+    """
+    from journalist.core import search
+
+    restored = search.restore_triggers(connections[using])
+    if len(restored) > 0 and verbosity > 0:
+        print('  Restored the search index triggers: {}'.format(
+            ', '.join(restored)))
 
 
 class JournalistConfig(AppConfig):
     name = 'journalist'
+
+    def ready(self):
+        post_migrate.connect(restore_search_triggers, sender=self)
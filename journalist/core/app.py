@@ -1,5 +1,7 @@
-from journalist.core.articles_factory import scraper, article_editor
-from journalist.models import Article, Topic
+from journalist.core import editing
+from journalist.core.articles_factory import scraper
+from journalist.core.utils import update_log
+from journalist.models import Topic
 
 
 def available_topics():
@@ -11,11 +13,13 @@ def available_topics():
 
 def get_latest_articles():
     topics = available_topics()
-    scraper.get_articles_from_topics(topics)
+    with update_log.buffered():
+        scraper.get_articles_from_topics(topics)
+        editing.edit_new_articles()
 
     return None
 
 
 def edit_new_articles():
-    new_articles = Article.objects.get(pk=495)
-    article_editor.edit_article(new_articles)
+    with update_log.buffered():
+        return editing.edit_new_articles()
@@ -1,179 +1,207 @@
-import requests
-import json
-import re
-from dateutil.relativedelta import relativedelta
-from django.conf import settings
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from django.utils import timezone
 from gensim.summarization import summarize as gn_summarize
 from gensim.summarization import keywords as gn_keywords
 from gensim.summarization import textcleaner
 
-from ibm_watson import LanguageTranslatorV3
-from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
-
-from journalist.models import GCCache as cache
-from journalist.models import EN, READY
+from journalist.models import Article, EN, READY
 from journalist.core.utils import update_log
+from journalist.core.articles_factory.translator import translate_texts
 from journalist.core import journalist_globals as jg
+from journalist.core import search
 
 
-def summarize(text):
-    update_log.info('Summarizing...')
-    summary = gn_summarize(text, ratio=jg.SAMMARIZE_RATIO)
-    return(summary)
-
-
-def init_watson_translator():
-    authenticator = IAMAuthenticator(settings.WATSON_IAM_KEY)
-    language_translator = LanguageTranslatorV3(
-        version=settings.WATSON_VERSION,
-        authenticator=authenticator
-    )
-
-    language_translator.set_service_url(settings.WATSON_SERVICE_URL)
-
-    return language_translator
+# The process pool of edit_articles(). Starting the processes costs more
+# than a batch of articles so the pool is kept for the next batches.
+POOL = None
+POOL_LOCK = threading.Lock()
 
 
-def get_tor_session():
-    """ Connects to tor network. Changes IP every 10 minutes.
+def get_pool(processes=jg.EDIT_PROCESSES):
+    """ Returns the process pool of this process. It is created the first
+    time with the given number of processes.
     """
-    session = requests.session()
-    session.proxies = {'http':  'socks5://127.0.0.1:9050',
-                       'https': 'socks5://127.0.0.1:9050'}
-    return session
-
-
-def mymemory_translate(text, languages="el-en"):
-    daily_limit = 1000
-    c = cache.get_item('mymemory_words_remaining')
-    if c is None or c.is_expired():
-        c = cache.set_item('mymemory_words_remaining', daily_limit)
-        c.set_expiration_date(timezone.now() + relativedelta(days=+1))
-
-    url = "http://api.mymemory.translated.net/get"
-    langpair = languages.replace("-", "|")
-
-    words_to_send = len(re.findall(r'\w+', text))
-    words_remaining = int(c.value)
-    print('==> Words to send:')
-    print(words_to_send)
-
-    def translate(sentence):
-        params = {"q": sentence, "langpair": langpair}
-        session = get_tor_session()
-        response_object = session.post(url, params)
-        response = json.loads(response_object.text)
-        if response['responseStatus'] != 200:
-            update_log.warning(
-                'MyMemory responded with {}'.format(
-                    response['responseStatus'])
-                )
-        else:
-            return response['responseData']['translatedText']
-
-    if words_remaining > words_to_send:
-        translated_text = ""
-        # The limit of characters for each request is 500
-        if len(text) > 500:
-            sentences = textcleaner.split_sentences(text)
-            for sent in sentences:
-                sentence = translate(sent)
-                if sent is not None:
-                    translated_text += sentence + "\r\n"
-                else:
-                    return None
-        else:
-            translated_text = translate(text)
-
-        words_remaining -= int(words_to_send)
-        c.set_value(words_remaining)
-        return translated_text
-    else:
-        update_log.warning('MyMemory reached the daily limit.')
-        return None
+    global POOL
 
+    with POOL_LOCK:
+        if POOL is None:
+            POOL = ProcessPoolExecutor(max_workers=processes)
+        return POOL
 
-def watson_translate(text, languages='el-en'):
-    """ Translates the text using the watson API.
-    Makes sure to not pass the monthly limit by updating and checking on the
-    cache.
-    """
-    monthly_limit = 998000
-    c = cache.get_item('watson_characters_remaining')
-    if c is None or c.is_expired():
-        c = cache.set_item('watson_characters_remaining', monthly_limit)
-        c.set_expiration_date(timezone.now() + relativedelta(months=+1))
-
-    chars_remaining = int(c.value)
-    chars_to_sent = len(text)
 
-    if chars_remaining > chars_to_sent:
-        try:
-            language_translator = init_watson_translator()
-        except BaseException as err:
-            update_log.error('Error in init_watson_translator()')
-            update_log.error(err)
-        else:
-            translation = language_translator.translate(
-                text=text, model_id=languages).get_result()
-            translated_text = translation['translations'][0]['translation']
+def close_pool(wait=True):
+    """ Shuts the process pool down. The next get_pool() starts a new one.
+    """
+    global POOL
 
-            chars_remaining -= int(translation['character_count'])
-            c.set_value(chars_remaining)
+    with POOL_LOCK:
+        if POOL is not None:
+            POOL.shutdown(wait=wait)
+            POOL = None
 
-            return translated_text
-    else:
-        update_log.warning('Watson reached the monthly limit.')
-        print('Watson reached the monthly limit.')
-        return None
 
-    return None
+def summarize(text):
+    update_log.info('Summarizing...')
+    summary = gn_summarize(text, ratio=jg.SAMMARIZE_RATIO)
+    return(summary)
 
 
-def translate_this(text, languages="el-en"):
-    """ Translates and returns the given text. First try is with Watson and
-    then with MyMemory if Watson Quotas have been maxed out.
+def timed_summarize(text, ratio):
+    """ Runs in the process pool of edit_articles().
+    Returns (summary, seconds). The summary is None if it failed.
     """
-    update_log.info('Translating...')
+    start = time.perf_counter()
+    try:
+        summary = gn_summarize(text, ratio=ratio)
+    except Exception:
+        summary = None
+    return summary, time.perf_counter() - start
 
-    translated_text = watson_translate(text, languages)
-    if translated_text is None:
-        translated_text = mymemory_translate(text, languages)
 
-    return translated_text
+def timed_keywords(text):
+    """ Runs in the process pool of edit_articles().
+    Returns (keywords, seconds). The keywords are None if it failed.
+    """
+    start = time.perf_counter()
+    try:
+        keywords = gn_keywords(text).replace("\n", ", ")
+    except Exception:
+        keywords = None
+    return keywords, time.perf_counter() - start
 
 
-def edit_article(article):
-    """ Gets an article db record reference edits it and saves it.
+def translate_article(article, summary):
+    """ Returns the (title, summary) of the article in English or None if
+    the translation failed.
     """
-    update_log.info('Editing {}'.format(article.original_title))
-    summary = summarize(article.original_text)
-
     if article.original_language != EN:
         translate_langs = "{}-{}".format(
             article.original_language, EN
         )
         try:
-            title = translate_this(article.original_title, translate_langs)
-            summary = translate_this(summary, translate_langs)
+            # The title and the summary are translated together.
+            title, summary = translate_texts(
+                [article.original_title, summary], translate_langs)
         except Exception as err:
             update_log.error(err)
             return None
     else:
         title = article.title
 
-    if summary is not None:
-        article.title = title
-        html_summary = ""
-        for sent in textcleaner.split_sentences(summary):
-            html_summary += "<p>{}</p>".format(sent)
-        article.summary = html_summary
-        article.keywords = gn_keywords(summary).replace("\n", ", ")
-        article.status = READY
+    if summary is None:
+        return None
+    return title, summary
+
+
+def set_edited_fields(article, title, summary, keywords):
+    article.title = title
+    html_summary = ""
+    for sent in textcleaner.split_sentences(summary):
+        html_summary += "<p>{}</p>".format(sent)
+    article.summary = html_summary
+    article.keywords = keywords
+    article.status = READY
+
+
+def edit_article(article):
+    """ Gets an article db record reference edits it and saves it.
+    """
+    update_log.info('Editing {}'.format(article.original_title))
+    summary = summarize(article.original_text)
+
+    translated = translate_article(article, summary)
+
+    if translated is not None:
+        title, summary = translated
+        set_edited_fields(
+            article, title, summary, gn_keywords(summary).replace("\n", ", "))
         article.save()
+        search.set_keywords([article])
         update_log.info('Editing finished successfully!')
     else:
         update_log.error('Could not finished editing the article.')
 
     return article
+
+
+def edit_articles(articles, processes=jg.EDIT_PROCESSES):
+    """ Edits a batch of articles (a queryset or a list) and saves them with
+    one bulk_update.
+    Summaries and keywords are computed in the pool of processes of
+    get_pool() so that all the cores are used. The translations are done
+    here one after the other.
+    Returns the list of the articles that were edited.
+    """
+    articles = list(articles)
+    if len(articles) == 0:
+        return []
+
+    timings = {}
+    translated = []
+    pool = get_pool(processes)
+    try:
+        summaries = pool.map(
+            timed_summarize,
+            [article.original_text for article in articles],
+            [jg.SAMMARIZE_RATIO] * len(articles)
+        )
+        for article, (summary, seconds) in zip(articles, summaries):
+            timings[article.pk] = {'summary': seconds}
+            if summary is None:
+                update_log.error('Could not summarize {}'.format(
+                    article.original_title))
+                continue
+
+            start = time.perf_counter()
+            result = translate_article(article, summary)
+            timings[article.pk]['translation'] = time.perf_counter() - start
+            if result is None:
+                update_log.error('Could not translate {}'.format(
+                    article.original_title))
+                continue
+            translated.append((article, result[0], result[1]))
+
+        keywords = pool.map(
+            timed_keywords, [summary for _, _, summary in translated])
+
+        edited = []
+        now = timezone.now()
+        for (article, title, summary), (words, seconds) in zip(
+            translated, keywords
+        ):
+            timings[article.pk]['keywords'] = seconds
+            if words is None:
+                update_log.error('Could not find the keywords of {}'.format(
+                    article.original_title))
+                continue
+            set_edited_fields(article, title, summary, words)
+            # bulk_update() does not set the auto_now fields.
+            article.date_modified = now
+            edited.append(article)
+    except BrokenProcessPool:
+        # A process died. The next batch gets a new pool.
+        close_pool(wait=False)
+        raise
+
+    Article.objects.bulk_update(
+        edited,
+        ['title', 'summary', 'keywords', 'status', 'date_modified'],
+        batch_size=100
+    )
+    search.set_keywords(edited)
+
+    for article in edited:
+        t = timings[article.pk]
+        update_log.info(
+            'Edited {} in {:.2f}s (summary {:.2f}s, translation {:.2f}s, '
+            'keywords {:.2f}s)'.format(
+                article.original_title, sum(t.values()), t['summary'],
+                t['translation'], t['keywords'])
+        )
+    update_log.info('Edited {} of {} articles.'.format(
+        len(edited), len(articles)))
+
+    return edited
@@ -0,0 +1,59 @@
+import codecs
+from email.message import Message
+
+from bs4.dammit import EncodingDetector, UnicodeDammit
+
+
+def http_charset(headers):
+    """ Returns the charset of the Content-Type header of a response or None.
+    """
+    message = Message()
+    message['Content-Type'] = headers.get('Content-Type', '')
+    return message.get_content_charset()
+
+
+def known(encoding):
+    if not encoding:
+        return False
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        return False
+    return True
+
+
+def detect_encoding(html, charset=None):
+    """ Returns the encoding of the bytes of an html page or None.
+    charset is the one that the server sent, and it comes first. Then the
+    byte order mark and the <meta charset> of the page. Pages that say
+    nothing are read as UTF-8 if they can be, and guessed otherwise.
+    lxml would read all of those pages as Latin-1.
+    """
+    if isinstance(html, str):
+        return None
+    if known(charset):
+        return charset
+
+    html, encoding = EncodingDetector.strip_byte_order_mark(html)
+    if known(encoding):
+        return encoding
+    encoding = EncodingDetector.find_declared_encoding(html, is_html=True)
+    if known(encoding):
+        return encoding
+
+    try:
+        html.decode('utf-8')
+    except UnicodeDecodeError:
+        # The guess is slow so it is only made for the few pages that need
+        # it.
+        return UnicodeDammit(html, is_html=True).original_encoding
+    return 'utf-8'
+
+
+def decode(html, charset=None):
+    """ Returns the html as text, see detect_encoding().
+    """
+    if isinstance(html, str):
+        return html
+    encoding = detect_encoding(html, charset) or 'utf-8'
+    return html.decode(encoding, 'replace')
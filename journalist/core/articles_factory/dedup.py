@@ -0,0 +1,130 @@
+import hashlib
+import re
+
+import numpy as np
+from django.db.models import Q
+
+from journalist.core import journalist_globals as jg
+from journalist.core.utils import update_log
+from journalist.models import Article, ArticleFingerprint
+
+
+BANDS = 4
+BAND_BITS = 16
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def shingles(text):
+    """ Returns the set of the runs of SIMHASH_SHINGLE words of the text.
+    """
+    words = re.findall(r'\w+', text.lower())
+    size = jg.SIMHASH_SHINGLE
+    return {
+        ' '.join(words[i:i + size])
+        for i in range(0, max(len(words) - size + 1, 0))
+    }
+
+
+def simhash(text):
+    """ Returns the 64 bit SimHash of the text as an unsigned int or None if
+    the text is too short to be compared.
+    """
+    found = shingles(text)
+    if len(found) < jg.DUPLICATE_MIN_SHINGLES:
+        return None
+
+    digests = b''.join(
+        hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest()
+        for s in found
+    )
+    bits = np.unpackbits(
+        np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    # Every shingle votes for the bits of its hash.
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(found)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), 'big')
+
+
+def bands(value):
+    return [
+        (value >> (BAND_BITS * (BANDS - 1 - i))) & BAND_MASK
+        for i in range(BANDS)
+    ]
+
+
+def to_signed(value):
+    """ The database keeps the SimHash in a signed 64 bit integer.
+    """
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def make_fingerprint(article, value):
+    b = bands(value)
+    return ArticleFingerprint(
+        article=article, simhash=to_signed(value),
+        band0=b[0], band1=b[1], band2=b[2], band3=b[3]
+    )
+
+
+def find_original(article_pk, value):
+    """ Returns the pk of the closest article whose SimHash is at most
+    DUPLICATE_MAX_DISTANCE bits away from value, or None.
+    Only the articles that share a band are compared so the lookup does not
+    grow with the table.
+    """
+    b = bands(value)
+    candidates = ArticleFingerprint.objects.filter(
+        Q(band0=b[0]) | Q(band1=b[1]) | Q(band2=b[2]) | Q(band3=b[3])
+    ).exclude(article_id=article_pk).values_list(
+        'article_id', 'simhash', 'article__duplicate_of_id')
+
+    best = None
+    for pk, other, duplicate_of in candidates:
+        d = distance(value, to_unsigned(other))
+        if d <= jg.DUPLICATE_MAX_DISTANCE and (best is None or d < best[0]):
+            # Point to the first article of the story, not to a duplicate.
+            best = (d, duplicate_of or pk)
+    return None if best is None else best[1]
+
+
+def index_articles(articles):
+    """ Fingerprints the saved articles and marks the ones that nearly
+    repeat an older article (or an earlier one of the same batch) as its
+    duplicates. Returns the number of duplicates.
+    """
+    fingerprints = []
+    batch = []
+    duplicates = []
+    for article in articles:
+        value = simhash(article.original_text)
+        if value is None:
+            continue
+
+        original = find_original(article.pk, value)
+        if original is None:
+            for pk, other, duplicate_of in batch:
+                if distance(value, other) <= jg.DUPLICATE_MAX_DISTANCE:
+                    original = duplicate_of or pk
+                    break
+
+        if original is not None:
+            article.duplicate_of_id = original
+            duplicates.append(article)
+            update_log.info('Duplicate article: {}'.format(
+                article.original_title))
+
+        fingerprints.append(make_fingerprint(article, value))
+        batch.append((article.pk, value, article.duplicate_of_id))
+
+    ArticleFingerprint.objects.bulk_create(
+        fingerprints, batch_size=Article.BATCH_SIZE, ignore_conflicts=True)
+    Article.objects.bulk_update(
+        duplicates, ['duplicate_of'], batch_size=Article.BATCH_SIZE)
+    return len(duplicates)
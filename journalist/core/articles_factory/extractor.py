@@ -0,0 +1,141 @@
+from collections import namedtuple
+
+import lxml.html
+from lxml import etree
+from newspaper import Article as ArticleParser
+
+from journalist.core import journalist_globals as jg
+from journalist.core.articles_factory import charsets
+
+
+NEWSPAPER = 'newspaper'
+LXML = 'lxml'
+ENGINES = (NEWSPAPER, LXML)
+
+# Elements that never hold the text of the article. Forms, headers and
+# asides are kept because some sites put the whole article in them.
+NOISE_TAGS = ('script', 'style', 'noscript', 'template', 'svg', 'nav')
+
+# What every engine returns. Only the title and the text are saved.
+Extracted = namedtuple('Extracted', ['title', 'text'])
+
+
+def has_enough_words(text, min_words_count=jg.MIN_WORDS_TO_SCRAPE):
+    return len(text.split(' ')) >= min_words_count
+
+
+def parse_document(html, charset=None):
+    """ Returns the lxml tree of the html without the NOISE_TAGS or None.
+    charset is the one of the HTTP response, if known. See
+    charsets.detect_encoding().
+    """
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+        encoding = 'utf-8'
+    else:
+        encoding = charsets.detect_encoding(html, charset)
+    try:
+        doc = lxml.html.document_fromstring(
+            html, parser=lxml.html.HTMLParser(encoding=encoding))
+    except (etree.ParserError, ValueError, LookupError):
+        return None
+
+    for element in list(doc.iter(*NOISE_TAGS)):
+        # Only the text is needed so the element can be emptied in place.
+        element.clear(keep_tail=True)
+    return doc
+
+
+def document_words(doc):
+    return len(doc.text_content().split())
+
+
+def visible_words(html, charset=None):
+    """ Returns the number of words of the visible text of the page. The
+    article is a part of it so this is an upper bound of its words.
+    """
+    doc = parse_document(html, charset)
+    if doc is None:
+        return 0
+    return document_words(doc)
+
+
+def newspaper_extract(html, charset=None):
+    """ Fools Newspaper to think that it was the one who downloaded the html
+    so we can parse it and return the article.
+    """
+    article = ArticleParser(url="http://something")
+    article.html = charsets.decode(html, charset)
+    article.download_state = 2
+    article.parse()
+    return Extracted(article.title, article.text)
+
+
+def element_text(element):
+    return ' '.join(element.text_content().split())
+
+
+def lxml_title(doc):
+    for xpath in (
+        '//meta[@property="og:title"]/@content',
+        '//title/text()',
+        '//h1//text()',
+    ):
+        found = [t.strip() for t in doc.xpath(xpath) if t.strip()]
+        if len(found) > 0:
+            return found[0]
+    return ''
+
+
+def lxml_extract(html, doc=None, charset=None):
+    """ A fast extractor that only looks for the title and the paragraphs of
+    the article. The text is the paragraphs of the element that holds the
+    most paragraph text on the page.
+    doc is the tree of the html from parse_document(), if it was allready
+    parsed.
+    """
+    if doc is None:
+        doc = parse_document(html, charset)
+    if doc is None:
+        raise ValueError('Cannot parse this page.')
+
+    containers = {}
+    for p in doc.iter('p'):
+        text = element_text(p)
+        if len(text) < jg.LXML_MIN_PARAGRAPH_CHARS:
+            continue
+        parent = p.getparent()
+        paragraphs, size = containers.get(parent, ([], 0))
+        paragraphs.append(text)
+        containers[parent] = (paragraphs, size + len(text))
+
+    text = ''
+    if len(containers) > 0:
+        paragraphs, size = max(containers.values(), key=lambda c: c[1])
+        text = '\n\n'.join(paragraphs)
+
+    return Extracted(lxml_title(doc), text)
+
+
+def extract(html, engine=None, min_words_count=None, charset=None):
+    """ Returns the Extracted title and text of the html with the engine
+    (EXTRACTION_ENGINE by default). charset is the one of the HTTP
+    response, if known.
+    If min_words_count is given the visible text of the page is counted
+    first and None is returned without running the engine if it is shorter.
+    The lxml engine reuses the tree of that count.
+    Does not touch the database so it can run in other processes.
+    """
+    if engine is None:
+        engine = jg.EXTRACTION_ENGINE
+
+    doc = None
+    if min_words_count is not None:
+        doc = parse_document(html, charset)
+        words = 0 if doc is None else document_words(doc)
+        if words < min_words_count:
+            return None
+
+    if engine == LXML:
+        return lxml_extract(html, doc, charset)
+    return newspaper_extract(html, charset)
@@ -0,0 +1,139 @@
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from journalist.core import journalist_globals as jg
+from journalist.core.articles_factory import politeness
+from journalist.core.utils import update_log
+
+
+def get_host(url):
+    return politeness.get_host(url)
+
+
+def _fetch(get_page, url):
+    """ Runs in the threads. Returns (response, failure, log entries) where
+    failure is None or the (status, retry_after) of a failed download.
+    """
+    entries = []
+    with update_log.deferred(entries):
+        try:
+            failure = politeness.check_robots(url, get_page)
+            if failure is not None:
+                if failure[0] == politeness.DISALLOWED:
+                    update_log.warning('robots.txt disallows {}'.format(url))
+                else:
+                    update_log.warning(
+                        'Cannot read the robots.txt of {}'.format(url))
+                return None, failure, entries
+            politeness.forget_last_result()
+            response = get_page(url)
+        except Exception as err:
+            update_log.error('Error in get_page()')
+            update_log.error(err)
+            response = None
+            politeness.forget_last_result()
+    if response is not None:
+        return response, None, entries
+    return None, politeness.last_result(), entries
+
+
+def fetch_pages(entries, get_page, max_workers=jg.FETCH_MAX_WORKERS,
+                max_per_host=jg.FETCH_MAX_PER_HOST,
+                max_pending=jg.FETCH_MAX_PENDING):
+    """ Downloads the pages of the given entries concurrently and yields
+    (entry, response, failure) tuples as soon as each download finishes.
+    Every entry is a tuple that starts with the url: (url, ...).
+
+    entries can be a generator. It is read only when there are free workers
+    and fewer than max_pending entries wait for a download, so the pages of
+    the first entries are downloaded while the next ones are still being
+    found.
+
+    No more than max_workers requests run at the same time and no more than
+    max_per_host of them go to the same host. Every host also gets requests
+    at its own rate (see politeness). The hosts take turns so that one big
+    source does not hold back the rest, and the slow ones do not hold back
+    the others.
+
+    Failed downloads are yielded with a None response and a failure
+    (status, retry_after). status is None for connection errors. The pages of
+    hosts that asked to wait more than HOST_DEFER_AFTER seconds are yielded
+    at once with the DEFERRED status.
+    """
+    entries = iter(entries)
+    exhausted = False
+    pending = OrderedDict()
+    waiting = 0
+
+    running = {}
+    per_host = {}
+
+    def submit():
+        """ Fills the free slots, one url per host on every pass. Yields the
+        deferred entries and returns how long until the next host can get a
+        request (or None).
+        """
+        nonlocal waiting
+        delay = None
+        submitted = True
+        while submitted and len(running) < max_workers:
+            submitted = False
+            delay = None
+            for host in list(pending.keys()):
+                if len(running) >= max_workers:
+                    break
+                if per_host.get(host, 0) >= max_per_host:
+                    continue
+                wait_for = politeness.take(pending[host][0][0])
+                if wait_for > jg.HOST_DEFER_AFTER:
+                    deferred = pending.pop(host)
+                    waiting -= len(deferred)
+                    for entry in deferred:
+                        yield entry, None, (politeness.DEFERRED, wait_for)
+                    continue
+                if wait_for > 0:
+                    delay = wait_for if delay is None else min(
+                        delay, wait_for)
+                    continue
+                entry = pending[host].popleft()
+                waiting -= 1
+                if len(pending[host]) == 0:
+                    del pending[host]
+                future = executor.submit(_fetch, get_page, entry[0])
+                running[future] = (host, entry)
+                per_host[host] = per_host.get(host, 0) + 1
+                submitted = True
+        return delay
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while not exhausted or len(pending) > 0 or len(running) > 0:
+            delay = yield from submit()
+            # Read more entries while there are free workers. Every entry is
+            # sent to a worker as soon as it is read so that the first pages
+            # are downloaded while the next entries are found.
+            while (
+                not exhausted and waiting < max_pending and
+                len(running) < max_workers
+            ):
+                entry = next(entries, None)
+                if entry is None:
+                    exhausted = True
+                    break
+                pending.setdefault(get_host(entry[0]), deque()).append(entry)
+                waiting += 1
+                delay = yield from submit()
+
+            if len(running) == 0:
+                if delay is not None:
+                    time.sleep(delay)
+                continue
+
+            done, _ = wait(
+                running.keys(), timeout=delay, return_when=FIRST_COMPLETED)
+            for future in done:
+                host, entry = running.pop(future)
+                per_host[host] -= 1
+                response, failure, log_entries = future.result()
+                update_log.save_entries(log_entries)
+                yield entry, response, failure
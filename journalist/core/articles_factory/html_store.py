@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from journalist.core import journalist_globals as jg
+from journalist.core.utils import update_log
+from journalist.models import StoredPage
+
+
+PUTS_SINCE_EVICT = 0
+
+
+def is_enabled():
+    return bool(getattr(settings, 'HTML_STORE_ROOT', None))
+
+
+def path_for(sha256):
+    """ Returns the path of the file of a page. The files are sharded in two
+    levels of directories so that no directory gets too big.
+    """
+    return os.path.join(
+        settings.HTML_STORE_ROOT, sha256[:2], sha256[2:4],
+        sha256 + '.html.gz'
+    )
+
+
+def put(url, html):
+    """ Saves the html (bytes) of the url in the store and returns its
+    StoredPage or None if the store is off or the page could not be saved.
+    Evicts the oldest pages every HTML_STORE_EVICT_EVERY pages.
+    """
+    global PUTS_SINCE_EVICT
+
+    if not is_enabled() or html is None:
+        return None
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+
+    sha256 = hashlib.sha256(html).hexdigest()
+    path = path_for(sha256)
+    try:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so that a crash never leaves
+            # half a file behind.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(gzip.compress(html))
+            os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+    except OSError as err:
+        update_log.error('Error in saving page to the HTML store.')
+        update_log.error(err)
+        return None
+
+    page, created = StoredPage.objects.update_or_create(
+        url=url, sha256=sha256,
+        defaults={'size': size, 'fetched_on': timezone.now()}
+    )
+
+    PUTS_SINCE_EVICT += 1
+    if PUTS_SINCE_EVICT >= jg.HTML_STORE_EVICT_EVERY:
+        PUTS_SINCE_EVICT = 0
+        evict()
+
+    return page
+
+
+def get(sha256):
+    """ Returns the html (bytes) with this sha256 or None.
+    """
+    try:
+        with open(path_for(sha256), 'rb') as f:
+            return gzip.decompress(f.read())
+    except OSError:
+        return None
+
+
+def latest(url):
+    """ Returns the StoredPage that was fetched last for the url or None.
+    """
+    return StoredPage.objects.filter(url=url).order_by('-fetched_on').first()
+
+
+def total_size():
+    """ Returns the size of the files of the store. Files that are shared by
+    more than one page are counted once.
+    """
+    sizes = dict(StoredPage.objects.values_list('sha256', 'size'))
+    return sum(sizes.values())
+
+
+def remove_file(sha256):
+    """ Deletes the file of sha256 if no page uses it any more. Returns the
+    bytes that were freed.
+    """
+    if StoredPage.objects.filter(sha256=sha256).exists():
+        return 0
+    path = path_for(sha256)
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except OSError:
+        return 0
+    return size
+
+
+def evict(max_bytes=None):
+    """ Deletes the pages that were fetched first until the store is smaller
+    than max_bytes (HTML_STORE_MAX_BYTES by default).
+    Returns the number of deleted pages.
+    """
+    if max_bytes is None:
+        max_bytes = jg.HTML_STORE_MAX_BYTES
+    # The sum counts shared files more than once so it is an upper bound.
+    upper_bound = StoredPage.objects.aggregate(total=Sum('size'))['total']
+    if (upper_bound or 0) <= max_bytes:
+        return 0
+
+    total = total_size()
+    deleted = 0
+    oldest = StoredPage.objects.order_by('fetched_on').values_list(
+        'pk', 'sha256')
+    for pk, sha256 in oldest.iterator():
+        if total <= max_bytes:
+            break
+        StoredPage.objects.filter(pk=pk).delete()
+        total -= remove_file(sha256)
+        deleted += 1
+
+    if deleted > 0:
+        update_log.info('Evicted {} pages from the HTML store.'.format(
+            deleted))
+    return deleted
@@ -0,0 +1,47 @@
+from urllib.parse import urljoin
+
+from lxml import etree
+
+from journalist.core.articles_factory import charsets
+
+
+ABSOLUTE = ('http://', 'https://')
+
+
+def extract_links(html, base_url, charset=None):
+    """ Returns the absolute urls of the <a href> links of an html page in
+    the order they appear, without fragments and without repeats.
+    Relative links are joined to the <base href> of the page or to base_url.
+    charset is the one of the HTTP response, if known. See
+    charsets.detect_encoding().
+    Only the links are read from the tree, in C, by lxml.
+    """
+    parser = etree.HTMLParser(
+        remove_comments=True,
+        encoding=charsets.detect_encoding(html, charset)
+    )
+    root = etree.fromstring(html, parser)
+    if root is None:
+        return []
+
+    base = root.xpath('//base/@href')
+    if len(base) > 0:
+        base_url = urljoin(base_url, base[0].strip())
+
+    urls = {}
+    for href in root.xpath('//a/@href'):
+        href = href.strip()
+        if not href.startswith(ABSOLUTE):
+            href = urljoin(base_url, href)
+        urls[href.split('#', 1)[0]] = None
+    return list(urls)
+
+
+def filter_links(urls, url_filter):
+    """ Returns the urls that start with the url_filter of a source and are
+    not the url_filter itself.
+    """
+    return [
+        url for url in urls
+        if url.startswith(url_filter) and url != url_filter
+    ]
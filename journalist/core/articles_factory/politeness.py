@@ -0,0 +1,210 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from django.utils import timezone
+
+from journalist.core import journalist_globals as jg
+
+
+# The statuses that mean "too fast" or "try later". They slow the host down
+# and the page is tried again.
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+# Not a real status. The page is not fetched because robots.txt disallows it.
+DISALLOWED = -1
+# Not a real status. The host asked to wait longer than HOST_DEFER_AFTER so
+# the page was given back without being fetched.
+DEFERRED = -2
+
+HOSTS = {}
+HOSTS_LOCK = threading.Lock()
+
+# The (status, retry_after) of the last request of each thread.
+_local = threading.local()
+
+
+class Host:
+    """ The request rate of a host. It is a token bucket whose rate goes up
+    a little after every good response and is halved after every response
+    that asks to slow down (AIMD).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rate = jg.HOST_RATE
+        self.tokens = float(jg.HOST_BURST)
+        self.updated = time.monotonic()
+        self.not_before = 0.0
+        self.crawl_delay = None
+        self.robots = None
+        # The (status, retry_after) of a robots.txt that could not be read.
+        self.robots_failure = None
+        self.robots_expire = 0.0
+        self.robots_lock = threading.Lock()
+
+    def max_rate(self):
+        if self.crawl_delay:
+            return min(jg.HOST_MAX_RATE, 1 / self.crawl_delay)
+        return jg.HOST_MAX_RATE
+
+    def refill(self, now):
+        burst = 1 if self.crawl_delay else jg.HOST_BURST
+        self.tokens = min(
+            burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """ Takes a token and returns 0, or returns how many seconds to wait
+        for one.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            if now < self.not_before:
+                return self.not_before - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def record(self, status, retry_after=None):
+        with self.lock:
+            if status is None or status in RETRY_STATUSES:
+                self.rate = max(jg.HOST_MIN_RATE, self.rate * jg.HOST_BACKOFF)
+                self.tokens = min(self.tokens, 0.0)
+            elif status < 400:
+                self.rate = min(
+                    self.max_rate(), self.rate + jg.HOST_RATE_STEP)
+            if retry_after:
+                self.not_before = max(
+                    self.not_before,
+                    time.monotonic() + min(retry_after, jg.HOST_MAX_WAIT))
+
+
+def get_host(url):
+    return urlparse(url).netloc.lower()
+
+
+def host_for(url):
+    key = get_host(url)
+    with HOSTS_LOCK:
+        if key not in HOSTS:
+            HOSTS[key] = Host()
+        return HOSTS[key]
+
+
+def parse_retry_after(value):
+    """ Returns the seconds of a Retry-After header (seconds or a date) or
+    None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (date - timezone.now()).total_seconds())
+
+
+def take(url):
+    """ Takes a token of the host of the url. Returns 0 or the seconds until
+    the host can get a request.
+    """
+    return host_for(url).take()
+
+
+def record(url, status, retry_after=None):
+    """ Tells the host of the url how a request went. status is None for
+    connection errors. Called by get_page.
+    """
+    host_for(url).record(status, retry_after)
+    _local.last = (status, retry_after)
+
+
+def last_result():
+    """ Returns the (status, retry_after) of the last request of this
+    thread.
+    """
+    return getattr(_local, 'last', (None, None))
+
+
+def forget_last_result():
+    _local.last = (None, None)
+
+
+def read_robots(host, url, get_page):
+    """ Reads the robots.txt of the host of the url with get_page. Its
+    Crawl-delay caps the rate of the host.
+    A missing robots.txt (4xx) allows everything. One that cannot be read
+    (5xx or no connection) disallows everything for ROBOTS_RETRY seconds,
+    and the host gets no requests meanwhile.
+    """
+    parts = urlparse(url)
+    response = get_page(
+        '{}://{}/robots.txt'.format(parts.scheme, parts.netloc),
+        any_status=True)
+    status = None if response is None else response.status_code
+
+    if status is None or status >= 500 or status in RETRY_STATUSES:
+        retry_after = jg.ROBOTS_RETRY
+        if response is not None:
+            retry_after = max(retry_after, parse_retry_after(
+                response.headers.get('Retry-After')) or 0)
+        with host.lock:
+            host.robots = None
+            host.robots_failure = (status, retry_after)
+            host.not_before = max(
+                host.not_before, time.monotonic() + retry_after)
+        host.robots_expire = time.monotonic() + retry_after
+        return
+
+    robots = RobotFileParser()
+    if status == 200:
+        robots.parse(response.text.splitlines())
+    else:
+        robots.allow_all = True
+    with host.lock:
+        host.robots = robots
+        host.robots_failure = None
+        delay = robots.crawl_delay('*')
+        host.crawl_delay = float(delay) if delay else None
+        host.rate = min(host.rate, host.max_rate())
+        if host.crawl_delay:
+            host.tokens = min(host.tokens, 0.0)
+    host.robots_expire = time.monotonic() + jg.ROBOTS_TTL
+
+
+def check_robots(url, get_page):
+    """ Returns None if the robots.txt of the host allows the url. Otherwise
+    returns the failure (status, retry_after) to report instead of fetching
+    it: DISALLOWED, or the status of the robots.txt that could not be read
+    so that the page is tried again later.
+    The robots.txt is read with get_page once every ROBOTS_TTL seconds.
+    """
+    host = host_for(url)
+    with host.robots_lock:
+        if time.monotonic() >= host.robots_expire:
+            read_robots(host, url, get_page)
+    if host.robots is None:
+        return host.robots_failure
+    if not host.robots.can_fetch('*', url):
+        return (DISALLOWED, None)
+    return None
+
+
+def retry_delay(attempts, retry_after=None):
+    """ Seconds to wait before a failed page is tried again. Doubles with
+    every attempt and is never shorter than the Retry-After of the host.
+    """
+    delay = jg.FETCH_RETRY_DELAY * 2 ** max(attempts - 1, 0)
+    return max(delay, retry_after or 0)
+
+
+def should_retry(status):
+    return status is None or status in RETRY_STATUSES or status == DEFERRED
@@ -1,70 +1,89 @@
+import hashlib
 import random
-import requests
+import tempfile
+import threading
 
-from bs4 import BeautifulSoup
-from newspaper import Article as ArticleParser
-from requests.exceptions import InvalidSchema
+from lxml import etree
+from requests.exceptions import RequestException
 
-from django.core.exceptions import ObjectDoesNotExist
-from django.db import IntegrityError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 
 from journalist.core import journalist_globals as jg
 from journalist.core.utils import update_log
-from journalist.core.articles_factory import article_editor
+from journalist.core.utils.sessions import get_session
+from journalist.core.utils.iterables import batches
+from journalist.core.articles_factory import fetcher, sitemap, html_store
+from journalist.core.articles_factory import politeness, links
+from journalist.core.articles_factory import extractor, dedup, charsets
 from journalist.core.utils.user_agents import get_random_user_agent
-from journalist.models import Topic, Article, READY
-from journalist.models import GCCache as cache
+from journalist.models import Topic, Source, Article, URLBlacklist
 
 
 CURRENT_USER_AGENT = get_random_user_agent()
 REQUESTS_COUNT = 0
+# get_page is called from the fetcher threads.
+USER_AGENT_LOCK = threading.Lock()
 
 
-def get_tor_session():
-    """ Connects to the tor network. Changes IP every 10 minutes.
-    """
-    session = requests.session()
-    session.proxies = {'http':  'socks5://127.0.0.1:9050',
-                       'https': 'socks5://127.0.0.1:9050'}
-    return session
-
-
-def get_page(url):
+def get_page(url, stream=False, extra_headers=None, any_status=False):
     """ Sends a request to the url and returns a response or None.
     Rotates random user agents every random intervals.
+    Every response is reported to the politeness scheduler of its host.
+    With stream=True the body is not downloaded until it is read and the
+    caller must close the response.
+    extra_headers are added to the request. If they make it conditional
+    (If-None-Match, If-Modified-Since) a 304 response is returned too.
+    With any_status=True every response is returned, without a warning,
+    for the callers that handle the status themselves (robots.txt).
     """
     global CURRENT_USER_AGENT
     global REQUESTS_COUNT
 
-    headers = {'User-Agent': CURRENT_USER_AGENT}
-    session = get_tor_session()
+    with USER_AGENT_LOCK:
+        headers = {'User-Agent': CURRENT_USER_AGENT}
+    if extra_headers:
+        headers.update(extra_headers)
+    session = get_session()
 
     try:
-        response = session.get(url, headers=headers)
-    except InvalidSchema as e:
+        response = session.get(
+            url, headers=headers, timeout=jg.HTTP_TIMEOUT, stream=stream)
+    except RequestException as e:
         update_log.error('Error in session.get()')
         update_log.error(e)
+        politeness.record(url, None)
         return None
     else:
+        politeness.record(
+            url, response.status_code,
+            politeness.parse_retry_after(response.headers.get('Retry-After'))
+        )
+
         # Use a user agent for a random amount of requests
-        REQUESTS_COUNT += 1
-        r_limit = random.randint(5, 10)
-        if REQUESTS_COUNT >= r_limit:
-            update_log.info("Changing user agent at {} requests.".format(
-                REQUESTS_COUNT))
-
-            # Make sure our new user agent is not the one we allready have.
-            for a in range(0, 10):
-                new_ua = get_random_user_agent()
-                if new_ua != CURRENT_USER_AGENT:
-                    CURRENT_USER_AGENT = get_random_user_agent()
-                    REQUESTS_COUNT = 0
-
-        if response.status_code == 200:
+        with USER_AGENT_LOCK:
+            REQUESTS_COUNT += 1
+            r_limit = random.randint(5, 10)
+            if REQUESTS_COUNT >= r_limit:
+                update_log.info("Changing user agent at {} requests.".format(
+                    REQUESTS_COUNT))
+
+                # Make sure our new user agent is not the one we allready
+                # have.
+                for a in range(0, 10):
+                    new_ua = get_random_user_agent()
+                    if new_ua != CURRENT_USER_AGENT:
+                        CURRENT_USER_AGENT = get_random_user_agent()
+                        REQUESTS_COUNT = 0
+
+        if response.status_code == 200 or any_status:
+            return response
+        elif response.status_code == 304 and extra_headers:
             return response
         else:
             update_log.warning('Got response code ({})'.format(
                 response.status_code))
+            response.close()
             return None
 
 
@@ -82,102 +101,232 @@ def test_connection():
         update_log.info(response.text)
 
 
-def get_urls():
-    """ Get a list of urls (sources) for each topic to scrape.
+def iter_sources():
+    """ Yields the active sources of the active topics.
     """
     topics = Topic.objects.filter(active=True)
-    urls = {}
     for topic in topics:
-        urls[topic.title] = set()
-        sources = topic.sources.filter(active=True).values()
-        for source in sources:
-            urls[topic.title].update(get_urls_from_source(source))
-    return urls
-
-
-def get_urls_from_source(source):
-    """ Returns a set of tuples: {(url, lang), (url, lang) ...} so that every
-    url-language combination is unique.
-    Checks the url_blacklist so we don't scrape a URL more than once.
+        for source in topic.sources.filter(active=True).values():
+            yield topic.title, source
+
+
+def iter_urls_from_source(source, state=None):
+    """ Yields the urls of the root page of the source that pass its
+    url_filter and are not in the URLBlacklist, as soon as they are read.
+    The blacklist is checked in batches of URL_BATCH_SIZE urls.
+    The new sitemap_lastmod and validators of the source are put in state
+    instead of being saved, because they must not be saved before the urls
+    are fetched. See save_source_state().
+    The validators are kept only if the page was read to the end.
     """
-
-    urls = set()
-
-    blacklist = cache.get_item('url_blacklist')
-    if blacklist is None:
-        blacklist = cache.set_item('url_blacklist', "")
+    if state is None:
+        state = {}
 
     update_log.info('Checking {}'.format(source['root_url']))
-    response = get_page(source['root_url'])
-    if response is not None:
-        soup = None
-        if source['root_url'].endswith('.xml'):
-
-            # XML Parsing =====================================================
-            xml = response.text
-            print('==> Response:')
-            print(xml)
-            soup = BeautifulSoup(xml)
-            if soup is not None:
-                links = soup.find_all('loc')
-                if len(links) == 0:
-                    update_log.warning('No links were fount in this page.')
-                for link in links:
-                    link_text = link.text
-                    print(link_text)
-                    if (
-                        link_text.startswith(source['url_filter']) and
-                        link_text > source['url_filter'] and
-                        link_text not in blacklist.value
-                    ):
-                        urls.add((link_text, source['language']))
-            else:
-                update_log.warning('Cannot parse this page.')
+    body, validators, charset = fetch_root(source)
+    if body is None:
+        if validators is not None:
+            state.update(validators)
+        return
+
+    result = {'complete': True}
+    found = 0
+    with body:
+        if sitemap.is_sitemap(source['root_url']):
+            urls = iter_urls_from_sitemap(source, body, result)
         else:
+            urls = iter_urls_from_html(source, body, charset)
+        for batch in batches(urls, jg.URL_BATCH_SIZE):
+            for url in URLBlacklist.filter_new(dict.fromkeys(batch)):
+                found += 1
+                yield url
+
+    # Keep the validators only when the page was read successfully so that
+    # a failed run is not skipped the next time.
+    if result['complete']:
+        state.update(validators)
+    if result.get('sitemap_lastmod') is not None:
+        state['sitemap_lastmod'] = result['sitemap_lastmod']
+
+    if found == 0:
+        update_log.warning('Fount nothing new in {}'.format(
+            source['root_url']))
 
-            # HTML parsing ====================================================
-            soup = BeautifulSoup(response.content, 'html.parser')
-            if soup is not None:
-                links = soup.find_all('a', href=True)
-                if len(links) == 0:
-                    update_log.warning('No links were fount in this page.')
-                for link in links:
-                    if (
-                        link['href'].startswith(source['url_filter']) and
-                        link['href'] > source['url_filter'] and
-                        link['href'] not in blacklist.value
-                    ):
-                        urls.add((link['href'], source['language']))
-            else:
-                update_log.warning('Cannot parse this page.')
+    update_log.event('discovered', source=source['root_url'], urls=found)
 
+
+def save_source_state(source_id, state):
+    """ Saves the state that iter_urls_from_source() put together for a
+    source. It is called once the urls of the source were fetched, so that
+    a url whose fetch failed is found again by the next run.
+    The state may have been stored as json, so sitemap_lastmod can be a
+    string. It only moves forward.
+    """
+    validators = {
+        field: state[field]
+        for field in ('etag', 'last_modified', 'content_hash')
+        if field in state
+    }
+    if len(validators) > 0:
+        Source.objects.filter(pk=source_id).update(**validators)
+
+    newest = state.get('sitemap_lastmod')
+    if isinstance(newest, str):
+        newest = parse_datetime(newest)
+    if newest is not None:
+        Source.objects.filter(pk=source_id).filter(
+            Q(sitemap_lastmod__isnull=True) | Q(sitemap_lastmod__lt=newest)
+        ).update(sitemap_lastmod=newest)
+
+
+def fetch_root(source):
+    """ Downloads the root page of the source in a temporary file.
+    Sends the validators of the last run (ETag and Last-Modified) and returns
+    (None, None, None) if the server responded with 304 or the download
+    failed, and (None, validators, None) if the body has the same hash as the
+    last time.
+    Otherwise returns (file, validators, charset) where validators are the
+    new values of the etag, last_modified and content_hash fields of the
+    source and charset is the one of the Content-Type header or None.
+    """
+    headers = {}
+    if source['etag']:
+        headers['If-None-Match'] = source['etag']
+    if source['last_modified']:
+        headers['If-Modified-Since'] = source['last_modified']
+
+    response = get_page(source['root_url'], stream=True, extra_headers=headers)
+    if response is None:
+        return None, None, None
+
+    if response.status_code == 304:
+        response.close()
+        update_log.info('Not modified since the last run.')
+        return None, None, None
+
+    body = tempfile.SpooledTemporaryFile(max_size=jg.ROOT_PAGE_MEMORY_SIZE)
+    content_hash = hashlib.sha256()
+    try:
+        for chunk in response.iter_content(chunk_size=jg.SITEMAP_CHUNK_SIZE):
+            content_hash.update(chunk)
+            body.write(chunk)
+    except RequestException as err:
+        update_log.error('Error while downloading the root page.')
+        update_log.error(err)
+        body.close()
+        return None, None, None
+    finally:
+        response.close()
+
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'content_hash': content_hash.hexdigest(),
+    }
+    if validators['content_hash'] == source['content_hash']:
+        body.close()
+        update_log.info('Not changed since the last run.')
+        return None, validators, None
+
+    body.seek(0)
+    return body, validators, charsets.http_charset(response.headers)
+
+
+def iter_urls_from_html(source, body, charset=None):
+    """ Yields the links of an html page that pass the url_filter of the
+    source. Relative links are made absolute first.
+    charset is the one of the HTTP response, if known.
+    """
+
+    # HTML parsing ============================================================
+    try:
+        urls = links.extract_links(
+            body.read(), source['root_url'], charset)
+    except (etree.LxmlError, ValueError, LookupError):
+        update_log.warning('Cannot parse this page.')
+        return
     if len(urls) == 0:
-        update_log.warning('Fount nothing new in {}'.format(
-            source['root_url']))
+        update_log.warning('No links were fount in this page.')
+    yield from links.filter_links(urls, source['url_filter'])
+
+
+def iter_urls_from_sitemap(source, body, result):
+    """ Streams the sitemap of the source from its downloaded body and yields
+    its urls that pass the url_filter.
+    Only the entries that changed after the sitemap_lastmod of the source are
+    read. When the whole sitemap is read result['sitemap_lastmod'] is set to
+    the newest entry so that the next run can start from there.
+    result['complete'] is set to False if the sitemap was broken or if it is
+    an index whose child sitemaps had to be read. An index is read again on
+    every run because its children are not checked for changes.
+    """
+    newest = None
+    entries = 0
+    followed = []
+
+    chunks = iter(lambda: body.read(jg.SITEMAP_CHUNK_SIZE), b'')
+    try:
+        for url, lastmod in sitemap.parse_sitemap(
+            chunks, get_page, source['sitemap_lastmod'], followed=followed
+        ):
+            entries += 1
+            if lastmod is not None and (newest is None or lastmod > newest):
+                newest = lastmod
+            if (
+                url.startswith(source['url_filter']) and
+                url > source['url_filter']
+            ):
+                yield url
+    except etree.XMLSyntaxError as err:
+        update_log.error('Cannot parse this sitemap.')
+        update_log.error(err)
+        result['complete'] = False
+        return
 
-    return urls
+    if entries == 0:
+        update_log.warning('No new links were fount in this sitemap.')
+
+    result['sitemap_lastmod'] = newest
+    result['complete'] = len(followed) == 0
 
 
 def add_url_to_blacklist(url):
     """ Adds a url to the blacklist so that we never try to scrape it again.
     """
-    blacklist = cache.get_item('url_blacklist')
+    URLBlacklist.add_urls([url])
 
-    if blacklist is None:
-        blacklist = cache.set_item('url_blacklist', url)
-        return True
+    return True
 
-    new_url = ', {}'.format(url)
-    blacklist.set_value(blacklist.value + new_url)
 
-    return True
+def parse_html(url, html, min_words_count=jg.MIN_WORDS_TO_SCRAPE,
+               charset=None):
+    """ Extracts the article from the html with the EXTRACTION_ENGINE and
+    adds the url to the blacklist.
+    Pages whose visible text is too short are not extracted at all.
+
+    Returns None if the article is smaller than min_words_count.
+    """
+    try:
+        article = extractor.extract(
+            html, min_words_count=min_words_count, charset=charset)
+    except Exception as err:
+        update_log.error('Error in extractor.extract()')
+        update_log.error(err)
+        return None
+    else:
+        add_url_to_blacklist(url)
+        if article is not None and extractor.has_enough_words(
+            article.text, min_words_count
+        ):
+            return article
+
+    return None
 
 
 def parse_article(url, min_words_count=jg.MIN_WORDS_TO_SCRAPE):
     """ We download an article by ourselves so that we do it behind the Tor
     network and with a random user agent (Don't let Newspaper do it!).
-    Then we fool Newspaper to think that it was the one who downloaded it so we
-    can parse it and return the article.
+    Then we parse it with parse_html().
 
     Returns None if the article is smaller than min_words_count.
     """
@@ -190,27 +339,19 @@ def parse_article(url, min_words_count=jg.MIN_WORDS_TO_SCRAPE):
         return None
 
     if response is not None:
-        article = ArticleParser(url="http://something")
-        article.html = response.content
-        article.download_state = 2
-
-        try:
-            article.parse()
-        except Exception as err:
-            update_log.error('Error in article.parse()')
-            update_log.error(err)
-            return None
-        else:
-            add_url_to_blacklist(url)
-            if len(article.text.split(' ')) >= min_words_count:
-                return article
+        return parse_html(
+            url, response.content, min_words_count,
+            charsets.http_charset(response.headers)
+        )
 
     return None
 
 
-def get_articles_from_topics(topics):
-    """ This is where it all starts. Scrapes articles from all URLS fount in
-    the topics. Edits them and saves them to the database.
+def discover_urls(states):
+    """ Looks for new urls in the sources of every active topic and yields
+    (url, lang, topic_name, source_id) tuples to fetch as soon as they are
+    found, so that the fetching can start before the discovery is over.
+    The state of every source is put in states by its id.
     """
 
     update_log.info('Testing connection.')
@@ -218,39 +359,116 @@ def get_articles_from_topics(topics):
 
     update_log.info('Looking for latest articles.')
 
-    articles_urls = get_urls()
-
-    if len(articles_urls) > 0:
-        for topic_name, url_list in articles_urls.items():
-            update_log.info('Fount {} new URLs to scrape for: {}'.format(
-                len(url_list), topic_name))
-            for url, lang in url_list:
-                try:
-                    article = Article.objects.get(source=url)
-                    update_log.warning('Article allready exists: {}'.format(
-                        article.original_title))
-                except ObjectDoesNotExist:
-                    article_parsed = parse_article(url)
-                    if article_parsed is not None:
-                        try:
-                            new_article = Article.objects.create(
-                                source=url,
-                                topic_id=int(topics[topic_name]),
-                                original_title=article_parsed.title,
-                                original_text=article_parsed.text,
-                                original_language=lang
-                            )
-                        except IntegrityError as err:
-                            update_log.error('Error in saving new article.')
-                            update_log.error(err)
-                            continue
-                        else:
-                            update_log.info('Saved new article: {}'.format(
-                                article_parsed.title))
-                            article_editor.edit_article(new_article)
-                else:
-                    if article.status != READY:
-                        article_editor.edit_article(new_article)
+    # The same url can be found in more than one topic. It is fetched once.
+    seen = set()
+    for topic_name, source in iter_sources():
+        found = 0
+        state = states.setdefault(source['id'], {})
+        for batch in batches(
+            iter_urls_from_source(source, state), jg.URL_BATCH_SIZE
+        ):
+            for url in Article.filter_new(batch):
+                if url not in seen:
+                    seen.add(url)
+                    found += 1
+                    yield url, source['language'], topic_name, source['id']
+        update_log.info('Fount {} new URLs to scrape for: {}'.format(
+            found, topic_name))
+
+
+def build_article(url, lang, topic_id, html, charset=None):
+    """ Keeps the html of the url in the HTML store and parses it.
+    charset is the one of the HTTP response, if known.
+    Returns a new unsaved article or None.
+    """
+    html_store.put(url, html)
+    article_parsed = parse_html(url, html, charset=charset)
+    if article_parsed is None:
+        return None
+
+    return Article(
+        source=url,
+        topic_id=int(topic_id),
+        original_title=article_parsed.title,
+        original_text=article_parsed.text,
+        original_language=lang
+    )
+
+
+def save_articles(articles):
+    """ Saves the new articles with bulk inserts of ARTICLE_BATCH_SIZE.
+    Articles whose source or title allready exist are skipped.
+    Returns the set of the sources of the articles that were saved.
+    """
+    if len(articles) == 0:
+        return set()
+
+    Article.objects.bulk_create(
+        articles, batch_size=jg.ARTICLE_BATCH_SIZE, ignore_conflicts=True)
+
+    # The inserts don't say which rows were skipped so look them up.
+    titles = {article.source: article.original_title for article in articles}
+    sources = list(titles.keys())
+    saved = set()
+    for i in range(0, len(sources), Article.BATCH_SIZE):
+        for source, title in Article.objects.filter(
+            source__in=sources[i:i + Article.BATCH_SIZE]
+        ).values_list('source', 'original_title'):
+            if titles[source] == title:
+                saved.add(source)
+
+    for article in articles:
+        if article.source in saved:
+            update_log.info('Saved new article: {}'.format(
+                article.original_title))
+        else:
+            update_log.warning('Article allready exists: {}'.format(
+                article.original_title))
+
+    # Look for near duplicates before the edit stage gets them.
+    saved_sources = list(saved)
+    for i in range(0, len(saved_sources), Article.BATCH_SIZE):
+        dedup.index_articles(Article.objects.filter(
+            source__in=saved_sources[i:i + Article.BATCH_SIZE]
+        ).order_by('pk'))
+
+    return saved
+
+
+def get_articles_from_topics(topics):
+    """ This is where it all starts. Scrapes articles from all URLS fount in
+    the topics and saves them to the database as NEW articles.
+    The workers use the same steps through journalist.core.jobs.
+    """
+
+    states = {}
+    to_fetch = discover_urls(states)
+
+    # The pages are fetched while the urls are still being discovered. They
+    # are parsed in the order they finish downloading and saved in batches.
+    articles = []
+    failed = set()
+    for (url, lang, topic_name, source_id), response, failure in (
+        fetcher.fetch_pages(to_fetch, get_page)
+    ):
+        if response is None:
+            failed.add(source_id)
+            continue
+        article = build_article(
+            url, lang, topics[topic_name], response.content,
+            charsets.http_charset(response.headers)
+        )
+        if article is not None:
+            articles.append(article)
+        if len(articles) >= jg.ARTICLE_BATCH_SIZE:
+            save_articles(articles)
+            articles = []
+    save_articles(articles)
+
+    # A source with a failed page is read again from where it was.
+    for source_id, state in states.items():
+        if source_id not in failed:
+            save_source_state(source_id, state)
 
     update_log.info('Finished scraping.')
 
@@ -0,0 +1,119 @@
+import zlib
+
+from dateutil import parser as date_parser
+from django.utils import timezone
+from lxml import etree
+
+from journalist.core import journalist_globals as jg
+from journalist.core.utils import update_log
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def is_sitemap(url):
+    return url.endswith(('.xml', '.xml.gz'))
+
+
+def parse_lastmod(text):
+    """ Returns the <lastmod> text as an aware datetime or None.
+    """
+    if text is None:
+        return None
+    try:
+        lastmod = date_parser.isoparse(text.strip())
+    except (ValueError, OverflowError):
+        return None
+    if timezone.is_naive(lastmod):
+        lastmod = timezone.make_aware(lastmod, timezone.utc)
+    return lastmod
+
+
+def decompress(chunks):
+    """ Yields the chunks of a sitemap. Gzipped sitemaps (sitemap.xml.gz) are
+    decompressed on the fly.
+    """
+    decompressor = None
+    for i, chunk in enumerate(chunks):
+        if i == 0 and chunk[:2] == GZIP_MAGIC:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        yield chunk
+
+
+def child_text(element, name):
+    for child in element:
+        if etree.QName(child).localname == name:
+            return child.text
+    return None
+
+
+def iter_sitemap(url, get_page, since=None, depth=0, followed=None):
+    """ Yields the (url, lastmod) entries of a sitemap without loading all of
+    it in memory. lastmod is None when the sitemap does not have it.
+    Sitemap index files are followed up to SITEMAP_MAX_DEPTH levels and the
+    urls of the child sitemaps are added to the followed list.
+    Entries (and child sitemaps) whose lastmod is not newer than since are
+    skipped.
+    Raises etree.XMLSyntaxError if the sitemap is broken.
+    """
+    response = get_page(url, stream=True)
+    if response is None:
+        return
+
+    try:
+        yield from parse_sitemap(
+            response.iter_content(chunk_size=jg.SITEMAP_CHUNK_SIZE),
+            get_page, since, depth, followed
+        )
+    finally:
+        response.close()
+
+
+def parse_sitemap(chunks, get_page, since=None, depth=0, followed=None):
+    """ Works like iter_sitemap() on a sitemap that is allready being read
+    in chunks of bytes.
+    """
+    parser = etree.XMLPullParser(
+        events=('end',),
+        tag=('{*}url', '{*}sitemap'),
+        resolve_entities=False,
+        no_network=True,
+        huge_tree=True
+    )
+    for chunk in decompress(chunks):
+        parser.feed(chunk)
+        yield from read_entries(parser, get_page, since, depth, followed)
+    parser.close()
+    yield from read_entries(parser, get_page, since, depth, followed)
+
+
+def read_entries(parser, get_page, since, depth, followed):
+    """ Yields the entries that the parser has read so far and frees them so
+    that memory stays flat.
+    """
+    for event, element in parser.read_events():
+        loc = child_text(element, 'loc')
+        lastmod = parse_lastmod(child_text(element, 'lastmod'))
+        is_index = etree.QName(element).localname == 'sitemap'
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+        if loc is None:
+            continue
+        loc = loc.strip()
+        if since is not None and lastmod is not None and lastmod <= since:
+            continue
+
+        if not is_index:
+            yield loc, lastmod
+        elif depth < jg.SITEMAP_MAX_DEPTH:
+            if followed is not None:
+                followed.append(loc)
+            yield from iter_sitemap(
+                loc, get_page, since, depth + 1, followed)
+        else:
+            update_log.warning('Skipped nested sitemap: {}'.format(loc))
@@ -0,0 +1,119 @@
+import hashlib
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+from gensim.summarization import textcleaner
+
+from journalist.core import journalist_globals as jg
+from journalist.models import TranslationMemory, GCCache as cache
+
+
+HITS_KEY = 'translation_memory_hits'
+MISSES_KEY = 'translation_memory_misses'
+STORES_SINCE_PRUNE = 0
+
+
+def normalize(text):
+    return ' '.join(text.split())
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize(text).encode('utf-8')).hexdigest()
+
+
+def split_sentences(text):
+    """ Returns the normalized sentences of the text in their order.
+    """
+    sentences = [normalize(s) for s in textcleaner.split_sentences(text)]
+    sentences = [s for s in sentences if len(s) > 0]
+    if len(sentences) == 0 and len(normalize(text)) > 0:
+        sentences = [normalize(text)]
+    return sentences
+
+
+def lookup(sentences, languages):
+    """ Returns a dict {sentence: translation} with the sentences that are
+    allready translated by any provider. Uses one query for the lookup and
+    one to mark the entries as recently used.
+    """
+    hashes = {}
+    for sentence in set(sentences):
+        hashes[text_hash(sentence)] = sentence
+
+    entries = TranslationMemory.objects.filter(
+        text_hash__in=list(hashes.keys()), languages=languages
+    ).values_list('pk', 'text_hash', 'translation')
+
+    found = {}
+    used = []
+    for pk, h, translation in entries:
+        if hashes[h] not in found:
+            found[hashes[h]] = translation
+            used.append(pk)
+
+    if len(used) > 0:
+        TranslationMemory.objects.filter(pk__in=used).update(
+            hits=F('hits') + 1, last_used=timezone.now())
+        cache.increment(HITS_KEY, len(used))
+    if len(hashes) > len(found):
+        cache.increment(MISSES_KEY, len(hashes) - len(found))
+
+    return found
+
+
+def store(translations, languages, provider):
+    """ Saves the translations, a dict {sentence: translation}, of the
+    provider. Prunes the memory every TRANSLATION_MEMORY_PRUNE_EVERY stores.
+    """
+    global STORES_SINCE_PRUNE
+
+    TranslationMemory.objects.bulk_create(
+        [
+            TranslationMemory(
+                text_hash=text_hash(sentence),
+                languages=languages,
+                provider=provider,
+                translation=translation
+            )
+            for sentence, translation in translations.items()
+            if translation is not None
+        ],
+        batch_size=500,
+        ignore_conflicts=True
+    )
+
+    STORES_SINCE_PRUNE += 1
+    if STORES_SINCE_PRUNE >= jg.TRANSLATION_MEMORY_PRUNE_EVERY:
+        STORES_SINCE_PRUNE = 0
+        prune()
+
+
+def prune():
+    """ Deletes the entries that were not used for TRANSLATION_MEMORY_TTL
+    days and then the least recently used ones above
+    TRANSLATION_MEMORY_MAX_ENTRIES.
+    """
+    TranslationMemory.objects.filter(
+        last_used__lt=timezone.now() - timedelta(
+            days=jg.TRANSLATION_MEMORY_TTL)
+    ).delete()
+
+    cutoff = TranslationMemory.objects.order_by('-last_used').values_list(
+        'last_used', flat=True)[jg.TRANSLATION_MEMORY_MAX_ENTRIES:][:1]
+    if len(cutoff) > 0:
+        TranslationMemory.objects.filter(last_used__lte=cutoff[0]).delete()
+
+
+def stats():
+    """ Returns the hits, the misses and the hit rate of the memory.
+    """
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = int(counters[HITS_KEY].value) if HITS_KEY in counters else 0
+    misses = int(counters[MISSES_KEY].value) if MISSES_KEY in counters else 0
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total > 0 else 0.0,
+    }
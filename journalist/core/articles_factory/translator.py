@@ -0,0 +1,322 @@
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+
+from ibm_watson import LanguageTranslatorV3
+from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+from ibm_cloud_sdk_core.authenticators import BearerTokenAuthenticator
+
+from journalist.models import GCCache as cache
+from journalist.models import WATSON, MYMEMORY
+from journalist.core.utils import update_log
+from journalist.core.utils.sessions import get_session
+from journalist.core.articles_factory import translation_memory
+from journalist.core import journalist_globals as jg
+
+
+# The quotas of the free plans are kept in the cache.
+WATSON_QUOTA_KEY = 'watson_characters_remaining'
+WATSON_MONTHLY_LIMIT = 998000
+MYMEMORY_QUOTA_KEY = 'mymemory_words_remaining'
+MYMEMORY_DAILY_LIMIT = 1000
+
+WATSON_TRANSLATOR = None
+WATSON_TRANSLATOR_LOCK = threading.Lock()
+
+
+def init_watson_translator():
+    if settings.WATSON_BEARER_TOKEN:
+        authenticator = BearerTokenAuthenticator(settings.WATSON_BEARER_TOKEN)
+    else:
+        authenticator = IAMAuthenticator(settings.WATSON_IAM_KEY)
+    language_translator = LanguageTranslatorV3(
+        version=settings.WATSON_VERSION,
+        authenticator=authenticator
+    )
+
+    language_translator.set_service_url(settings.WATSON_SERVICE_URL)
+    language_translator.set_http_config({'timeout': settings.WATSON_TIMEOUT})
+
+    return language_translator
+
+
+def get_watson_translator():
+    """ Returns a shared translator so that the IAM token is reused until it
+    expires instead of requesting a new one for every text.
+    """
+    global WATSON_TRANSLATOR
+
+    if WATSON_TRANSLATOR is None:
+        with WATSON_TRANSLATOR_LOCK:
+            if WATSON_TRANSLATOR is None:
+                WATSON_TRANSLATOR = init_watson_translator()
+    return WATSON_TRANSLATOR
+
+
+def split_long(sentence, max_chars):
+    """ Splits a sentence that is longer than max_chars on its spaces.
+    """
+    if len(sentence) <= max_chars:
+        return [sentence]
+
+    pieces = []
+    piece = ''
+    for word in sentence.split(' '):
+        if len(piece) > 0 and len(piece) + 1 + len(word) > max_chars:
+            pieces.append(piece)
+            piece = word
+        else:
+            piece = word if len(piece) == 0 else piece + ' ' + word
+    if len(piece) > 0:
+        pieces.append(piece)
+    return pieces
+
+
+def pack(sentences, max_chars, separator_length=1):
+    """ Packs the sentences in order into chunks (lists of sentences) whose
+    joined length is at most max_chars.
+    """
+    chunks = []
+    chunk = []
+    size = 0
+    for sentence in sentences:
+        extra = len(sentence) + (separator_length if len(chunk) > 0 else 0)
+        if len(chunk) > 0 and size + extra > max_chars:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+            extra = len(sentence)
+        chunk.append(sentence)
+        size += extra
+    if len(chunk) > 0:
+        chunks.append(chunk)
+    return chunks
+
+
+def watson_translate_sentences(sentences, languages='el-en'):
+    """ Translates the sentences using the watson API and returns a dict
+    {sentence: translation} with the ones that were translated.
+    The sentences are sent as lists of up to WATSON_MAX_REQUEST_CHARS
+    characters. A chunk that fails does not stop the rest.
+    Every chunk reserves its characters from the monthly quota before it is
+    sent, so that concurrent workers never pass the limit together.
+    """
+    if cache.remaining(
+        WATSON_QUOTA_KEY, WATSON_MONTHLY_LIMIT, jg.GCCACHE_TTL
+    ) <= 0:
+        update_log.warning('Watson reached the monthly limit.')
+        return {}
+
+    try:
+        language_translator = get_watson_translator()
+    except BaseException as err:
+        update_log.error('Error in get_watson_translator()')
+        update_log.error(err)
+        return {}
+
+    translated = {}
+    for chunk in pack(sentences, jg.WATSON_MAX_REQUEST_CHARS, 0):
+        chars_to_sent = sum(len(sentence) for sentence in chunk)
+        if not cache.reserve(
+            WATSON_QUOTA_KEY, chars_to_sent, WATSON_MONTHLY_LIMIT,
+            relativedelta(months=+1)
+        ):
+            update_log.warning('Watson reached the monthly limit.')
+            break
+
+        try:
+            translation = language_translator.translate(
+                text=chunk, model_id=languages).get_result()
+        except Exception as err:
+            update_log.error('Error in watson translate()')
+            update_log.error(err)
+            cache.refund(WATSON_QUOTA_KEY, chars_to_sent)
+            continue
+
+        for sentence, result in zip(chunk, translation['translations']):
+            translated[sentence] = result['translation']
+        # Watson may count the characters a bit differently.
+        cache.refund(
+            WATSON_QUOTA_KEY,
+            chars_to_sent - int(translation['character_count'])
+        )
+
+    translation_memory.store(translated, languages, WATSON)
+    send_quota_event(WATSON, WATSON_QUOTA_KEY, WATSON_MONTHLY_LIMIT)
+    return translated
+
+
+def send_quota_event(provider, key, limit):
+    update_log.event(
+        'quota', provider=provider, remaining=cache.remaining(key, limit),
+        limit=limit)
+
+
+def count_words(sentences):
+    return len(re.findall(r'\w+', ' '.join(sentences)))
+
+
+def mymemory_request(text, langpair):
+    params = {"q": text, "langpair": langpair}
+    session = get_session()
+    try:
+        response_object = session.post(
+            settings.MYMEMORY_URL, params, timeout=jg.HTTP_TIMEOUT)
+        response = json.loads(response_object.text)
+    except Exception as err:
+        update_log.error('Error in MyMemory request')
+        update_log.error(err)
+        return None
+
+    if response['responseStatus'] != 200:
+        update_log.warning(
+            'MyMemory responded with {}'.format(
+                response['responseStatus'])
+            )
+        return None
+    return response['responseData']['translatedText']
+
+
+def mymemory_translate_chunk(chunk, langpair):
+    """ Translates a chunk of sentences with one request. The sentences are
+    sent on separate lines.
+    Returns a dict {sentence: translation}, or None if the lines did not
+    come back one by one. Then nothing of the chunk can be trusted and its
+    sentences have to be sent one at a time.
+    """
+    if len(chunk) == 1:
+        pieces = split_long(chunk[0], jg.MYMEMORY_MAX_CHARS)
+        results = [mymemory_request(piece, langpair) for piece in pieces]
+        if None in results:
+            return {}
+        return {chunk[0]: ' '.join(results)}
+
+    result = mymemory_request("\n".join(chunk), langpair)
+    if result is None:
+        return {}
+
+    lines = [line.strip() for line in result.split("\n")]
+    if len(lines) != len(chunk) or '' in lines:
+        return None
+    return dict(zip(chunk, lines))
+
+
+def reserve_chunks(chunks):
+    """ Reserves the words of the chunks from the daily quota of MyMemory.
+    Returns the chunks that fit in it.
+    """
+    reserved = []
+    for chunk in chunks:
+        if not cache.reserve(
+            MYMEMORY_QUOTA_KEY, count_words(chunk), MYMEMORY_DAILY_LIMIT,
+            relativedelta(days=+1)
+        ):
+            update_log.warning('MyMemory reached the daily limit.')
+            break
+        reserved.append(chunk)
+    return reserved
+
+
+def mymemory_translate_sentences(sentences, languages="el-en"):
+    """ Translates the sentences using the MyMemory API and returns a dict
+    {sentence: translation} with the ones that were translated.
+    The sentences are packed into requests of up to MYMEMORY_MAX_CHARS
+    characters that are sent MYMEMORY_MAX_WORKERS at a time.
+    Every request reserves its words from the daily quota before it is sent.
+    The sentences of a chunk whose lines came back misaligned are sent
+    again one by one, and they reserve their words again.
+    """
+    if cache.remaining(
+        MYMEMORY_QUOTA_KEY, MYMEMORY_DAILY_LIMIT, jg.GCCACHE_TTL
+    ) <= 0:
+        update_log.warning('MyMemory reached the daily limit.')
+        return {}
+
+    langpair = languages.replace("-", "|")
+
+    def translate_chunk(chunk):
+        # Runs in the pool. The log entries are saved by this thread.
+        entries = []
+        with update_log.deferred(entries):
+            result = mymemory_translate_chunk(chunk, langpair)
+        return result, entries
+
+    translated = {}
+    # Only the chunks that fit in the daily limit are sent.
+    chunks = reserve_chunks(pack(sentences, jg.MYMEMORY_MAX_CHARS))
+    with ThreadPoolExecutor(max_workers=jg.MYMEMORY_MAX_WORKERS) as pool:
+        while len(chunks) > 0:
+            retries = []
+            for chunk, (result, entries) in zip(
+                chunks, pool.map(translate_chunk, chunks)
+            ):
+                update_log.save_entries(entries)
+                if result is None:
+                    # The words were sent so they stay spent.
+                    retries.extend([sentence] for sentence in chunk)
+                    continue
+                translated.update(result)
+                # Give back the words of the sentences that failed.
+                cache.refund(
+                    MYMEMORY_QUOTA_KEY,
+                    count_words([s for s in chunk if s not in result])
+                )
+            chunks = reserve_chunks(retries)
+
+    translation_memory.store(translated, languages, MYMEMORY)
+    send_quota_event(MYMEMORY, MYMEMORY_QUOTA_KEY, MYMEMORY_DAILY_LIMIT)
+    return translated
+
+
+def translate_texts(texts, languages="el-en"):
+    """ Translates and returns a list with the given texts. A text is None if
+    some of its sentences could not be translated.
+    The sentences of all the texts are looked up in the translation memory
+    at once. The rest are translated with Watson and then with MyMemory if
+    Watson failed or its quotas have been maxed out.
+    """
+    update_log.info('Translating...')
+
+    texts_sentences = [
+        translation_memory.split_sentences(text or '') for text in texts]
+
+    sentences = []
+    for text_sentences in texts_sentences:
+        for sentence in text_sentences:
+            if sentence not in sentences:
+                sentences.append(sentence)
+
+    known = translation_memory.lookup(sentences, languages)
+    memory = translation_memory.stats()
+    update_log.info(
+        '{} of {} sentences were in the translation memory '
+        '(hit rate {:.0%}).'.format(
+            len(known), len(sentences), memory['hit_rate']))
+
+    for translate in (
+        watson_translate_sentences, mymemory_translate_sentences
+    ):
+        missing = [s for s in sentences if s not in known]
+        if len(missing) == 0:
+            break
+        known.update(translate(missing, languages))
+
+    translated_texts = []
+    for text_sentences in texts_sentences:
+        if len(text_sentences) == 0 or any(
+            s not in known for s in text_sentences
+        ):
+            translated_texts.append(None)
+        else:
+            translated_texts.append(
+                "\n".join(known[s] for s in text_sentences))
+    return translated_texts
+
+
+def translate_this(text, languages="el-en"):
+    """ Translates and returns the given text or None.
+    """
+    return translate_texts([text], languages)[0]
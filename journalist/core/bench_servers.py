@@ -0,0 +1,185 @@
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from urllib.parse import urlparse, parse_qs
+
+from django.conf import settings
+
+
+FIXTURES_DIR = os.path.join(
+    settings.BASE_DIR, 'journalist', 'fixtures', 'bench')
+# The languages of the stand-in site. Every language gets its own sitemap.
+LANGUAGES = ('en', 'el')
+PARAGRAPHS_PER_ARTICLE = 8
+
+
+def read_fixture(path, name):
+    with open(os.path.join(path, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class Site:
+    """ The recorded pages of the stand-in news site. Article n of a
+    language is made of PARAGRAPHS_PER_ARTICLE paragraphs of its fixture,
+    picked with n as the seed, so every run serves the same pages.
+    """
+
+    def __init__(self, articles, path=FIXTURES_DIR):
+        self.articles = articles
+        self.page = Template(read_fixture(path, 'article.html'))
+        self.sitemap = Template(read_fixture(path, 'sitemap.xml'))
+        self.paragraphs = {
+            lang: read_fixture(
+                path, 'paragraphs_{}.txt'.format(lang)).splitlines()
+            for lang in LANGUAGES
+        }
+
+    def numbers(self, lang):
+        """ The numbers of the articles of a language.
+        """
+        index = LANGUAGES.index(lang)
+        return range(index, self.articles, len(LANGUAGES))
+
+    def lang_of(self, number):
+        return LANGUAGES[number % len(LANGUAGES)]
+
+    def article(self, number):
+        lang = self.lang_of(number)
+        paragraphs = random.Random(number).sample(
+            self.paragraphs[lang], PARAGRAPHS_PER_ARTICLE)
+        title = '{} {}'.format(
+            ' '.join(paragraphs[0].split()[:8]), number)
+        related = [
+            '<li><a href="/news/{}.html">More news</a></li>'.format(n)
+            for n in random.Random(-number).sample(
+                range(self.articles), min(5, self.articles))
+        ]
+        return self.page.substitute(
+            lang=lang, title=title, number=number,
+            body='\n'.join('<p>{}</p>'.format(p) for p in paragraphs),
+            related='\n'.join(related)
+        )
+
+    def sitemap_of(self, base_url, lang):
+        urls = [
+            '<url><loc>{}/news/{}.html</loc>'
+            '<lastmod>2020-09-21T10:00:00+03:00</lastmod></url>'.format(
+                base_url, n)
+            for n in self.numbers(lang)
+        ]
+        return self.sitemap.substitute(urls='\n'.join(urls))
+
+
+def make_handler(site, latency):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # The headers and the body are written separately.
+        disable_nagle_algorithm = True
+
+        def send(self, status, body=b'', content_type='text/html'):
+            if latency:
+                time.sleep(latency)
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, data):
+            self.send(200, json.dumps(data), 'application/json')
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            base_url = 'http://{}'.format(self.headers['Host'])
+            if path.startswith('/sitemap_') and path.endswith('.xml'):
+                lang = path[len('/sitemap_'):-len('.xml')]
+                if lang in LANGUAGES:
+                    self.send(
+                        200, site.sitemap_of(base_url, lang),
+                        'application/xml')
+                    return
+            elif path.startswith('/news/') and path.endswith('.html'):
+                number = path[len('/news/'):-len('.html')]
+                if number.isdigit() and int(number) < site.articles:
+                    self.send(200, site.article(int(number)))
+                    return
+            self.send(404)
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            body = self.read_body()
+            if path == '/mymemory/get':
+                # The text comes back as it is, line by line.
+                params = parse_qs(body.decode('utf-8'))
+                params.update(parse_qs(urlparse(self.path).query))
+                self.send_json({
+                    'responseStatus': 200,
+                    'responseData': {
+                        'translatedText': params.get('q', [''])[0]},
+                })
+            elif path == '/watson/v3/translate':
+                texts = json.loads(body.decode('utf-8'))['text']
+                self.send_json({
+                    'translations': [{'translation': t} for t in texts],
+                    'word_count': sum(len(t.split()) for t in texts),
+                    'character_count': sum(len(t) for t in texts),
+                })
+            else:
+                self.send(404)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class StandInServers:
+    """ Serves the stand-in news site and the stand-in MyMemory and Watson
+    endpoints from one local port in a thread. latency is added to every
+    response, in seconds.
+    Use it as a context manager.
+    """
+
+    def __init__(self, articles, latency=0.0, path=FIXTURES_DIR):
+        self.site = Site(articles, path)
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), make_handler(self.site, latency))
+        self.server.daemon_threads = True
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def sitemap_url(self, lang):
+        return '{}/sitemap_{}.xml'.format(self.base_url, lang)
+
+    def settings(self):
+        """ The settings that send the scraper and the translators to the
+        stand-in servers. Watson gets a fixed bearer token so that no IAM
+        token is requested.
+        """
+        return {
+            'SCRAPER_PROXIES': {},
+            'MYMEMORY_URL': self.base_url + '/mymemory/get',
+            'WATSON_SERVICE_URL': self.base_url + '/watson',
+            'WATSON_BEARER_TOKEN': 'bench',
+            'WATSON_TIMEOUT': 10,
+        }
@@ -0,0 +1,388 @@
+import gzip
+import os
+import resource
+import shutil
+import signal
+import tempfile
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+from django.db import connection
+from django.test.utils import override_settings
+
+from journalist.core import journalist_globals as jg
+from journalist.core import bench_servers, search
+from journalist.core.articles_factory import extractor, html_store, links
+from journalist.core.articles_factory import (
+    article_editor, fetcher, scraper, translator
+)
+from journalist.core.utils import sessions, update_log
+from journalist.models import StoredPage, Topic, Source, Article, NEW
+
+
+def percentile(values, q):
+    """ Returns the q-th percentile (0-100) of the values with the nearest
+    rank method.
+    """
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, int(round(q / 100 * len(values))) - 1))
+    return values[rank]
+
+
+def timings(name, seconds, wall=None, **extra):
+    """ Returns a row of results for a list of per item timings.
+    wall is the time the items took together when they ran concurrently.
+    """
+    total = sum(seconds) if wall is None else wall
+    row = {
+        'name': name,
+        'items': len(seconds),
+        'seconds': round(total, 3),
+        'per_second': round(len(seconds) / total, 1) if total > 0 else 0.0,
+        'p50_ms': round(percentile(seconds, 50) * 1000, 2),
+        'p95_ms': round(percentile(seconds, 95) * 1000, 2),
+    }
+    row.update(extra)
+    return row
+
+
+def stored_pages(limit=None, with_urls=False):
+    """ Yields the html of the newest pages of the HTML store, or (url, html)
+    tuples with with_urls=True.
+    """
+    hashes = StoredPage.objects.order_by('-fetched_on').values_list(
+        'sha256', flat=True).distinct()
+    if limit is not None:
+        hashes = hashes[:limit]
+    urls = {}
+    if with_urls:
+        urls = dict(StoredPage.objects.filter(
+            sha256__in=list(hashes)).values_list('sha256', 'url'))
+    for sha256 in hashes:
+        html = html_store.get(sha256)
+        if html is not None:
+            yield (urls[sha256], html) if with_urls else html
+
+
+def directory_pages(path, limit=None):
+    """ Yields the html of the .html and .html.gz files of a directory.
+    """
+    names = sorted(
+        name for name in os.listdir(path)
+        if name.endswith(('.html', '.html.gz'))
+    )
+    if limit is not None:
+        names = names[:limit]
+    for name in names:
+        with open(os.path.join(path, name), 'rb') as f:
+            html = f.read()
+        if name.endswith('.gz'):
+            html = gzip.decompress(html)
+        yield html
+
+
+def bench_extract(pages, engines=extractor.ENGINES,
+                  min_words_count=jg.MIN_WORDS_TO_SCRAPE):
+    """ Extracts every page with every engine and returns a row of results
+    for each one, plus one for the visible text pre-check.
+    accepted is the number of pages that passed min_words_count.
+    """
+    pages = list(pages)
+    rows = []
+
+    seconds = []
+    skipped = 0
+    for html in pages:
+        start = time.perf_counter()
+        words = extractor.visible_words(html)
+        seconds.append(time.perf_counter() - start)
+        skipped += int(words < min_words_count)
+    rows.append(timings('pre-check', seconds, skipped=skipped))
+
+    for engine in engines:
+        seconds = []
+        accepted = 0
+        failed = 0
+        for html in pages:
+            start = time.perf_counter()
+            try:
+                article = extractor.extract(html, engine)
+            except Exception:
+                article = None
+                failed += 1
+            seconds.append(time.perf_counter() - start)
+            if article is not None and extractor.has_enough_words(
+                article.text, min_words_count
+            ):
+                accepted += 1
+        rows.append(timings(
+            engine, seconds, accepted=accepted, failed=failed))
+
+    return rows
+
+
+def soup_links(html, url_filter):
+    """ The links of a page the way the scraper found them before
+    links.extract_links. Relative links are not followed.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    return [
+        link['href'] for link in soup.find_all('a', href=True)
+        if link['href'].startswith(url_filter) and link['href'] > url_filter
+    ]
+
+
+def lxml_links(html, url):
+    return links.filter_links(links.extract_links(html, url), url_filter(url))
+
+
+def url_filter(url):
+    """ The links of the same site as the url are kept.
+    """
+    parts = urlparse(url)
+    return '{}://{}/'.format(parts.scheme, parts.netloc)
+
+
+def bench_links(pages):
+    """ Finds the links of every (url, html) page with the old BeautifulSoup
+    code and with links.extract_links. Returns a row of results for each.
+    links is the number of links that passed the url_filter.
+    """
+    pages = list(pages)
+    rows = []
+    methods = [
+        ('soup', lambda html, url: soup_links(html, url_filter(url))),
+        ('lxml', lxml_links),
+    ]
+    for name, method in methods:
+        seconds = []
+        found = 0
+        for url, html in pages:
+            start = time.perf_counter()
+            found += len(method(html, url))
+            seconds.append(time.perf_counter() - start)
+        rows.append(timings(name, seconds, links=found))
+    return rows
+
+
+def peak_rss_mb():
+    """ The peak resident memory of this process so far, in MB.
+    """
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+@contextmanager
+def patched(module, **values):
+    """ Sets the attributes of a module and puts the old values back.
+    """
+    old = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield module
+    finally:
+        for name, value in old.items():
+            setattr(module, name, value)
+
+
+class BenchmarkTimeout(Exception):
+    pass
+
+
+@contextmanager
+def time_limit(seconds):
+    """ Raises BenchmarkTimeout if the block runs for longer than seconds.
+    The alarm stops the main thread even in a blocking call. The threads
+    that are left finish with the timeouts of their requests.
+    """
+    def expired(signum, frame):
+        raise BenchmarkTimeout(
+            'The benchmark did not finish in {} seconds.'.format(seconds))
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+@contextmanager
+def test_database():
+    """ Runs the block on a new migrated test database so that the benchmark
+    never touches the real articles.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def bench_pipeline(articles, latency=0.0, host_rate=1000.0,
+                   path=bench_servers.FIXTURES_DIR, timeout=600):
+    """ Scrapes, parses and edits the articles of the stand-in site with the
+    stand-in translators (see bench_servers), on a test database and a
+    temporary HTML store. Nothing goes to the network.
+    The hosts get host_rate requests per second and the translation quotas
+    are lifted so that only the code is measured.
+    Raises BenchmarkTimeout if the run takes longer than timeout seconds.
+    Returns a row of results for every stage and one for the whole run.
+    """
+    html_root = tempfile.mkdtemp()
+    try:
+        with test_database(), bench_servers.StandInServers(
+            articles, latency, path
+        ) as servers, override_settings(
+            HTML_STORE_ROOT=html_root, **servers.settings()
+        ), patched(
+            jg, HOST_RATE=host_rate, HOST_MAX_RATE=host_rate,
+            HOST_BURST=jg.FETCH_MAX_WORKERS
+        ), patched(
+            translator, WATSON_TRANSLATOR=None,
+            WATSON_MONTHLY_LIMIT=10 ** 12, MYMEMORY_DAILY_LIMIT=10 ** 12
+        ):
+            sessions.close_session()
+            try:
+                with update_log.buffered(), time_limit(timeout):
+                    return run_pipeline(servers)
+            finally:
+                sessions.close_session()
+    finally:
+        shutil.rmtree(html_root, ignore_errors=True)
+
+
+def run_pipeline(servers):
+    """ The stages of bench_pipeline(). Every stage runs on the output of
+    the one before it, so that each one is timed on its own.
+    The database writes are timed per batch and shared by its articles.
+    """
+    topic = Topic.objects.create(title='Benchmark')
+    for lang in bench_servers.LANGUAGES:
+        Source.objects.create(
+            topic=topic, root_url=servers.sitemap_url(lang),
+            url_filter=servers.base_url + '/news/', language=lang)
+    rows = []
+    pipeline_start = time.perf_counter()
+
+    # Discovery. The time until every url is yielded.
+    seconds = []
+    entries = []
+    for topic_name, source in scraper.iter_sources():
+        start = time.perf_counter()
+        for url in scraper.iter_urls_from_source(source):
+            seconds.append(time.perf_counter() - start)
+            entries.append((url, source['language'], source['topic_id']))
+            start = time.perf_counter()
+    rows.append(timings('discovery', seconds, peak_rss_mb=peak_rss_mb()))
+
+    # Fetch. The pages are downloaded concurrently.
+    requests = []
+
+    def timed_get_page(url, **options):
+        start = time.perf_counter()
+        response = scraper.get_page(url, **options)
+        if not url.endswith('/robots.txt'):
+            requests.append(time.perf_counter() - start)
+        return response
+
+    pages = []
+    start = time.perf_counter()
+    for entry, response, failure in fetcher.fetch_pages(
+        entries, timed_get_page
+    ):
+        if response is not None:
+            pages.append((entry, response.content))
+    rows.append(timings(
+        'fetch', requests, wall=time.perf_counter() - start,
+        failed=len(entries) - len(pages), peak_rss_mb=peak_rss_mb()))
+
+    # Parse. The extraction and the HTML store.
+    seconds = []
+    new = []
+    for (url, lang, topic_id), html in pages:
+        start = time.perf_counter()
+        article = scraper.build_article(url, lang, topic_id, html)
+        seconds.append(time.perf_counter() - start)
+        if article is not None:
+            new.append(article)
+    rows.append(timings(
+        'parse', seconds, articles=len(new), peak_rss_mb=peak_rss_mb()))
+
+    # The inserts of the new articles and their duplicates check.
+    seconds = []
+    for i in range(0, len(new), jg.ARTICLE_BATCH_SIZE):
+        batch = new[i:i + jg.ARTICLE_BATCH_SIZE]
+        start = time.perf_counter()
+        scraper.save_articles(batch)
+        seconds.extend(
+            [(time.perf_counter() - start) / len(batch)] * len(batch))
+    rows.append(timings('db_insert', seconds, peak_rss_mb=peak_rss_mb()))
+
+    to_edit = list(Article.objects.filter(status=NEW).order_by('pk'))
+
+    seconds = []
+    summarized = []
+    for article in to_edit:
+        summary, duration = article_editor.timed_summarize(
+            article.original_text, jg.SAMMARIZE_RATIO)
+        seconds.append(duration)
+        if summary is not None:
+            summarized.append((article, summary))
+    rows.append(timings(
+        'summarize', seconds, failed=len(to_edit) - len(summarized),
+        peak_rss_mb=peak_rss_mb()))
+
+    seconds = []
+    translated = []
+    for article, summary in summarized:
+        start = time.perf_counter()
+        result = article_editor.translate_article(article, summary)
+        seconds.append(time.perf_counter() - start)
+        if result is not None:
+            translated.append((article, result[0], result[1]))
+    rows.append(timings(
+        'translate', seconds, failed=len(summarized) - len(translated),
+        peak_rss_mb=peak_rss_mb()))
+
+    seconds = []
+    edited = []
+    for article, title, summary in translated:
+        words, duration = article_editor.timed_keywords(summary)
+        seconds.append(duration)
+        if words is not None:
+            article_editor.set_edited_fields(article, title, summary, words)
+            edited.append(article)
+    rows.append(timings(
+        'keywords', seconds, failed=len(translated) - len(edited),
+        peak_rss_mb=peak_rss_mb()))
+
+    # The updates of the edited articles and their keywords.
+    seconds = []
+    for i in range(0, len(edited), jg.EDIT_BATCH_SIZE):
+        batch = edited[i:i + jg.EDIT_BATCH_SIZE]
+        start = time.perf_counter()
+        Article.objects.bulk_update(
+            batch, ['title', 'summary', 'keywords', 'status'])
+        search.set_keywords(batch)
+        seconds.extend(
+            [(time.perf_counter() - start) / len(batch)] * len(batch))
+    rows.append(timings('db_update', seconds, peak_rss_mb=peak_rss_mb()))
+
+    total = time.perf_counter() - pipeline_start
+    rows.append({
+        'name': 'pipeline',
+        'items': len(edited),
+        'seconds': round(total, 3),
+        'per_second': round(len(edited) / total, 1) if total > 0 else 0.0,
+        'urls': len(entries),
+        'peak_rss_mb': peak_rss_mb(),
+    })
+    return rows
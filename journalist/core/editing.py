@@ -0,0 +1,124 @@
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from journalist.core import journalist_globals as jg
+from journalist.core import search
+from journalist.core.articles_factory import article_editor
+from journalist.core.utils import update_log
+from journalist.models import Article, NEW, EDITING, READY
+
+
+def claim_articles(limit):
+    """ Marks up to limit NEW articles as EDITING and returns them.
+    Every article is claimed with a conditional update so that two workers
+    never edit the same article.
+    Articles that failed EDIT_MAX_ATTEMPTS times are left alone until they
+    are reset with manage.py reedit_articles.
+    Duplicates wait until their original is READY. If the original could
+    not be edited they are edited themselves.
+    """
+    ready_to_edit = (
+        Q(duplicate_of__isnull=True) |
+        Q(duplicate_of__status=READY) |
+        Q(
+            duplicate_of__status=NEW,
+            duplicate_of__edit_attempts__gte=jg.EDIT_MAX_ATTEMPTS
+        )
+    )
+    ids = list(
+        Article.objects.filter(
+            ready_to_edit, status=NEW, edit_attempts__lt=jg.EDIT_MAX_ATTEMPTS
+        ).order_by('pk').values_list('pk', flat=True)[:limit]
+    )
+
+    claimed = []
+    for pk in ids:
+        updated = Article.objects.filter(pk=pk, status=NEW).update(
+            status=EDITING,
+            edit_attempts=F('edit_attempts') + 1,
+            date_modified=timezone.now()
+        )
+        if updated == 1:
+            claimed.append(pk)
+
+    return list(Article.objects.filter(pk__in=claimed).order_by('pk'))
+
+
+def copy_from_originals(articles):
+    """ Copies the edited fields of the READY originals to their duplicates
+    so that they are not summarized and translated again.
+    Returns the articles that still have to be edited.
+    """
+    originals = Article.objects.in_bulk(
+        [a.duplicate_of_id for a in articles if a.duplicate_of_id])
+    copied = []
+    to_edit = []
+    for article in articles:
+        original = originals.get(article.duplicate_of_id)
+        if original is None or original.status != READY:
+            to_edit.append(article)
+            continue
+        article.title = original.title
+        article.summary = original.summary
+        article.keywords = original.keywords
+        article.status = READY
+        article.date_modified = timezone.now()
+        copied.append(article)
+
+    Article.objects.bulk_update(
+        copied, ['title', 'summary', 'keywords', 'status', 'date_modified'])
+    search.set_keywords(copied)
+    if len(copied) > 0:
+        update_log.info('Copied {} duplicate articles.'.format(len(copied)))
+    return to_edit
+
+
+def run_edit_batch(articles):
+    """ Edits the claimed articles. The ones that could not be edited go back
+    to NEW so that they are tried again later.
+    """
+    edited = 0
+    try:
+        to_edit = copy_from_originals(articles)
+        edited = len(articles) - len(to_edit)
+        if len(to_edit) > 0:
+            edited += len(article_editor.edit_articles(to_edit))
+    finally:
+        Article.objects.filter(
+            pk__in=[article.pk for article in articles], status=EDITING
+        ).update(status=NEW, date_modified=timezone.now())
+
+    update_log.event(
+        'edit', edited=edited, failed=len(articles) - edited,
+        waiting=Article.objects.filter(status=NEW).count())
+    return edited
+
+
+def requeue_stale_articles():
+    """ Gives back the articles of editors that died while editing them.
+    """
+    Article.objects.filter(
+        status=EDITING,
+        date_modified__lt=timezone.now() - timedelta(
+            seconds=jg.TASK_TIMEOUT)
+    ).update(status=NEW, date_modified=timezone.now())
+
+
+def edit_new_articles():
+    """ Edits every NEW article in batches of EDIT_BATCH_SIZE. The batches
+    share one process pool.
+    """
+    edited = 0
+    try:
+        while True:
+            articles = claim_articles(jg.EDIT_BATCH_SIZE)
+            if len(articles) == 0:
+                break
+            edited += run_edit_batch(articles)
+    finally:
+        article_editor.close_pool()
+
+    update_log.info('Edited {} articles.'.format(edited))
+    return edited
@@ -0,0 +1,45 @@
+import json
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from journalist.core import journalist_globals as jg
+from journalist.models import LogEntry
+
+
+def format_event(entry):
+    """ Returns a LogEntry as a Server-Sent Event. Its pk is the id that the
+    browser sends back in Last-Event-ID when it reconnects.
+    """
+    return 'id: {}\ndata: {}\n\n'.format(
+        entry.pk, json.dumps(entry.to_dict(), cls=DjangoJSONEncoder))
+
+
+def stream(cursor=None):
+    """ Yields the entries that come after the cursor as Server-Sent Events
+    as soon as they are added.
+    The stream ends after EVENTS_STREAM_SECONDS so that it does not hold a
+    server thread for ever. The browser reconnects by itself and goes on
+    from the last event it got.
+    """
+    yield 'retry: {}\n\n'.format(jg.EVENTS_RETRY_MS)
+
+    deadline = time.monotonic() + jg.EVENTS_STREAM_SECONDS
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline:
+        entries = LogEntry.since(cursor, jg.LOG_PAGE_SIZE)
+        for entry in entries:
+            yield format_event(entry)
+        if len(entries) > 0:
+            cursor = entries[-1].pk
+            last_sent = time.monotonic()
+            continue
+        # The first read without a cursor only sends the last entries.
+        if cursor is None:
+            cursor = 0
+
+        if time.monotonic() - last_sent >= jg.EVENTS_KEEPALIVE_SECONDS:
+            # A comment keeps proxies from closing an idle connection.
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+        time.sleep(jg.EVENTS_POLL_SECONDS)
@@ -0,0 +1,584 @@
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from journalist.core import journalist_globals as jg
+from journalist.core import editing, recommend
+from journalist.core.articles_factory import scraper, fetcher, politeness
+from journalist.core.articles_factory import article_editor, charsets
+from journalist.core.utils import update_log
+from journalist.core.utils.iterables import batches
+from journalist.models import Article, Job, Task, Source, NEW, EDITING
+from journalist.models import SCRAPE, DISCOVER, FETCH, FETCHED, PARSED
+from journalist.models import QUEUED, RUNNING, DONE, FAILED, CANCELLED
+
+
+# The workers can run one or both of the stages.
+SCRAPE_STAGE = 'scrape'
+EDIT_STAGE = 'edit'
+STAGES = (SCRAPE_STAGE, EDIT_STAGE)
+
+# The time.monotonic() of the last heartbeat of this process.
+LAST_HEARTBEAT = 0.0
+
+
+def worker_name():
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+
+def enqueue_scrape():
+    """ Queues a new scraping run and returns its job.
+    Returns None if a scraping run is allready queued or running.
+    """
+    try:
+        with transaction.atomic():
+            job = Job.objects.create(kind=SCRAPE)
+    except IntegrityError:
+        return None
+
+    update_log.info('Queued scraping job #{}.'.format(job.pk))
+    send_job_event(job.pk)
+    return job
+
+
+def get_active_job(kind=SCRAPE):
+    return Job.objects.filter(
+        kind=kind, status__in=[QUEUED, RUNNING]).first()
+
+
+def cancel_job(pk):
+    """ Cancels a queued or running job. The tasks that are allready running
+    are allowed to finish. Returns False if the job is not active.
+    """
+    cancelled = Job.objects.filter(
+        pk=pk, status__in=[QUEUED, RUNNING]
+    ).update(status=CANCELLED, date_finished=timezone.now())
+
+    if cancelled == 0:
+        return False
+
+    Task.objects.filter(job_id=pk, status=QUEUED).update(
+        status=CANCELLED, date_modified=timezone.now())
+    update_log.warning('Cancelled job #{}.'.format(pk))
+    send_job_event(pk)
+    return True
+
+
+def is_cancelled(pk):
+    return Job.objects.filter(pk=pk, status=CANCELLED).exists()
+
+
+def job_to_dict(job):
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.get_status_display(),
+        'finished': job.status not in (QUEUED, RUNNING),
+        'discovery_done': job.discovery_done,
+        'tasks_total': job.tasks_total,
+        'tasks_done': job.tasks_done,
+        'tasks_failed': job.tasks_failed,
+        'articles_saved': job.articles_saved,
+        'error': job.error,
+        'date_created': job.date_created,
+        'date_started': job.date_started,
+        'date_finished': job.date_finished,
+    }
+
+
+def send_job_event(pk):
+    """ Sends the progress of a job to the dashboard.
+    """
+    job = Job.objects.filter(pk=pk).first()
+    if job is not None:
+        update_log.event(
+            'job',
+            job=job_to_dict(job),
+            articles_to_edit=Article.objects.filter(
+                status__in=[NEW, EDITING]).count()
+        )
+
+
+def claim_job(worker):
+    """ Marks the oldest queued job as running by this worker and returns it.
+    """
+    job = Job.objects.filter(status=QUEUED).order_by('pk').first()
+    if job is None:
+        return None
+
+    claimed = Job.objects.filter(pk=job.pk, status=QUEUED).update(
+        status=RUNNING, worker=worker, date_started=timezone.now())
+    if claimed == 0:
+        # Another worker was faster.
+        return None
+
+    job.refresh_from_db()
+    send_job_event(job.pk)
+    return job
+
+
+def claim_tasks(worker, kind, limit):
+    """ Marks up to limit queued tasks of the running jobs as running by this
+    worker and returns them. The conditional update makes sure that every
+    task is claimed by one worker only.
+    """
+    ready = Q(not_before__isnull=True) | Q(not_before__lte=timezone.now())
+    ids = list(
+        Task.objects.filter(
+            kind=kind, status=QUEUED, job__status=RUNNING
+        ).filter(ready).order_by('pk').values_list('pk', flat=True)[:limit]
+    )
+    if len(ids) == 0:
+        return []
+
+    Task.objects.filter(pk__in=ids, status=QUEUED).update(
+        status=RUNNING,
+        worker=worker,
+        attempts=F('attempts') + 1,
+        date_modified=timezone.now()
+    )
+    return list(
+        Task.objects.filter(pk__in=ids, status=RUNNING, worker=worker))
+
+
+def heartbeat(worker):
+    """ Tells the other workers that the running tasks of this worker are
+    still alive, by refreshing their date_modified at most every
+    TASK_HEARTBEAT seconds. Otherwise requeue_stale_tasks() would queue a
+    task that runs for long again.
+    """
+    global LAST_HEARTBEAT
+
+    now = time.monotonic()
+    if now - LAST_HEARTBEAT < jg.TASK_HEARTBEAT:
+        return
+    LAST_HEARTBEAT = now
+    Task.objects.filter(worker=worker, status=RUNNING).update(
+        date_modified=timezone.now())
+
+
+def held_by(worker, tasks):
+    """ Returns the tasks that are still running by the worker. A task that
+    was queued again while it ran may belong to another worker now.
+    """
+    held = set(Task.objects.filter(
+        pk__in=[task.pk for task in tasks], worker=worker, status=RUNNING
+    ).values_list('pk', flat=True))
+    return [task for task in tasks if task.pk in held]
+
+
+def finish_tasks(results, worker=None):
+    """ Sets the final status and state of a batch of tasks
+    [(task, status, state, saved)] and updates the counters of their jobs,
+    with one query per status and state and one per job.
+    If worker is given only the tasks that it still holds are finished.
+    """
+    tasks = Task.objects.all()
+    if worker is not None:
+        held = {task.pk for task in held_by(
+            worker, [task for task, status, state, saved in results])}
+        results = [result for result in results if result[0].pk in held]
+        tasks = tasks.filter(worker=worker, status=RUNNING)
+
+    by_status = {}
+    counters = {}
+    for task, status, state, saved in results:
+        by_status.setdefault((status, state), []).append(task.pk)
+        done, failed, saved_total = counters.get(task.job_id, (0, 0, 0))
+        counters[task.job_id] = (
+            done + int(status == DONE),
+            failed + int(status == FAILED),
+            saved_total + saved
+        )
+
+    for (status, state), pks in by_status.items():
+        tasks.filter(pk__in=pks).update(
+            status=status, state=state, date_modified=timezone.now())
+    for job_id, (done, failed, saved) in counters.items():
+        Job.objects.filter(pk=job_id).update(
+            tasks_done=F('tasks_done') + done,
+            tasks_failed=F('tasks_failed') + failed,
+            articles_saved=F('articles_saved') + saved
+        )
+        send_job_event(job_id)
+
+
+def run_discovery(job):
+    """ Adds a discover task for the root page of every active source. The
+    workers read them and add the fetch tasks.
+    """
+    update_log.info('Testing connection.')
+    scraper.test_connection()
+
+    sources = Source.objects.filter(active=True, topic__active=True)
+    tasks = [
+        Task(
+            job=job,
+            kind=DISCOVER,
+            url=source.root_url,
+            language=source.language,
+            topic_id=source.topic_id,
+            source=source
+        )
+        for source in sources
+    ]
+    Task.objects.bulk_create(tasks, batch_size=500, ignore_conflicts=True)
+    count_tasks(job.pk)
+    Job.objects.filter(pk=job.pk, status=RUNNING).update(
+        discovery_done=True)
+    update_log.info('Job #{}: {} sources to check.'.format(
+        job.pk, len(tasks)))
+    send_job_event(job.pk)
+
+    return None
+
+
+def count_tasks(pk):
+    """ Sets the tasks_total of a job to the number of its tasks.
+    """
+    Job.objects.filter(pk=pk).update(tasks_total=Subquery(
+        Task.objects.filter(job=OuterRef('pk')).values('job').annotate(
+            total=Count('pk')).values('total')
+    ))
+
+
+def add_fetch_tasks(task, urls):
+    """ Adds a fetch task for every url (from the source of the discover
+    task) that is not an article yet and that no other source of the job
+    has added. Returns the number of the new tasks.
+    """
+    urls = list(urls)
+    added = 0
+    for i in range(0, len(urls), Article.BATCH_SIZE):
+        batch = Article.filter_new(urls[i:i + Article.BATCH_SIZE])
+        existing = set(Task.objects.filter(
+            job_id=task.job_id, kind=FETCH, url__in=batch
+        ).values_list('url', flat=True))
+        Task.objects.bulk_create(
+            [
+                Task(
+                    job_id=task.job_id,
+                    kind=FETCH,
+                    url=url,
+                    language=task.language,
+                    topic_id=task.topic_id,
+                    source_id=task.source_id
+                )
+                for url in batch if url not in existing
+            ],
+            batch_size=Article.BATCH_SIZE,
+            ignore_conflicts=True
+        )
+        added += len(batch) - len(existing)
+    return added
+
+
+def discovered_tasks(task, worker):
+    """ Reads the root page of the source of a discover task and yields
+    fetch tasks as soon as its urls are found. Every URL_BATCH_SIZE urls are
+    added to the frontier and then as many queued fetch tasks are claimed by
+    this worker. The rest of the workers can claim the others.
+    The discover task is finished when the source has been read. What it
+    read from the source is kept in its source_state until the job is done.
+    """
+    source = Source.objects.filter(pk=task.source_id).values().first()
+    if source is None:
+        finish_tasks([(task, FAILED, FAILED, 0)], worker)
+        return
+
+    added = 0
+    state = {}
+    try:
+        for batch in batches(
+            scraper.iter_urls_from_source(source, state), jg.URL_BATCH_SIZE
+        ):
+            added += add_fetch_tasks(task, batch)
+            count_tasks(task.job_id)
+            heartbeat(worker)
+            yield from claim_tasks(worker, FETCH, len(batch))
+    except GeneratorExit:
+        # The fetching stopped because the job was cancelled.
+        finish_tasks([(task, CANCELLED, task.state, 0)], worker)
+        raise
+    except Exception as err:
+        update_log.error('Error in iter_urls_from_source()')
+        update_log.error(err)
+        finish_tasks([(task, FAILED, FAILED, 0)], worker)
+        return
+
+    update_log.info('Fount {} new URLs to scrape in: {}'.format(
+        added, source['root_url']))
+    Task.objects.filter(pk=task.pk).update(source_state=state)
+    finish_tasks([(task, DONE, PARSED, 0)], worker)
+
+
+def run_discover_task(task, worker):
+    """ Discovers the urls of the source of a discover task and fetches them
+    at the same time.
+    """
+    tasks = discovered_tasks(task, worker)
+    try:
+        run_fetch_tasks(tasks, worker)
+    finally:
+        tasks.close()
+
+
+def save_fetched(fetched, worker):
+    """ Saves the articles of a batch of fetched tasks [(task, article)] and
+    finishes the tasks.
+    """
+    parsed = [article for task, article in fetched if article is not None]
+    saved = scraper.save_articles(parsed)
+    if len(fetched) > 0:
+        update_log.event(
+            'fetch', pages=len(fetched), parsed=len(parsed),
+            saved=len(saved))
+    finish_tasks([
+        (
+            task, DONE, FETCHED if article is None else PARSED,
+            int(article is not None and article.source in saved)
+        )
+        for task, article in fetched
+    ], worker)
+
+
+def retry_tasks(retries, worker):
+    """ Queues again a batch of failed tasks [(task, failure)] of the worker
+    to be tried after a delay that grows with every attempt.
+    The tasks that were deferred were never tried so their attempt does not
+    count.
+    """
+    held = {task.pk for task in held_by(
+        worker, [task for task, failure in retries])}
+    retries = [retry for retry in retries if retry[0].pk in held]
+    now = timezone.now()
+    for task, (status, retry_after) in retries:
+        if status == politeness.DEFERRED:
+            task.attempts -= 1
+        task.status = QUEUED
+        task.worker = None
+        task.not_before = now + timedelta(seconds=politeness.retry_delay(
+            task.attempts, retry_after))
+        task.date_modified = now
+    Task.objects.bulk_update(
+        [task for task, failure in retries],
+        ['status', 'worker', 'attempts', 'not_before', 'date_modified'],
+        batch_size=500
+    )
+    if len(retries) > 0:
+        update_log.warning('{} pages will be tried again later.'.format(
+            len(retries)))
+
+
+def run_fetch_tasks(tasks, worker):
+    """ Downloads the pages of the fetch tasks (a list or a generator) of the
+    worker concurrently and parses them as they arrive. The articles are
+    saved in batches of ARTICLE_BATCH_SIZE. The new articles are edited by
+    the edit stage.
+    Pages that failed with a temporary error are tried again later, up to
+    TASK_MAX_ATTEMPTS times.
+    """
+    claimed = []
+
+    def entries():
+        for task in tasks:
+            claimed.append(task)
+            yield task.url, task
+
+    finished = set()
+    fetched = []
+    failed = []
+    retries = []
+
+    pages = fetcher.fetch_pages(entries(), scraper.get_page)
+    for (url, task), response, failure in pages:
+        if is_cancelled(task.job_id):
+            break
+
+        heartbeat(worker)
+        finished.add(task.pk)
+        if response is None:
+            if politeness.should_retry(failure[0]) and (
+                task.attempts < jg.TASK_MAX_ATTEMPTS or
+                failure[0] == politeness.DEFERRED
+            ):
+                retries.append((task, failure))
+            else:
+                failed.append((task, FAILED, FAILED, 0))
+            continue
+
+        fetched.append((task, scraper.build_article(
+            url, task.language, task.topic_id, response.content,
+            charsets.http_charset(response.headers)
+        )))
+        if len(fetched) >= jg.ARTICLE_BATCH_SIZE:
+            save_fetched(fetched, worker)
+            fetched = []
+
+    pages.close()
+    save_fetched(fetched, worker)
+    finish_tasks(failed, worker)
+    retry_tasks(retries, worker)
+
+    # Only left over when the job got cancelled.
+    Task.objects.filter(
+        pk__in=[task.pk for task in claimed if task.pk not in finished],
+        worker=worker, status=RUNNING
+    ).update(status=CANCELLED, date_modified=timezone.now())
+
+
+def save_source_states(pk):
+    """ Saves the state of the sources that a done job read. A source with
+    a url that was not fetched keeps its old state, so that the next job
+    finds the url again.
+    """
+    unfetched = Task.objects.filter(
+        job_id=pk, kind=FETCH, source=OuterRef('source')
+    ).exclude(status=DONE)
+    for source_id, state in Task.objects.filter(
+        job_id=pk, kind=DISCOVER, status=DONE, source__isnull=False,
+        source_state__isnull=False
+    ).filter(~Exists(unfetched)).values_list('source_id', 'source_state'):
+        scraper.save_source_state(source_id, state)
+
+
+def finish_jobs():
+    """ Marks the running jobs that have no work left as done.
+    """
+    busy = Task.objects.filter(
+        job=OuterRef('pk'), status__in=[QUEUED, RUNNING])
+    finished = Job.objects.filter(
+        status=RUNNING, discovery_done=True
+    ).filter(~Exists(busy)).values_list('pk', flat=True)
+
+    for pk in list(finished):
+        done = Job.objects.filter(pk=pk, status=RUNNING).update(
+            status=DONE, date_finished=timezone.now())
+        if done == 1:
+            save_source_states(pk)
+            update_log.info('Finished job #{}.'.format(pk))
+            send_job_event(pk)
+
+
+def requeue_tasks(tasks):
+    """ Gives back to the queue the running tasks of the queryset. Tasks that
+    were tried TASK_MAX_ATTEMPTS times fail instead.
+    """
+    tasks.filter(attempts__lt=jg.TASK_MAX_ATTEMPTS).update(
+        status=QUEUED, worker=None, date_modified=timezone.now())
+    finish_tasks([(task, FAILED, FAILED, 0) for task in tasks])
+
+
+def requeue_stale_tasks():
+    """ Gives back to the queue the tasks of workers that died while running
+    them.
+    """
+    requeue_tasks(Task.objects.filter(
+        status=RUNNING,
+        date_modified__lt=timezone.now() - timedelta(
+            seconds=jg.TASK_TIMEOUT)
+    ))
+
+
+def release_tasks(worker):
+    """ Gives back to the queue the tasks that this worker claimed.
+    """
+    requeue_tasks(Task.objects.filter(worker=worker, status=RUNNING))
+
+
+def fail_work(worker, err):
+    """ Called when a unit of work of the worker raised an error. Its tasks
+    are queued again until they fail TASK_MAX_ATTEMPTS times, and a job
+    whose discovery broke fails.
+    """
+    update_log.error('Error in work_once()')
+    update_log.error(err)
+    release_tasks(worker)
+    for pk in Job.objects.filter(
+        worker=worker, status=RUNNING, discovery_done=False
+    ).values_list('pk', flat=True):
+        Job.objects.filter(pk=pk, status=RUNNING).update(
+            status=FAILED, error=str(err), date_finished=timezone.now())
+        send_job_event(pk)
+
+
+def work_once(worker, stages=STAGES):
+    """ Does one unit of work of the given stages. Scraping comes first so
+    that it never waits for the editing.
+    Returns False if there was nothing to do.
+    """
+    if SCRAPE_STAGE in stages:
+        job = claim_job(worker)
+        if job is not None:
+            update_log.info('Worker {} started job #{}.'.format(
+                worker, job.pk))
+            run_discovery(job)
+            finish_jobs()
+            return True
+
+        # The root pages come first so that the frontier fills up.
+        tasks = claim_tasks(worker, DISCOVER, 1)
+        if len(tasks) > 0:
+            run_discover_task(tasks[0], worker)
+            finish_jobs()
+            return True
+
+        tasks = claim_tasks(worker, FETCH, jg.FETCH_MAX_WORKERS * 2)
+        if len(tasks) > 0:
+            run_fetch_tasks(tasks, worker)
+            finish_jobs()
+            return True
+
+        finish_jobs()
+
+    if EDIT_STAGE in stages:
+        articles = editing.claim_articles(jg.EDIT_BATCH_SIZE)
+        if len(articles) > 0:
+            editing.run_edit_batch(articles)
+            return True
+
+        # Nothing to edit. The recommendations are updated in the meantime.
+        recommend.update_if_due()
+
+    return False
+
+
+def run_worker(stages=STAGES, once=False):
+    """ Runs the given stages until it is interrupted. If once is True it
+    returns as soon as there is nothing left to do.
+    """
+    worker = worker_name()
+    update_log.info('Worker {} is ready ({}).'.format(
+        worker, ', '.join(stages)))
+
+    try:
+        while True:
+            with update_log.buffered():
+                if SCRAPE_STAGE in stages:
+                    requeue_stale_tasks()
+                if EDIT_STAGE in stages:
+                    editing.requeue_stale_articles()
+                try:
+                    busy = work_once(worker, stages)
+                except Exception as err:
+                    # One bad task must not stop the worker.
+                    fail_work(worker, err)
+                    continue
+            if busy:
+                continue
+            if once:
+                break
+            time.sleep(jg.WORKER_SLEEP)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        release_tasks(worker)
+        article_editor.close_pool()
+        update_log.info('Worker {} stopped.'.format(worker))
+
+    return None
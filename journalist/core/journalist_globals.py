@@ -1,3 +1,118 @@
-LOG = []
 MIN_WORDS_TO_SCRAPE = 500
 SAMMARIZE_RATIO = 0.7
+# How many pages the scraper downloads at the same time, in total and for
+# each host.
+FETCH_MAX_WORKERS = 8
+FETCH_MAX_PER_HOST = 2
+# Shared HTTP session. The timeout is (connect, read) in seconds.
+HTTP_TIMEOUT = (10, 30)
+HTTP_POOL_CONNECTIONS = 20
+HTTP_POOL_MAXSIZE = 10
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+# 429 and 503 are handled by the politeness scheduler.
+HTTP_RETRY_STATUSES = (500, 502, 504)
+# Background workers (manage.py runworker). Times are in seconds.
+WORKER_SLEEP = 5
+# A running task whose worker did not send a heartbeat for TASK_TIMEOUT is
+# queued again. The workers send one every TASK_HEARTBEAT.
+TASK_TIMEOUT = 900
+TASK_HEARTBEAT = TASK_TIMEOUT / 3
+TASK_MAX_ATTEMPTS = 3
+# The edit stage claims this many NEW articles at a time.
+EDIT_BATCH_SIZE = 10
+EDIT_MAX_ATTEMPTS = 3
+# Processes that summarize and find keywords in edit_articles().
+# None uses all the cores.
+EDIT_PROCESSES = None
+# Translation memory. The TTL is in days since an entry was last used.
+TRANSLATION_MEMORY_TTL = 180
+TRANSLATION_MEMORY_MAX_ENTRIES = 200000
+TRANSLATION_MEMORY_PRUNE_EVERY = 100
+# Request size limits of the translators. Watson accepts up to 50KB.
+WATSON_MAX_REQUEST_CHARS = 40000
+MYMEMORY_MAX_CHARS = 500
+MYMEMORY_MAX_WORKERS = 4
+# Seconds that hot GCCache keys (like the quotas) are kept in each process.
+GCCACHE_TTL = 30
+# How many levels of sitemap index files are followed.
+SITEMAP_MAX_DEPTH = 2
+SITEMAP_CHUNK_SIZE = 64 * 1024
+# Root pages bigger than this are downloaded to a file instead of memory.
+ROOT_PAGE_MEMORY_SIZE = 1024 * 1024
+# The HTML store deletes the oldest pages when it grows above this size.
+HTML_STORE_MAX_BYTES = 2 * 1024 ** 3
+HTML_STORE_EVICT_EVERY = 500
+# manage.py reparse saves the articles in batches and sends the pages to its
+# processes in chunks.
+REPARSE_BATCH_SIZE = 500
+REPARSE_CHUNK_SIZE = 20
+# Extraction engine of the scraper: 'newspaper' (full parse) or 'lxml' (only
+# the title and the paragraphs, much faster).
+EXTRACTION_ENGINE = 'newspaper'
+LXML_MIN_PARAGRAPH_CHARS = 40
+# New articles are inserted in batches of this size.
+ARTICLE_BATCH_SIZE = 50
+# Near duplicate articles. Two texts whose SimHash differ in at most
+# DUPLICATE_MAX_DISTANCE bits (up to 3) are duplicates. Texts with fewer
+# shingles (runs of SIMHASH_SHINGLE words) are not checked.
+DUPLICATE_MAX_DISTANCE = 3
+SIMHASH_SHINGLE = 3
+DUPLICATE_MIN_SHINGLES = 20
+# Search results per page and the bm25 weights of the title, the summary
+# and the original text.
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+# Related articles (url_recommendations). The idle edit workers update them
+# at most every RECOMMEND_EVERY seconds. Articles more similar than
+# RECOMMEND_MAX_SIMILARITY are the same story and are not recommended.
+RECOMMEND_TOP_K = 5
+RECOMMEND_EVERY = 600
+RECOMMEND_MIN_SIMILARITY = 0.1
+RECOMMEND_MAX_SIMILARITY = 0.9
+# Cells of the dense block of similarities (float32) computed at a time.
+RECOMMEND_BLOCK_CELLS = 20 * 1000 * 1000
+# The dashboard log (LogEntry) keeps the last LOG_MAX_ENTRIES entries. The
+# older ones are deleted every LOG_TRIM_EVERY entries. A poll returns at most
+# LOG_PAGE_SIZE entries.
+LOG_MAX_ENTRIES = 1000
+LOG_TRIM_EVERY = 100
+LOG_PAGE_SIZE = 100
+# Inside update_log.buffered() the entries are written with one insert every
+# LOG_FLUSH_SIZE entries or LOG_FLUSH_SECONDS seconds.
+LOG_FLUSH_SIZE = 100
+LOG_FLUSH_SECONDS = 2.0
+# The dashboard event stream (api/events/). It checks for new entries every
+# EVENTS_POLL_SECONDS and is closed after EVENTS_STREAM_SECONDS, when the
+# browser reconnects after EVENTS_RETRY_MS.
+EVENTS_POLL_SECONDS = 1
+EVENTS_KEEPALIVE_SECONDS = 15
+EVENTS_STREAM_SECONDS = 300
+EVENTS_RETRY_MS = 3000
+# Politeness. Every host gets HOST_RATE requests per second at first, up to
+# HOST_BURST at once. The rate grows by HOST_RATE_STEP after every good
+# response, up to HOST_MAX_RATE or the Crawl-delay of its robots.txt, and is
+# multiplied by HOST_BACKOFF after every error or 429/5xx. Retry-After is
+# honored up to HOST_MAX_WAIT seconds. Hosts that ask to wait longer than
+# HOST_DEFER_AFTER seconds get their pages queued again for later.
+# robots.txt is read every ROBOTS_TTL seconds. A host whose robots.txt cannot
+# be read (5xx or no connection) is not crawled for ROBOTS_RETRY seconds.
+HOST_RATE = 1.0
+HOST_BURST = 2
+HOST_RATE_STEP = 0.1
+HOST_MAX_RATE = 4.0
+HOST_MIN_RATE = 0.05
+HOST_BACKOFF = 0.5
+HOST_MAX_WAIT = 3600
+HOST_DEFER_AFTER = 30
+ROBOTS_TTL = 24 * 60 * 60
+ROBOTS_RETRY = 10 * 60
+# A failed page is tried again after FETCH_RETRY_DELAY seconds, doubled on
+# every attempt, up to TASK_MAX_ATTEMPTS times.
+FETCH_RETRY_DELAY = 60
+# Discovery feeds the fetcher while it reads the sources. The urls are
+# checked and added to the frontier URL_BATCH_SIZE at a time and the fetcher
+# keeps at most FETCH_MAX_PENDING of them waiting for a download.
+URL_BATCH_SIZE = 20
+FETCH_MAX_PENDING = 32
@@ -0,0 +1,213 @@
+import re
+import time
+from datetime import timedelta
+
+import numpy as np
+from scipy import sparse
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from journalist.core import journalist_globals as jg
+from journalist.core.utils import update_log
+from journalist.models import Article, URLRecommendation, GCCache, READY
+
+
+# Only one worker updates the recommendations every RECOMMEND_EVERY.
+RECOMMEND_KEY = 'recommendations_due'
+
+
+def document(title, summary, keywords):
+    """ The text of an article that is compared. The edited fields are used
+    because they are all in English, whatever the original language was.
+    """
+    return ' '.join([
+        title or '', strip_tags(summary or ''), (keywords or '') * 2])
+
+
+def tokenize(text):
+    return [w for w in re.findall(r'\w+', text.lower()) if len(w) > 2]
+
+
+def vectorize(documents):
+    """ Returns the TF-IDF matrix (scipy CSR, one L2 normalized row per
+    document) of the documents.
+    """
+    vocabulary = {}
+    indptr = [0]
+    indices = []
+    counts = []
+    for text in documents:
+        row = {}
+        for token in tokenize(text):
+            column = vocabulary.setdefault(token, len(vocabulary))
+            row[column] = row.get(column, 0) + 1
+        indices.extend(row.keys())
+        counts.extend(row.values())
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.array(counts, dtype=np.float32), indices, indptr),
+        shape=(len(documents), len(vocabulary)),
+        dtype=np.float32
+    )
+    # Sublinear tf and smooth idf.
+    matrix.data = 1 + np.log(matrix.data)
+    df = np.bincount(matrix.indices, minlength=len(vocabulary))
+    idf = np.log((1 + len(documents)) / (1 + df)) + 1
+    matrix = matrix.multiply(idf.astype(np.float32)).tocsr()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)))
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(matrix.multiply(1 / norms))
+
+
+def top_k(matrix, rows, k):
+    """ Returns {row: [(column, similarity), ...]} with the k most similar
+    documents of each of the rows, best first.
+    The similarities are computed with sparse matrix products, a block of
+    rows at a time so that memory stays bounded.
+    """
+    n = matrix.shape[0]
+    block = max(1, jg.RECOMMEND_BLOCK_CELLS // max(n, 1))
+    transposed = matrix.T.tocsc()
+    found = {}
+    for start in range(0, len(rows), block):
+        chunk = rows[start:start + block]
+        scores = (matrix[chunk] @ transposed).toarray()
+        # Never the article itself or its near duplicates.
+        scores[np.arange(len(chunk)), chunk] = 0
+        scores[scores >= jg.RECOMMEND_MAX_SIMILARITY] = 0
+
+        kk = min(k, n - 1)
+        if kk <= 0:
+            break
+        best = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        for i, row in enumerate(chunk):
+            columns = best[i][np.argsort(-scores[i, best[i]])]
+            found[row] = [
+                (int(c), float(scores[i, c])) for c in columns
+                if scores[i, c] >= jg.RECOMMEND_MIN_SIMILARITY
+            ]
+    return found
+
+
+def affected_rows(matrix, new_rows):
+    """ Returns the rows that are similar enough to one of the new rows to
+    have their recommendations changed.
+    """
+    if len(new_rows) == 0:
+        return []
+    scores = (matrix @ matrix[new_rows].T).tocsr()
+    scores.data[scores.data < jg.RECOMMEND_MIN_SIMILARITY] = 0
+    scores.eliminate_zeros()
+    return list(np.flatnonzero(np.diff(scores.indptr)))
+
+
+def recommendation_for(article):
+    return URLRecommendation(
+        url=article['source'],
+        title=(article['title'] or article['original_title'])[:300],
+        description=strip_tags(article['summary'] or '')[:300],
+        keywords=article['keywords'] or ''
+    )
+
+
+def save_recommendations(articles, found):
+    """ Stores the recommendations {row: [(column, similarity)]} in the
+    url_recommendations of the articles (a list of values() dicts).
+    """
+    used = set(found.keys())
+    for columns in found.values():
+        used.update(c for c, similarity in columns)
+
+    URLRecommendation.objects.bulk_create(
+        [recommendation_for(articles[i]) for i in used],
+        batch_size=Article.BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    urls = [articles[i]['source'] for i in used]
+    ids = {}
+    for i in range(0, len(urls), Article.BATCH_SIZE):
+        ids.update(URLRecommendation.objects.filter(
+            url__in=urls[i:i + Article.BATCH_SIZE]
+        ).values_list('url', 'pk'))
+
+    Through = Article.url_recommendations.through
+    pks = [articles[row]['pk'] for row in found.keys()]
+    for i in range(0, len(pks), Article.BATCH_SIZE):
+        Through.objects.filter(
+            article_id__in=pks[i:i + Article.BATCH_SIZE]).delete()
+    Through.objects.bulk_create(
+        [
+            Through(
+                article_id=articles[row]['pk'],
+                urlrecommendation_id=ids[articles[c]['source']]
+            )
+            for row, columns in found.items()
+            for c, similarity in columns
+        ],
+        batch_size=Article.BATCH_SIZE
+    )
+    for i in range(0, len(pks), Article.BATCH_SIZE):
+        Article.objects.filter(pk__in=pks[i:i + Article.BATCH_SIZE]).update(
+            date_recommended=timezone.now())
+
+
+def update_recommendations(full=False, k=None):
+    """ Finds the k (RECOMMEND_TOP_K) most similar READY articles of the
+    READY articles that have no recommendations yet, and of the older
+    articles that the new ones could be recommended to. With full=True
+    every article is updated.
+    Only the similarities and the writes are limited to those articles.
+    Every READY article is still read and vectorized on each run, because
+    the idf of the words depends on all of them.
+    Returns the number of articles that were updated.
+    """
+    if k is None:
+        k = jg.RECOMMEND_TOP_K
+    start = time.perf_counter()
+
+    articles = list(Article.objects.filter(status=READY).order_by(
+        'pk').values(
+            'pk', 'source', 'title', 'original_title', 'summary',
+            'keywords', 'date_recommended'))
+    if len(articles) < 2:
+        return 0
+
+    matrix = vectorize([
+        document(a['title'], a['summary'], a['keywords'])
+        for a in articles
+    ])
+
+    if full:
+        rows = list(range(len(articles)))
+    else:
+        new_rows = [
+            i for i, a in enumerate(articles)
+            if a['date_recommended'] is None
+        ]
+        rows = sorted(set(new_rows) | set(affected_rows(matrix, new_rows)))
+    if len(rows) == 0:
+        return 0
+
+    save_recommendations(articles, top_k(matrix, rows, k))
+    update_log.info(
+        'Updated the recommendations of {} articles in {:.2f}s.'.format(
+            len(rows), time.perf_counter() - start))
+    return len(rows)
+
+
+def update_if_due():
+    """ Updates the recommendations of the new articles if nobody did it in
+    the last RECOMMEND_EVERY seconds.
+    """
+    if not Article.objects.filter(
+        status=READY, date_recommended__isnull=True
+    ).exists():
+        return False
+    if not GCCache.reserve(
+        RECOMMEND_KEY, 1, 1, timedelta(seconds=jg.RECOMMEND_EVERY)
+    ):
+        return False
+    update_recommendations()
+    return True
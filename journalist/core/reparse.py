@@ -0,0 +1,202 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from journalist.core import journalist_globals as jg
+from journalist.core.articles_factory import html_store, extractor
+from journalist.core.articles_factory import scraper, dedup
+from journalist.core.utils import update_log
+from journalist.models import Article, ArticleFingerprint, Source
+from journalist.models import StoredPage, NEW
+
+
+# Results that reparse_page() gives back besides the parsed ones.
+MISSING = 'missing'
+FAILED = 'failed'
+TOO_SHORT = 'too_short'
+# A new article whose url matches no source, so it has no topic.
+NO_SOURCE = 'no_source'
+
+
+def reparse_page(job):
+    """ Parses a stored page. Runs in the pool so it does not touch the
+    database.
+    Returns (url, title, text) or (url, reason, None).
+    """
+    url, sha256, min_words_count, engine = job
+
+    html = html_store.get(sha256)
+    if html is None:
+        return url, MISSING, None
+
+    try:
+        article = extractor.extract(html, engine, min_words_count)
+    except Exception:
+        return url, FAILED, None
+
+    if article is None or not extractor.has_enough_words(
+        article.text, min_words_count
+    ):
+        return url, TOO_SHORT, None
+    return url, article.title, article.text
+
+
+def latest_pages(urls):
+    """ Returns a dict {url: sha256} with the page that was fetched last for
+    each url that is in the store.
+    """
+    urls = list(urls)
+    pages = {}
+    for i in range(0, len(urls), jg.REPARSE_BATCH_SIZE):
+        pages.update(
+            StoredPage.objects.filter(
+                url__in=urls[i:i + jg.REPARSE_BATCH_SIZE]
+            ).order_by('fetched_on').values_list('url', 'sha256')
+        )
+    return pages
+
+
+def saved_articles(urls):
+    """ Returns a dict {url: pk} with the articles of the urls.
+    """
+    urls = list(urls)
+    articles = {}
+    for i in range(0, len(urls), Article.BATCH_SIZE):
+        articles.update(
+            Article.objects.filter(
+                source__in=urls[i:i + Article.BATCH_SIZE]
+            ).values_list('source', 'pk')
+        )
+    return articles
+
+
+def source_for(url, sources):
+    """ Returns the (topic_id, language) of the source whose url_filter the
+    url starts with, or None. sources is a list of
+    (url_filter, topic_id, language) with the longest filters first.
+    """
+    for url_filter, topic_id, language in sources:
+        if url.startswith(url_filter):
+            return topic_id, language
+    return None
+
+
+def save_parsed(parsed, reedit):
+    """ Updates the articles of a batch of parsed pages {pk: (title, text)}.
+    The articles that changed are checked for near duplicates again.
+    Returns the number of articles that changed.
+    """
+    fields = [
+        'original_title', 'original_text', 'duplicate_of', 'date_modified']
+    if reedit:
+        fields += ['status', 'edit_attempts']
+
+    changed = []
+    for article in Article.objects.filter(pk__in=list(parsed.keys())):
+        title, text = parsed[article.pk]
+        if article.original_title == title and article.original_text == text:
+            continue
+        article.original_title = title
+        article.original_text = text
+        article.duplicate_of = None
+        article.date_modified = timezone.now()
+        if reedit:
+            article.status = NEW
+            article.edit_attempts = 0
+        changed.append(article)
+
+    try:
+        with transaction.atomic():
+            Article.objects.bulk_update(changed, fields)
+    except IntegrityError:
+        # Some of the new titles belong to other articles.
+        for article in list(changed):
+            try:
+                with transaction.atomic():
+                    article.save(update_fields=fields)
+            except IntegrityError:
+                update_log.warning('Duplicate title: {}'.format(
+                    article.original_title))
+                changed.remove(article)
+
+    ArticleFingerprint.objects.filter(article__in=changed).delete()
+    dedup.index_articles(changed)
+
+    return len(changed)
+
+
+def reparse_pages(pages, processes=None,
+                  min_words_count=jg.MIN_WORDS_TO_SCRAPE, reedit=False,
+                  engine=None):
+    """ Parses the newest stored page of every url of the StoredPage
+    queryset again, without scraping it, and updates the original title
+    and text of its article. A page that has no article, because it was
+    rejected when it was scraped, gets a new one if it passes now and a
+    source still matches its url.
+    The pages are parsed by a pool of processes (all the cores by default)
+    with the engine (EXTRACTION_ENGINE by default).
+    If reedit is True the changed articles are sent back to the edit stage.
+    Returns a dict with the counts of every result.
+    """
+    latest = latest_pages(pages.values_list('url', flat=True).distinct())
+    articles = saved_articles(latest.keys())
+    sources = sorted(
+        Source.objects.values_list('url_filter', 'topic_id', 'language'),
+        key=lambda source: len(source[0]), reverse=True
+    )
+    jobs = [
+        (url, sha256, min_words_count, engine)
+        for url, sha256 in latest.items()
+    ]
+
+    counts = {
+        'pages': len(jobs),
+        MISSING: 0,
+        FAILED: 0,
+        TOO_SHORT: 0,
+        NO_SOURCE: 0,
+        'parsed': 0,
+        'changed': 0,
+        'new': 0,
+    }
+
+    parsed = {}
+    new = []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for url, title, text in pool.map(
+            reparse_page, jobs, chunksize=jg.REPARSE_CHUNK_SIZE
+        ):
+            if text is None:
+                counts[title] += 1
+                continue
+            counts['parsed'] += 1
+
+            if url in articles:
+                parsed[articles[url]] = (title, text)
+            else:
+                found = source_for(url, sources)
+                if found is None:
+                    counts[NO_SOURCE] += 1
+                    continue
+                topic_id, language = found
+                new.append(Article(
+                    source=url, topic_id=topic_id, original_title=title,
+                    original_text=text, original_language=language
+                ))
+
+            if len(parsed) >= jg.REPARSE_BATCH_SIZE:
+                counts['changed'] += save_parsed(parsed, reedit)
+                parsed = {}
+            if len(new) >= jg.REPARSE_BATCH_SIZE:
+                counts['new'] += len(scraper.save_articles(new))
+                new = []
+
+    if len(parsed) > 0:
+        counts['changed'] += save_parsed(parsed, reedit)
+    counts['new'] += len(scraper.save_articles(new))
+
+    update_log.info(
+        'Reparsed {} pages, {} articles changed and {} are new.'.format(
+            counts['parsed'], counts['changed'], counts['new']))
+    return counts
@@ -0,0 +1,251 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from journalist.core import journalist_globals as jg
+from journalist.models import Article, Keyword
+
+
+# Created by the 0010_search migration on SQLite.
+FTS_TABLE = 'journalist_article_fts'
+HAS_FTS = None
+
+# The triggers that keep the index up to date. SQLite drops them whenever a
+# migration rebuilds the journalist_article table, so they are created again
+# after every migrate, see restore_triggers().
+FTS_TRIGGERS = {
+    FTS_TABLE + '_ai': """
+    CREATE TRIGGER {t}_ai AFTER INSERT ON journalist_article BEGIN
+        INSERT INTO {t}(rowid, title, summary, original_text)
+        VALUES (new.id, new.title, new.summary, new.original_text);
+    END
+    """,
+    FTS_TABLE + '_ad': """
+    CREATE TRIGGER {t}_ad AFTER DELETE ON journalist_article BEGIN
+        INSERT INTO {t}({t}, rowid, title, summary, original_text)
+        VALUES ('delete', old.id, old.title, old.summary, old.original_text);
+    END
+    """,
+    FTS_TABLE + '_au': """
+    CREATE TRIGGER {t}_au
+    AFTER UPDATE OF title, summary, original_text ON journalist_article
+    BEGIN
+        INSERT INTO {t}({t}, rowid, title, summary, original_text)
+        VALUES ('delete', old.id, old.title, old.summary, old.original_text);
+        INSERT INTO {t}(rowid, title, summary, original_text)
+        VALUES (new.id, new.title, new.summary, new.original_text);
+    END
+    """,
+}
+
+
+def normalize_keyword(name):
+    return ' '.join(name.lower().split())[:100]
+
+
+def split_keywords(text):
+    """ Returns the normalized keywords of an Article.keywords text in their
+    order and without repeats.
+    """
+    names = []
+    for name in (text or '').replace('\n', ',').split(','):
+        name = normalize_keyword(name)
+        if len(name) > 0 and name not in names:
+            names.append(name)
+    return names
+
+
+def set_keywords(articles):
+    """ Makes the Keyword rows of the articles match their keywords text.
+    Uses a few queries for the whole batch.
+    """
+    articles = list(articles)
+    if len(articles) == 0:
+        return None
+
+    names = {article.pk: split_keywords(article.keywords)
+             for article in articles}
+    all_names = set()
+    for article_names in names.values():
+        all_names.update(article_names)
+
+    Keyword.objects.bulk_create(
+        [Keyword(name=name) for name in all_names],
+        batch_size=Article.BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    all_names = list(all_names)
+    ids = {}
+    for i in range(0, len(all_names), Article.BATCH_SIZE):
+        ids.update(Keyword.objects.filter(
+            name__in=all_names[i:i + Article.BATCH_SIZE]
+        ).values_list('name', 'pk'))
+
+    Through = Keyword.articles.through
+    Through.objects.filter(article_id__in=list(names.keys())).delete()
+    Through.objects.bulk_create(
+        [
+            Through(keyword_id=ids[name], article_id=pk)
+            for pk, article_names in names.items()
+            for name in article_names
+        ],
+        batch_size=Article.BATCH_SIZE
+    )
+    return None
+
+
+def has_index(db=connection):
+    return (
+        db.vendor == 'sqlite' and
+        FTS_TABLE in db.introspection.table_names()
+    )
+
+
+def missing_triggers(db=connection):
+    """ Returns the names of the FTS_TRIGGERS that are not in the database.
+    """
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        names = {row[0] for row in cursor.fetchall()}
+    return [name for name in FTS_TRIGGERS if name not in names]
+
+
+def has_fts():
+    """ Returns True if the full text index exists and is kept up to date.
+    Without its triggers the index misses the new articles, so the slower
+    LIKE search is used until they are restored.
+    """
+    global HAS_FTS
+
+    if HAS_FTS is None:
+        HAS_FTS = has_index() and len(missing_triggers()) == 0
+    return HAS_FTS
+
+
+def restore_triggers(db=connection):
+    """ Creates the FTS_TRIGGERS that are missing and rebuilds the index if
+    there were any, because the articles saved without them are not in it.
+    Returns the names of the triggers that were created.
+    """
+    global HAS_FTS
+
+    if not has_index(db):
+        return []
+
+    missing = missing_triggers(db)
+    if len(missing) > 0:
+        with db.cursor() as cursor:
+            for name in missing:
+                cursor.execute(FTS_TRIGGERS[name].format(t=FTS_TABLE))
+            cursor.execute(
+                "INSERT INTO {t}({t}) VALUES ('rebuild')".format(t=FTS_TABLE))
+    if db.alias == connection.alias:
+        HAS_FTS = None
+    return missing
+
+
+def rebuild_index():
+    """ Rebuilds the full text index from the articles table, and its
+    triggers if they are missing.
+    """
+    if len(restore_triggers()) == 0 and has_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {t}({t}) VALUES ('rebuild')".format(t=FTS_TABLE))
+
+
+def terms(q):
+    return re.findall(r'\w+', q or '')
+
+
+def fts_search(words, articles, offset, limit):
+    """ Returns (ids, count) of the filtered articles that match all the
+    words, best first by bm25.
+    """
+    # The words are quoted so that nothing in them is FTS5 syntax.
+    match = ' '.join('"{}"'.format(word) for word in words)
+    filter_sql, filter_params = articles.values('pk').query.sql_with_params()
+    where = '{t} MATCH %s AND {t}.rowid IN ({f})'.format(
+        t=FTS_TABLE, f=filter_sql)
+    params = [match] + list(filter_params)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT COUNT(*) FROM {t} WHERE {w}'.format(
+                t=FTS_TABLE, w=where),
+            params
+        )
+        count = cursor.fetchone()[0]
+        cursor.execute(
+            'SELECT rowid FROM {t} WHERE {w} '
+            'ORDER BY bm25({t}, {weights}) LIMIT %s OFFSET %s'.format(
+                t=FTS_TABLE, w=where,
+                weights=', '.join(str(w) for w in jg.SEARCH_WEIGHTS)),
+            params + [limit, offset]
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    return ids, count
+
+
+def like_search(words, articles, offset, limit):
+    """ The search of the databases without the full text index. Newest
+    first.
+    """
+    for word in words:
+        articles = articles.filter(
+            Q(title__icontains=word) |
+            Q(summary__icontains=word) |
+            Q(original_text__icontains=word)
+        )
+    count = articles.count()
+    ids = list(articles.order_by('-date_created').values_list(
+        'pk', flat=True)[offset:offset + limit])
+    return ids, count
+
+
+def search(q='', keyword=None, topic=None, status=None, page=1,
+           per_page=jg.SEARCH_PAGE_SIZE):
+    """ Searches the title, summary and original text of the articles and
+    returns (articles, count) for the page (starting from 1).
+    The articles can be filtered by keyword, topic title and status.
+    Without a query the newest articles come first.
+    """
+    articles = Article.objects.all()
+    if keyword:
+        articles = articles.filter(
+            keyword__name=normalize_keyword(keyword))
+    if topic:
+        articles = articles.filter(topic__title=topic)
+    if status:
+        articles = articles.filter(status=status)
+
+    offset = (page - 1) * per_page
+    words = terms(q)
+    if len(words) == 0:
+        count = articles.count()
+        ids = list(articles.order_by('-date_created').values_list(
+            'pk', flat=True)[offset:offset + per_page])
+    elif has_fts():
+        ids, count = fts_search(words, articles, offset, per_page)
+    else:
+        ids, count = like_search(words, articles, offset, per_page)
+
+    found = Article.objects.select_related('topic').prefetch_related(
+        'keyword_set').in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found], count
+
+
+def article_to_dict(article):
+    return {
+        'id': article.pk,
+        'title': article.title,
+        'original_title': article.original_title,
+        'source': article.source,
+        'topic': article.topic.title,
+        'language': article.original_language,
+        'status': article.get_status_display(),
+        'keywords': [k.name for k in article.keyword_set.all()],
+        'date_created': article.date_created,
+    }
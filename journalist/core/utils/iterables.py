@@ -0,0 +1,13 @@
+from itertools import islice
+
+
+def batches(iterable, size):
+    """ Yields lists of up to size items of the iterable, without reading
+    more of it than the next list needs.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if len(batch) == 0:
+            return
+        yield batch
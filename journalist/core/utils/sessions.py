@@ -0,0 +1,64 @@
+import threading
+import requests
+
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from journalist.core import journalist_globals as jg
+
+
+SESSION = None
+SESSION_LOCK = threading.Lock()
+
+
+def new_session():
+    """ Creates a session that keeps its connections alive and retries with
+    backoff on connection errors and on the HTTP_RETRY_STATUSES responses.
+    Goes through the SCRAPER_PROXIES (Tor by default).
+    Retry-After is left to the politeness scheduler, which can fetch from
+    other hosts in the meantime.
+    """
+    retry = Retry(
+        total=jg.HTTP_RETRIES,
+        backoff_factor=jg.HTTP_BACKOFF_FACTOR,
+        status_forcelist=jg.HTTP_RETRY_STATUSES,
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=jg.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=jg.HTTP_POOL_MAXSIZE,
+        max_retries=retry
+    )
+
+    session = requests.session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.proxies = dict(settings.SCRAPER_PROXIES)
+    return session
+
+
+def get_session():
+    """ Returns the session that is shared by the scraper and the translators
+    so that every request reuses an open connection to its host.
+    """
+    global SESSION
+
+    if SESSION is None:
+        with SESSION_LOCK:
+            if SESSION is None:
+                SESSION = new_session()
+    return SESSION
+
+
+def close_session():
+    """ Closes the shared session and all of its connections. The next
+    get_session() creates a new one.
+    """
+    global SESSION
+
+    with SESSION_LOCK:
+        if SESSION is not None:
+            SESSION.close()
+            SESSION = None
@@ -1,23 +1,115 @@
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.db import DatabaseError, transaction
 from django.utils import timezone
 from journalist.core import journalist_globals as jg
 
 logger = logging.getLogger('newsroom.base')
 
+# Threads that must not write to the database keep their entries here.
+_local = threading.local()
 
-def __add_to_log(level, msg):
-    msg = '{} - {} ==> {}'.format(
-        timezone.now().strftime("%d-%m, %H:%M:%S"),
-        level,
-        msg
-    )
-    jg.LOG.insert(
-        0,
-        {
-            'level': level,
-            'msg': msg
-        }
-    )
+LOG = 'log'
+EVENT = 'EVENT'
+
+
+def write_entries(entries):
+    """ Writes a list of (level, msg, kind, data) entries to the LogEntry
+    table.
+    """
+    from journalist.models import LogEntry
+
+    if len(entries) == 0:
+        return
+    try:
+        # In a savepoint so that a failed write does not break the
+        # transaction of the caller.
+        with transaction.atomic():
+            LogEntry.add_many(
+                entries, jg.LOG_MAX_ENTRIES, jg.LOG_TRIM_EVERY,
+                batch_size=jg.LOG_FLUSH_SIZE)
+    except DatabaseError as err:
+        # Logging must never stop the work, e.g. when the table is locked
+        # or not migrated yet.
+        logger.warning('Could not save the log entries: {}'.format(err))
+
+
+def save_entries(entries):
+    """ Saves a list of (level, msg, kind, data) entries. Inside buffered()
+    they are written with the next flush.
+    """
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        write_entries(entries)
+        return
+
+    buffer.extend(entries)
+    if (
+        len(buffer) >= jg.LOG_FLUSH_SIZE or
+        time.monotonic() - _local.flushed >= jg.LOG_FLUSH_SECONDS
+    ):
+        flush()
+
+
+def flush():
+    """ Writes the entries of the buffered() block of the current thread.
+    """
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is not None:
+        write_entries(buffer)
+        _local.buffer = []
+        _local.flushed = time.monotonic()
+
+
+@contextmanager
+def buffered():
+    """ Keeps the entries of the current thread in memory and writes them in
+    bulk, every LOG_FLUSH_SIZE entries or LOG_FLUSH_SECONDS seconds and at
+    the end of the block, instead of one insert for every entry. Used around
+    the work of the workers, which log a lot.
+    """
+    if getattr(_local, 'buffer', None) is not None:
+        # The outer block writes them.
+        yield
+        return
+
+    _local.buffer = []
+    _local.flushed = time.monotonic()
+    try:
+        yield
+    finally:
+        flush()
+        _local.buffer = None
+
+
+@contextmanager
+def deferred(entries):
+    """ Collects the entries of the current thread in the entries list
+    instead of saving them. Used by worker threads, since SQLite does not
+    take writes from several connections well. The entries are saved later
+    with save_entries().
+    """
+    _local.pending = entries
+    try:
+        yield entries
+    finally:
+        _local.pending = None
+
+
+def __add_to_log(level, msg, kind=LOG, data=None):
+    if kind == LOG:
+        msg = '{} - {} ==> {}'.format(
+            timezone.now().strftime("%d-%m, %H:%M:%S"),
+            level,
+            msg
+        )
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending.append((level, msg, kind, data))
+    else:
+        save_entries([(level, msg, kind, data)])
 
 
 def info(msg):
@@ -33,3 +125,11 @@ def error(msg):
 def warning(msg):
     logging.warning(msg)
     __add_to_log('WARNING', msg)
+
+
+def event(kind, **data):
+    """ Adds a progress event for the dashboard, e.g.
+    event('fetch', pages=50, saved=48).
+    """
+    logger.debug('{} {}'.format(kind, data))
+    __add_to_log(EVENT, '', kind, data)
@@ -0,0 +1,125 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from journalist.core import journalist_globals as jg
+from journalist.core import benchmarks, bench_servers
+from journalist.core.articles_factory import extractor
+
+
+class Command(BaseCommand):
+    help = 'Measures the throughput of the parts of the scraper.'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='target', required=True)
+
+        extract = subparsers.add_parser(
+            'extract',
+            help='Compare the extraction engines on saved pages.')
+        extract.add_argument(
+            '--path',
+            help=(
+                'A directory of .html or .html.gz files. '
+                'The HTML store by default.'
+            ))
+        extract.add_argument(
+            '--limit', type=int, default=None,
+            help='Use at most this many pages.')
+        extract.add_argument(
+            '--engine', choices=extractor.ENGINES, action='append',
+            help='Only this engine. Can be given more than once.')
+        extract.add_argument(
+            '--min-words', type=int, default=jg.MIN_WORDS_TO_SCRAPE)
+
+        links = subparsers.add_parser(
+            'links',
+            help='Compare the link extraction of the scraper on saved pages.')
+        links.add_argument(
+            '--path',
+            help=(
+                'A directory of .html or .html.gz files. '
+                'The HTML store by default.'
+            ))
+        links.add_argument(
+            '--url', default='http://localhost/',
+            help='The url of the pages of --path.')
+        links.add_argument(
+            '--limit', type=int, default=None,
+            help='Use at most this many pages.')
+
+        pipeline = subparsers.add_parser(
+            'pipeline',
+            help=(
+                'Time every stage from discovery to the edited articles '
+                'with a local stand-in site and translators.'
+            ))
+        pipeline.add_argument(
+            '--articles', type=int, default=40,
+            help='How many articles the stand-in site has.')
+        pipeline.add_argument(
+            '--latency', type=float, default=0.0,
+            help='Seconds added to every response of the stand-in servers.')
+        pipeline.add_argument(
+            '--host-rate', type=float, default=1000.0,
+            help='Requests per second to the stand-in site.')
+        pipeline.add_argument(
+            '--fixtures', default=bench_servers.FIXTURES_DIR,
+            help='The directory of the recorded pages.')
+        pipeline.add_argument(
+            '--timeout', type=float, default=600,
+            help='Stop the run after this many seconds.')
+
+    def handle(self, *args, **options):
+        getattr(self, 'handle_' + options['target'])(options)
+
+    def handle_extract(self, options):
+        if options['path']:
+            pages = benchmarks.directory_pages(
+                options['path'], options['limit'])
+        else:
+            pages = benchmarks.stored_pages(options['limit'])
+        pages = list(pages)
+        if len(pages) == 0:
+            raise CommandError('There are no pages to extract.')
+
+        rows = benchmarks.bench_extract(
+            pages,
+            engines=options['engine'] or extractor.ENGINES,
+            min_words_count=options['min_words']
+        )
+        self.write_rows(rows)
+
+    def handle_links(self, options):
+        if options['path']:
+            pages = [
+                (options['url'], html) for html in benchmarks.directory_pages(
+                    options['path'], options['limit'])
+            ]
+        else:
+            pages = list(benchmarks.stored_pages(
+                options['limit'], with_urls=True))
+        if len(pages) == 0:
+            raise CommandError('There are no pages to read.')
+
+        self.write_rows(benchmarks.bench_links(pages))
+
+    def handle_pipeline(self, options):
+        if options['articles'] < 1:
+            raise CommandError('--articles must be at least 1.')
+        if options['timeout'] <= 0:
+            raise CommandError('--timeout must be positive.')
+
+        try:
+            rows = benchmarks.bench_pipeline(
+                options['articles'],
+                latency=options['latency'],
+                host_rate=options['host_rate'],
+                path=options['fixtures'],
+                timeout=options['timeout']
+            )
+        except benchmarks.BenchmarkTimeout as err:
+            raise CommandError(str(err))
+        self.write_rows(rows)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.stdout.write('  '.join(
+                '{}={}'.format(key, value) for key, value in row.items()))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from journalist.core.articles_factory import dedup
+from journalist.models import Article
+
+
+class Command(BaseCommand):
+    help = (
+        'Fingerprints the articles that were saved before the near duplicate '
+        'detection, oldest first, and marks their duplicates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=Article.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        articles = Article.objects.filter(
+            fingerprint__isnull=True).order_by('pk')
+
+        last_pk = 0
+        checked = 0
+        duplicates = 0
+        while True:
+            # Short articles never get a fingerprint so go on by pk.
+            batch = list(
+                articles.filter(pk__gt=last_pk)[:options['batch_size']])
+            if len(batch) == 0:
+                break
+            duplicates += dedup.index_articles(batch)
+            checked += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write('{} articles checked, {} duplicates.'.format(
+            checked, duplicates))
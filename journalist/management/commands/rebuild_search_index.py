@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from journalist.core import search
+from journalist.models import Article
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the full text index and the keywords of the articles. '
+        'Both are kept up to date on their own, this is only needed after '
+        'changing the articles outside of Django. The triggers of the index '
+        'are created again if they are missing.'
+    )
+
+    def handle(self, *args, **options):
+        search.rebuild_index()
+
+        articles = Article.objects.only('pk', 'keywords').order_by('pk')
+        last_pk = 0
+        count = 0
+        while True:
+            batch = list(articles.filter(pk__gt=last_pk)[:Article.BATCH_SIZE])
+            if len(batch) == 0:
+                break
+            search.set_keywords(batch)
+            count += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write('Indexed {} articles.'.format(count))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from journalist.core import journalist_globals as jg
+from journalist.core import recommend
+
+
+class Command(BaseCommand):
+    help = (
+        'Finds the related articles (url_recommendations) of the new READY '
+        'articles and of the older ones they are related to.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Update the recommendations of every article.')
+        parser.add_argument(
+            '--top', type=int, default=jg.RECOMMEND_TOP_K,
+            help='Recommendations per article.')
+
+    def handle(self, *args, **options):
+        count = recommend.update_recommendations(
+            full=options['all'], k=options['top'])
+        self.stdout.write('Updated {} articles.'.format(count))
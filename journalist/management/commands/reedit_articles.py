@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from journalist.core import journalist_globals as jg
+from journalist.models import Article, Topic, NEW, READY
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends articles back to the edit stage without scraping them again, '
+        'e.g. after changing SAMMARIZE_RATIO. The workers edit them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topic', help='Only the articles of this topic.')
+        parser.add_argument(
+            '--failed', action='store_true',
+            help=(
+                'Only the NEW articles that failed to be edited '
+                'EDIT_MAX_ATTEMPTS times.'
+            ))
+
+    def handle(self, *args, **options):
+        if options['failed']:
+            articles = Article.objects.filter(
+                status=NEW, edit_attempts__gte=jg.EDIT_MAX_ATTEMPTS)
+        else:
+            articles = Article.objects.filter(status=READY)
+
+        if options['topic']:
+            try:
+                topic = Topic.objects.get(title=options['topic'])
+            except Topic.DoesNotExist:
+                raise CommandError(
+                    'Topic "{}" does not exist.'.format(options['topic']))
+            articles = articles.filter(topic=topic)
+
+        count = articles.update(
+            status=NEW, edit_attempts=0, date_modified=timezone.now())
+        self.stdout.write('{} articles will be edited again.'.format(count))
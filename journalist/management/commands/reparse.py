@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from journalist.core import journalist_globals as jg
+from journalist.core import reparse
+from journalist.core.articles_factory import extractor
+from journalist.models import StoredPage, Topic
+
+
+class Command(BaseCommand):
+    help = (
+        'Parses the pages of the HTML store again without scraping them, '
+        'e.g. after upgrading Newspaper. Pages that were rejected before '
+        'become articles if they pass now.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topic', help='Only the pages of the sources of this topic.')
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Number of parsing processes. All the cores by default.')
+        parser.add_argument(
+            '--min-words', type=int, default=jg.MIN_WORDS_TO_SCRAPE,
+            help='Articles shorter than this are left as they are.')
+        parser.add_argument(
+            '--engine', choices=extractor.ENGINES, default=None,
+            help='The extraction engine. EXTRACTION_ENGINE by default.')
+        parser.add_argument(
+            '--reedit', action='store_true',
+            help='Send the articles that changed back to the edit stage.')
+
+    def handle(self, *args, **options):
+        pages = StoredPage.objects.all()
+        if options['topic']:
+            try:
+                topic = Topic.objects.get(title=options['topic'])
+            except Topic.DoesNotExist:
+                raise CommandError(
+                    'Topic "{}" does not exist.'.format(options['topic']))
+            url_filters = list(
+                topic.sources.values_list('url_filter', flat=True))
+            if len(url_filters) == 0:
+                raise CommandError(
+                    'Topic "{}" has no sources.'.format(options['topic']))
+            filters = Q()
+            for url_filter in url_filters:
+                filters |= Q(url__startswith=url_filter)
+            pages = pages.filter(filters)
+
+        counts = reparse.reparse_pages(
+            pages,
+            processes=options['processes'],
+            min_words_count=options['min_words'],
+            reedit=options['reedit'],
+            engine=options['engine']
+        )
+        for name, count in counts.items():
+            self.stdout.write('{}: {}'.format(name, count))
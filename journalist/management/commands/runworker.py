@@ -0,0 +1,50 @@
+from multiprocessing import Process
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from journalist.core import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the scraping jobs that are queued from the dashboard and edits '
+        'the NEW articles.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stage', choices=jobs.STAGES + ('all',), default='all',
+            help='Run only the scrape or only the edit stage.')
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Number of worker processes to start.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit when there is nothing left to do.')
+
+    def handle(self, *args, **options):
+        stages = jobs.STAGES
+        if options['stage'] != 'all':
+            stages = (options['stage'],)
+        kwargs = {'stages': stages, 'once': options['once']}
+
+        if options['processes'] <= 1:
+            jobs.run_worker(**kwargs)
+            return
+
+        # The database connections can not be shared with the children.
+        connections.close_all()
+        processes = [
+            Process(target=jobs.run_worker, kwargs=kwargs)
+            for i in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # The children got the interrupt too and release their tasks.
+            for process in processes:
+                process.join()
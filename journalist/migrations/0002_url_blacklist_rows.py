@@ -0,0 +1,48 @@
+# Generated by Django 3.1.1 on 2026-10-18 18:44
+
+from django.db import migrations
+
+
+def split_legacy_blacklist(apps, schema_editor):
+    """ Moves the comma joined 'url_blacklist' GCCache value to URLBlacklist
+    rows and deletes the old cache item.
+    """
+    GCCache = apps.get_model('journalist', 'GCCache')
+    URLBlacklist = apps.get_model('journalist', 'URLBlacklist')
+
+    blacklist = GCCache.objects.filter(pk='url_blacklist').first()
+    if blacklist is None:
+        return
+
+    urls = set()
+    for url in (blacklist.value or '').split(', '):
+        url = url.strip()
+        if len(url) > 0 and len(url) <= 300:
+            urls.add(url)
+
+    URLBlacklist.objects.bulk_create(
+        [URLBlacklist(url=url) for url in urls],
+        batch_size=500,
+        ignore_conflicts=True
+    )
+    blacklist.delete()
+
+
+def join_blacklist(apps, schema_editor):
+    GCCache = apps.get_model('journalist', 'GCCache')
+    URLBlacklist = apps.get_model('journalist', 'URLBlacklist')
+
+    urls = URLBlacklist.objects.values_list('url', flat=True)
+    GCCache.objects.update_or_create(
+        key='url_blacklist', defaults={'value': ', '.join(urls)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_legacy_blacklist, join_blacklist),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.1.1 on 2026-10-18 18:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0002_url_blacklist_rows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('scrape', 'Scrape')], default='scrape', max_length=20)),
+                ('status', models.CharField(choices=[('QD', 'Queued'), ('RN', 'Running'), ('DN', 'Done'), ('FL', 'Failed'), ('CN', 'Cancelled')], db_index=True, default='QD', max_length=2)),
+                ('worker', models.CharField(blank=True, max_length=100, null=True)),
+                ('discovery_done', models.BooleanField(default=False)),
+                ('tasks_total', models.PositiveIntegerField(default=0)),
+                ('tasks_done', models.PositiveIntegerField(default=0)),
+                ('tasks_failed', models.PositiveIntegerField(default=0)),
+                ('articles_saved', models.PositiveIntegerField(default=0)),
+                ('articles_edited', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_started', models.DateTimeField(blank=True, null=True)),
+                ('date_finished', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='source',
+            name='root_url',
+            field=models.CharField(help_text='Add a sitemap.xml url to scrape.', max_length=300),
+        ),
+        migrations.AlterField(
+            model_name='source',
+            name='url_filter',
+            field=models.CharField(help_text='Only the urls that strart with this filter will be scraped.', max_length=300),
+        ),
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('fetch', 'Fetch'), ('edit', 'Edit')], max_length=20)),
+                ('status', models.CharField(choices=[('QD', 'Queued'), ('RN', 'Running'), ('DN', 'Done'), ('FL', 'Failed'), ('CN', 'Cancelled')], db_index=True, default='QD', max_length=2)),
+                ('url', models.CharField(blank=True, max_length=300, null=True)),
+                ('language', models.CharField(choices=[('el', 'el'), ('en', 'en'), ('ru', 'ru')], default='el', max_length=2)),
+                ('worker', models.CharField(blank=True, max_length=100, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('article', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='journalist.article')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='journalist.job')),
+                ('topic', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='journalist.topic')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(status__in=['QD', 'RN']), fields=('kind',), name='one_active_job_per_kind'),
+        ),
+    ]
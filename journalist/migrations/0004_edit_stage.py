@@ -0,0 +1,44 @@
+# Generated by Django 3.1.1 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+def drop_edit_tasks(apps, schema_editor):
+    """ The edit stage works on the NEW articles now.
+    """
+    Task = apps.get_model('journalist', 'Task')
+    Task.objects.filter(kind='edit').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0003_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_edit_tasks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='job',
+            name='articles_edited',
+        ),
+        migrations.RemoveField(
+            model_name='task',
+            name='article',
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='edit_attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='status',
+            field=models.CharField(choices=[('NW', 'New'), ('ED', 'Editing'), ('RD', 'Ready')], db_index=True, default='NW', max_length=2),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='kind',
+            field=models.CharField(choices=[('fetch', 'Fetch')], max_length=20),
+        ),
+    ]
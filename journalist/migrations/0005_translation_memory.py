@@ -0,0 +1,31 @@
+# Generated by Django 3.1.1 on 2026-10-18 18:52
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0004_edit_stage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationMemory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(max_length=64)),
+                ('languages', models.CharField(max_length=5)),
+                ('provider', models.CharField(choices=[('watson', 'Watson'), ('mymemory', 'MyMemory')], max_length=20)),
+                ('translation', models.TextField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('last_used', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='translationmemory',
+            constraint=models.UniqueConstraint(fields=('text_hash', 'languages', 'provider'), name='unique_translation'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0005_translation_memory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='source',
+            name='sitemap_lastmod',
+            field=models.DateTimeField(blank=True, help_text='Only the sitemap entries that changed after this are scraped. Clear it to read the whole sitemap again.', null=True),
+        ),
+    ]
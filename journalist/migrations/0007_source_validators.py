@@ -0,0 +1,28 @@
+# Generated by Django 3.1.1 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0006_source_sitemap_lastmod'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='source',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='source',
+            name='etag',
+            field=models.CharField(blank=True, max_length=300, null=True),
+        ),
+        migrations.AddField(
+            model_name='source',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.1 on 2026-10-18 19:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0007_source_validators'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredPage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(db_index=True, max_length=300)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveIntegerField(help_text='Compressed size in bytes.')),
+                ('fetched_on', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='storedpage',
+            constraint=models.UniqueConstraint(fields=('url', 'sha256'), name='unique_stored_page'),
+        ),
+    ]
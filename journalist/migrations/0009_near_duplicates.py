@@ -0,0 +1,30 @@
+# Generated by Django 3.1.1 on 2026-10-18 19:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0008_stored_page'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleFingerprint',
+            fields=[
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='journalist.article')),
+                ('simhash', models.BigIntegerField()),
+                ('band0', models.PositiveIntegerField(db_index=True)),
+                ('band1', models.PositiveIntegerField(db_index=True)),
+                ('band2', models.PositiveIntegerField(db_index=True)),
+                ('band3', models.PositiveIntegerField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='The article that this one nearly repeats. Its edited fields are copied instead of editing this one.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='journalist.article'),
+        ),
+    ]
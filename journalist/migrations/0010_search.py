@@ -0,0 +1,112 @@
+# Generated by Django 3.1.1 on 2026-10-18 19:05
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+
+FTS_TABLE = 'journalist_article_fts'
+
+CREATE_FTS = [
+    """
+    CREATE VIRTUAL TABLE {t} USING fts5(
+        title, summary, original_text,
+        content='journalist_article', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER {t}_ai AFTER INSERT ON journalist_article BEGIN
+        INSERT INTO {t}(rowid, title, summary, original_text)
+        VALUES (new.id, new.title, new.summary, new.original_text);
+    END
+    """,
+    """
+    CREATE TRIGGER {t}_ad AFTER DELETE ON journalist_article BEGIN
+        INSERT INTO {t}({t}, rowid, title, summary, original_text)
+        VALUES ('delete', old.id, old.title, old.summary, old.original_text);
+    END
+    """,
+    """
+    CREATE TRIGGER {t}_au
+    AFTER UPDATE OF title, summary, original_text ON journalist_article
+    BEGIN
+        INSERT INTO {t}({t}, rowid, title, summary, original_text)
+        VALUES ('delete', old.id, old.title, old.summary, old.original_text);
+        INSERT INTO {t}(rowid, title, summary, original_text)
+        VALUES (new.id, new.title, new.summary, new.original_text);
+    END
+    """,
+    "INSERT INTO {t}({t}) VALUES ('rebuild')",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS {t}_ai",
+    "DROP TRIGGER IF EXISTS {t}_ad",
+    "DROP TRIGGER IF EXISTS {t}_au",
+    "DROP TABLE IF EXISTS {t}",
+]
+
+
+def create_fts(apps, schema_editor):
+    """ Creates the SQLite FTS5 index of the articles. The triggers keep it
+    up to date on every insert, update and delete. Other databases (or
+    SQLite builds without FTS5) fall back to LIKE queries.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        for sql in CREATE_FTS:
+            schema_editor.execute(sql.format(t=FTS_TABLE))
+    except OperationalError:
+        for sql in DROP_FTS:
+            schema_editor.execute(sql.format(t=FTS_TABLE))
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_FTS:
+        schema_editor.execute(sql.format(t=FTS_TABLE))
+
+
+def fill_keywords(apps, schema_editor):
+    Article = apps.get_model('journalist', 'Article')
+    Keyword = apps.get_model('journalist', 'Keyword')
+
+    names = {}
+    for pk, keywords in Article.objects.exclude(
+        keywords__isnull=True
+    ).values_list('pk', 'keywords').iterator():
+        for name in keywords.replace('\n', ',').split(','):
+            name = ' '.join(name.lower().split())[:100]
+            if len(name) > 0:
+                names.setdefault(name, set()).add(pk)
+
+    Keyword.objects.bulk_create(
+        [Keyword(name=name) for name in names], batch_size=500)
+    Through = Keyword.articles.through
+    links = []
+    for keyword in Keyword.objects.all():
+        for pk in names.get(keyword.name, ()):
+            links.append(Through(keyword_id=keyword.pk, article_id=pk))
+    Through.objects.bulk_create(links, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0009_near_duplicates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Keyword',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('articles', models.ManyToManyField(blank=True, to='journalist.Article')),
+            ],
+        ),
+        migrations.RunPython(fill_keywords, migrations.RunPython.noop),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0010_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='date_recommended',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.1 on 2026-10-18 19:13
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0012_log_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logentry',
+            name='data',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='kind',
+            field=models.CharField(default='log', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='logentry',
+            name='msg',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.1 on 2026-10-18 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0013_log_entry_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='not_before',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
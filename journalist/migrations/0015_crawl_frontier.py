@@ -0,0 +1,41 @@
+# Generated by Django 3.1.1 on 2026-10-18 19:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_states(apps, schema_editor):
+    # The tasks of the older runs did not keep if their page had an article.
+    Task = apps.get_model('journalist', 'Task')
+    Task.objects.filter(status='DN').update(state='PS')
+    Task.objects.filter(status='FL').update(state='FL')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0014_task_not_before'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='source',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='journalist.source'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='state',
+            field=models.CharField(choices=[('DS', 'Discovered'), ('FT', 'Fetched'), ('PS', 'Parsed'), ('FL', 'Failed')], default='DS', max_length=2),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='kind',
+            field=models.CharField(choices=[('discover', 'Discover'), ('fetch', 'Fetch')], max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(fields=('job', 'kind', 'url'), name='unique_task_url'),
+        ),
+        migrations.RunPython(fill_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.1 on 2026-10-18 19:54
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0015_crawl_frontier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='source_state',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True),
+        ),
+    ]
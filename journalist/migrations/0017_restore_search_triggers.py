@@ -0,0 +1,58 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'journalist_article_fts'
+
+# SQLite rebuilds journalist_article on AddField (0011), which drops the
+# triggers of the full text index that 0010 created.
+CREATE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS {t}_ai",
+    "DROP TRIGGER IF EXISTS {t}_ad",
+    "DROP TRIGGER IF EXISTS {t}_au",
+    """
+    CREATE TRIGGER {t}_ai AFTER INSERT ON journalist_article BEGIN
+        INSERT INTO {t}(rowid, title, summary, original_text)
+        VALUES (new.id, new.title, new.summary, new.original_text);
+    END
+    """,
+    """
+    CREATE TRIGGER {t}_ad AFTER DELETE ON journalist_article BEGIN
+        INSERT INTO {t}({t}, rowid, title, summary, original_text)
+        VALUES ('delete', old.id, old.title, old.summary, old.original_text);
+    END
+    """,
+    """
+    CREATE TRIGGER {t}_au
+    AFTER UPDATE OF title, summary, original_text ON journalist_article
+    BEGIN
+        INSERT INTO {t}({t}, rowid, title, summary, original_text)
+        VALUES ('delete', old.id, old.title, old.summary, old.original_text);
+        INSERT INTO {t}(rowid, title, summary, original_text)
+        VALUES (new.id, new.title, new.summary, new.original_text);
+    END
+    """,
+    # The articles saved without the triggers are missing from the index.
+    "INSERT INTO {t}({t}) VALUES ('rebuild')",
+]
+
+
+def restore_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if (
+        connection.vendor != 'sqlite' or
+        FTS_TABLE not in connection.introspection.table_names()
+    ):
+        return
+    for sql in CREATE_TRIGGERS:
+        schema_editor.execute(sql.format(t=FTS_TABLE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0016_task_source_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.1 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journalist', '0017_restore_search_triggers'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='task',
+            name='unique_task_url',
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(kind='fetch'), fields=('job', 'kind', 'url'), name='unique_task_url'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(kind='discover'), fields=('job', 'source'), name='unique_discover_source'),
+        ),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+import threading
+import time
+
+from django.db import models, transaction, IntegrityError
+from django.db.models.functions import Cast
 from tinymce import HTMLField
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
 from datetime import datetime
 from django.utils import timezone
 from django.utils.text import slugify
@@ -16,12 +21,57 @@ LANGUAGES = [
 ]
 
 NEW = 'NW'
+EDITING = 'ED'
 READY = 'RD'
 STATUS_CHOICES = [
     (NEW, 'New'),
+    (EDITING, 'Editing'),
     (READY, 'Ready'),
 ]
 
+QUEUED = 'QD'
+RUNNING = 'RN'
+DONE = 'DN'
+FAILED = 'FL'
+CANCELLED = 'CN'
+JOB_STATUS_CHOICES = [
+    (QUEUED, 'Queued'),
+    (RUNNING, 'Running'),
+    (DONE, 'Done'),
+    (FAILED, 'Failed'),
+    (CANCELLED, 'Cancelled'),
+]
+
+SCRAPE = 'scrape'
+JOB_KIND_CHOICES = [
+    (SCRAPE, 'Scrape'),
+]
+
+DISCOVER = 'discover'
+FETCH = 'fetch'
+TASK_KIND_CHOICES = [
+    (DISCOVER, 'Discover'),
+    (FETCH, 'Fetch'),
+]
+
+# How far the url of a task got.
+DISCOVERED = 'DS'
+FETCHED = 'FT'
+PARSED = 'PS'
+CRAWL_STATE_CHOICES = [
+    (DISCOVERED, 'Discovered'),
+    (FETCHED, 'Fetched'),
+    (PARSED, 'Parsed'),
+    (FAILED, 'Failed'),
+]
+
+WATSON = 'watson'
+MYMEMORY = 'mymemory'
+PROVIDER_CHOICES = [
+    (WATSON, 'Watson'),
+    (MYMEMORY, 'MyMemory'),
+]
+
 
 class Topic(models.Model):
     title = models.CharField(max_length=200, unique=True)
@@ -45,6 +95,16 @@ class Source(models.Model):
     )
     language = models.CharField(max_length=2, choices=LANGUAGES, default=EL)
     active = models.BooleanField(default=True)
+    sitemap_lastmod = models.DateTimeField(
+        blank=True, null=True,
+        help_text="Only the sitemap entries that changed after this are "
+                  "scraped. Clear it to read the whole sitemap again."
+    )
+
+    # The validators of the root url from the last run.
+    etag = models.CharField(max_length=300, blank=True, null=True)
+    last_modified = models.CharField(max_length=100, blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, null=True)
 
     def __str__(self):
         return self.root_url
@@ -58,9 +118,36 @@ class URLBlacklist(models.Model):
     """
     url = models.CharField(max_length=300, unique=True)
 
+    # Keeps the number of query parameters below SQLite's limit.
+    BATCH_SIZE = 500
+
     def __str__(self):
         return self.url
 
+    @staticmethod
+    def filter_new(urls):
+        """ Returns the set of the given urls that are not in the blacklist.
+        Uses one query for every BATCH_SIZE urls.
+        """
+        urls = list(set(urls))
+        seen = set()
+        for i in range(0, len(urls), URLBlacklist.BATCH_SIZE):
+            chunk = urls[i:i + URLBlacklist.BATCH_SIZE]
+            seen.update(URLBlacklist.objects.filter(
+                url__in=chunk).values_list('url', flat=True))
+        return set(urls) - seen
+
+    @staticmethod
+    def add_urls(urls):
+        """ Adds the urls to the blacklist. Urls that are allready there are
+        ignored.
+        """
+        URLBlacklist.objects.bulk_create(
+            [URLBlacklist(url=url) for url in set(urls)],
+            batch_size=URLBlacklist.BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
 
 class URLRecommendation(models.Model):
     url = models.CharField(max_length=300, unique=True)
@@ -87,16 +174,287 @@ class Article(models.Model):
     keywords = models.TextField(blank=True, null=True)
     status = models.CharField(max_length=2, choices=STATUS_CHOICES,
                               default=NEW, db_index=True)
+    edit_attempts = models.PositiveIntegerField(default=0)
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='duplicates',
+        help_text="The article that this one nearly repeats. Its edited "
+                  "fields are copied instead of editing this one."
+    )
 
     url_recommendations = models.ManyToManyField(
         URLRecommendation, blank=True)
+    date_recommended = models.DateTimeField(blank=True, null=True)
 
     date_created = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
 
+    # Keeps the number of query parameters below SQLite's limit.
+    BATCH_SIZE = 500
+
     def __str__(self):
         return self.original_title
 
+    @staticmethod
+    def filter_new(urls):
+        """ Returns the set of the given urls that are not the source of an
+        article. Uses one query for every BATCH_SIZE urls.
+        """
+        urls = list(set(urls))
+        seen = set()
+        for i in range(0, len(urls), Article.BATCH_SIZE):
+            chunk = urls[i:i + Article.BATCH_SIZE]
+            seen.update(Article.objects.filter(
+                source__in=chunk).values_list('source', flat=True))
+        return set(urls) - seen
+
+
+class Keyword(models.Model):
+    """
+    The keywords of the articles, lowercased, so that articles can be looked
+    up by keyword. Kept in sync with Article.keywords by
+    journalist.core.search.set_keywords().
+    """
+    name = models.CharField(max_length=100, unique=True)
+    articles = models.ManyToManyField(Article, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ArticleFingerprint(models.Model):
+    """
+    The 64 bit SimHash of the original text of an article, split in four
+    16 bit bands. Texts that differ in at most three bits share at least one
+    band, so the candidates are found with indexed lookups.
+    """
+    article = models.OneToOneField(
+        Article,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='fingerprint',
+    )
+    simhash = models.BigIntegerField()
+    band0 = models.PositiveIntegerField(db_index=True)
+    band1 = models.PositiveIntegerField(db_index=True)
+    band2 = models.PositiveIntegerField(db_index=True)
+    band3 = models.PositiveIntegerField(db_index=True)
+
+    def __str__(self):
+        return '{:016x}'.format(self.simhash & 0xFFFFFFFFFFFFFFFF)
+
+
+class Job(models.Model):
+    """
+    A scraping run that is executed by the workers (manage.py runworker).
+    Only one job of each kind can be queued or running at a time.
+    """
+    kind = models.CharField(max_length=20, choices=JOB_KIND_CHOICES,
+                            default=SCRAPE)
+    status = models.CharField(max_length=2, choices=JOB_STATUS_CHOICES,
+                              default=QUEUED, db_index=True)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    discovery_done = models.BooleanField(default=False)
+
+    tasks_total = models.PositiveIntegerField(default=0)
+    tasks_done = models.PositiveIntegerField(default=0)
+    tasks_failed = models.PositiveIntegerField(default=0)
+    articles_saved = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(blank=True, null=True)
+    date_finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind'],
+                condition=models.Q(status__in=[QUEUED, RUNNING]),
+                name='one_active_job_per_kind'
+            ),
+        ]
+
+    def __str__(self):
+        return '{} #{}'.format(self.kind, self.pk)
+
+
+class Task(models.Model):
+    """
+    The crawl frontier of a job: one row for the root page of every source
+    (DISCOVER) and one for every new url that was found in them (FETCH).
+    The workers claim the queued tasks of the running jobs, so a run that
+    was interrupted goes on from where it stopped.
+    state is how far the url got. A page that was fetched but had no article
+    stays FETCHED.
+    Pages that failed with a temporary error are queued again with a
+    not_before time.
+    """
+    job = models.ForeignKey(
+        Job,
+        on_delete=models.CASCADE,
+        related_name='tasks',
+    )
+    kind = models.CharField(max_length=20, choices=TASK_KIND_CHOICES)
+    status = models.CharField(max_length=2, choices=JOB_STATUS_CHOICES,
+                              default=QUEUED, db_index=True)
+    state = models.CharField(max_length=2, choices=CRAWL_STATE_CHOICES,
+                             default=DISCOVERED)
+    url = models.CharField(max_length=300, blank=True, null=True)
+    language = models.CharField(max_length=2, choices=LANGUAGES, default=EL)
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, null=True)
+    source = models.ForeignKey(
+        Source, on_delete=models.SET_NULL, blank=True, null=True)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # A failed task is not claimed again before this time.
+    not_before = models.DateTimeField(blank=True, null=True)
+    # What a discover task read from its source. It is saved to the source
+    # when the job is done, if every url of the source was fetched.
+    source_state = models.JSONField(
+        null=True, blank=True, encoder=DjangoJSONEncoder)
+
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # A url that is found in more than one source is fetched once.
+            models.UniqueConstraint(
+                fields=['job', 'kind', 'url'],
+                condition=models.Q(kind=FETCH),
+                name='unique_task_url'
+            ),
+            # Sources can share a root page and split it with their
+            # url_filter, so every source gets its own discover task.
+            models.UniqueConstraint(
+                fields=['job', 'source'],
+                condition=models.Q(kind=DISCOVER),
+                name='unique_discover_source'
+            ),
+        ]
+
+    def __str__(self):
+        return '{} {}'.format(self.kind, self.url)
+
+
+class TranslationMemory(models.Model):
+    """
+    Translations of single sentences. The translators look here before
+    spending their quotas.
+    text_hash is the sha256 of the sentence after its whitespace is
+    normalized.
+    """
+    text_hash = models.CharField(max_length=64)
+    languages = models.CharField(max_length=5)
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
+    translation = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+
+    date_created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['text_hash', 'languages', 'provider'],
+                name='unique_translation'
+            ),
+        ]
+
+    def __str__(self):
+        return '{} {}'.format(self.languages, self.text_hash)
+
+
+class StoredPage(models.Model):
+    """
+    A page that was fetched and kept in the HTML store (HTML_STORE_ROOT).
+    The html is saved gzipped in a file named after its sha256, so pages
+    with the same html share one file.
+    """
+    url = models.CharField(max_length=300, db_index=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveIntegerField(help_text="Compressed size in bytes.")
+    fetched_on = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['url', 'sha256'],
+                name='unique_stored_page'
+            ),
+        ]
+
+    def __str__(self):
+        return self.url
+
+
+class LogEntry(models.Model):
+    """
+    The log and the progress events that are shown in the dashboard. It is
+    shared by all the processes and kept to the last LOG_MAX_ENTRIES
+    entries. The pk of an entry is the cursor of the ones that come after
+    it.
+    The log messages have the kind LOG. The rest are progress events with
+    their details in data.
+    """
+    LOG = 'log'
+
+    level = models.CharField(max_length=10)
+    kind = models.CharField(max_length=20, default=LOG)
+    msg = models.TextField(blank=True)
+    data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'log entries'
+
+    def __str__(self):
+        return self.msg or self.kind
+
+    @staticmethod
+    def add_many(entries, max_entries, trim_every, batch_size=100):
+        """ Saves a list of (level, msg, kind, data) entries with bulk
+        inserts and, every trim_every entries, deletes the ones that fell out
+        of the last max_entries.
+        """
+        LogEntry.objects.bulk_create(
+            [
+                LogEntry(level=level, msg=msg, kind=kind, data=data)
+                for level, msg, kind, data in entries
+            ],
+            batch_size=batch_size
+        )
+        last = LogEntry.objects.order_by('-pk').values_list(
+            'pk', flat=True).first()
+        if last is not None and (
+            last // trim_every > (last - len(entries)) // trim_every
+        ):
+            LogEntry.objects.filter(pk__lte=last - max_entries).delete()
+
+    @staticmethod
+    def since(cursor, limit):
+        """ Returns up to limit entries that were added after the cursor,
+        oldest first. Without a cursor the last ones are returned.
+        """
+        if cursor is None:
+            entries = LogEntry.objects.order_by('-pk')[:limit]
+            return list(reversed(entries))
+        return list(LogEntry.objects.filter(pk__gt=cursor).order_by(
+            'pk')[:limit])
+
+    def to_dict(self):
+        return {
+            'id': self.pk,
+            'level': self.level,
+            'kind': self.kind,
+            'msg': self.msg,
+            'data': self.data,
+        }
+
 
 class GCCache(models.Model):
     key = models.CharField(max_length=100, primary_key=True)
@@ -106,13 +464,19 @@ class GCCache(models.Model):
     def __str__(self):
         return self.key
 
+    # The in-process copies of the items that are read with a ttl.
+    # {key: (expires, item)} where expires is a time.monotonic() value.
+    LOCAL = {}
+    LOCAL_LOCK = threading.Lock()
+
     def set_expiration_date(self, expiration_date):
         if (
             type(expiration_date) is datetime and
             (expiration_date - timezone.now()).total_seconds() > 0
         ):
             self.expire_on = expiration_date
-            self.save()
+            self.save(update_fields=['expire_on'])
+            GCCache.forget(self.key)
             return self
         else:
             raise ValueError(
@@ -131,26 +495,230 @@ class GCCache(models.Model):
 
     def set_value(self, value):
         self.value = value
-        self.save()
+        self.save(update_fields=['value'])
+        GCCache.forget(self.key)
         return self
 
     @staticmethod
-    def set_item(key, value):
+    def forget(*keys):
+        """ Drops the in-process copies of the keys.
+        """
+        with GCCache.LOCAL_LOCK:
+            for key in keys:
+                GCCache.LOCAL.pop(key, None)
+
+    @staticmethod
+    def remember(key, item, ttl):
+        with GCCache.LOCAL_LOCK:
+            GCCache.LOCAL[key] = (time.monotonic() + ttl, item)
+
+    @staticmethod
+    def recall(key):
+        """ Returns (True, item) if there is a fresh in-process copy of the
+        key or (False, None).
+        """
+        with GCCache.LOCAL_LOCK:
+            entry = GCCache.LOCAL.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return False, None
+        return True, entry[1]
+
+    @staticmethod
+    def set_item(key, value, expire_on=None):
+        defaults = {'value': value}
+        if expire_on is not None:
+            defaults['expire_on'] = expire_on
+        c, created = GCCache.objects.update_or_create(
+            key=key, defaults=defaults)
+        GCCache.forget(key)
+        return c
+
+    @staticmethod
+    def get_item(key, ttl=None):
+        """ Returns the item of the key or None.
+        If ttl (seconds) is given the item is kept in this process for that
+        long, so that hot keys are not queried every time. Changes from other
+        processes show up after at most ttl seconds.
+        """
+        if ttl is not None:
+            found, c = GCCache.recall(key)
+            if found:
+                return c
+
         try:
             c = GCCache.objects.get(pk=key)
         except ObjectDoesNotExist:
-            c = GCCache.objects.create(key=key, value=value)
-        else:
+            c = None
+
+        if ttl is not None:
+            GCCache.remember(key, c, ttl)
+        return c
+
+    @staticmethod
+    def get_many(keys, ttl=None):
+        """ Returns a dict {key: item} with the keys that exist, using one
+        query for all of them. ttl works like in get_item.
+        """
+        found = {}
+        missing = []
+        for key in set(keys):
+            if ttl is not None:
+                known, c = GCCache.recall(key)
+                if known:
+                    if c is not None:
+                        found[key] = c
+                    continue
+            missing.append(key)
+
+        if len(missing) > 0:
+            items = GCCache.objects.in_bulk(missing)
+            found.update(items)
+            if ttl is not None:
+                for key in missing:
+                    GCCache.remember(key, items.get(key), ttl)
+
+        return found
+
+    @staticmethod
+    def set_many(values, expire_on=None):
+        """ Sets the values of a dict {key: value} with one query for the
+        keys that exist and one for the new ones.
+        """
+        with transaction.atomic():
+            existing = GCCache.objects.select_for_update().in_bulk(
+                list(values.keys()))
+            fields = ['value'] if expire_on is None else ['value', 'expire_on']
+
+            for key, c in existing.items():
+                c.value = values[key]
+                if expire_on is not None:
+                    c.expire_on = expire_on
+            GCCache.objects.bulk_update(existing.values(), fields)
+
+            created = [
+                GCCache(key=key, value=value, expire_on=expire_on)
+                for key, value in values.items() if key not in existing
+            ]
+            try:
+                with transaction.atomic():
+                    GCCache.objects.bulk_create(created)
+            except IntegrityError:
+                # Some of them were created meanwhile.
+                for c in created:
+                    GCCache.set_item(c.key, c.value, expire_on)
+
+        GCCache.forget(*values.keys())
+        return None
+
+    @staticmethod
+    def get_or_set(key, default, expire_on=None):
+        """ Returns the item of the key. If it does not exist or has expired
+        it is set to default (a value or a callable that returns it) first.
+        """
+        value = default() if callable(default) else default
+        c, created = GCCache.objects.get_or_create(
+            key=key, defaults={'value': value, 'expire_on': expire_on})
+        if not created and c.is_expired():
             c.value = value
-            c.save()
-        finally:
-            return c
+            c.expire_on = expire_on
+            c.save(update_fields=['value', 'expire_on'])
+            GCCache.forget(key)
+        return c
 
     @staticmethod
-    def get_item(key):
-        try:
-            c = GCCache.objects.get(pk=key)
-        except ObjectDoesNotExist:
-            return None
-        else:
-            return c
+    def increment(key, delta=1):
+        """ Adds delta to the integer value of the key with a single UPDATE
+        so that concurrent workers never lose an increment.
+        """
+        updated = GCCache.objects.filter(pk=key).update(
+            value=Cast(
+                Cast('value', models.BigIntegerField()) + delta,
+                models.TextField()
+            )
+        )
+        if updated == 0:
+            try:
+                with transaction.atomic():
+                    GCCache.objects.create(key=key, value=str(delta))
+            except IntegrityError:
+                # Someone else created it first.
+                return GCCache.increment(key, delta)
+        GCCache.forget(key)
+        return None
+
+    @staticmethod
+    def reserve(key, amount, limit, period):
+        """ Takes amount from the quota that is kept in the key and returns
+        True, or False if there is not enough quota left.
+        The quota starts from limit and is reset to limit every period (a
+        timedelta or a relativedelta) when it is next used.
+        Every step is a single conditional UPDATE so that concurrent workers
+        can never spend more than the limit.
+        """
+        if amount > limit:
+            return False
+
+        remaining = Cast('value', models.BigIntegerField())
+        for attempt in range(3):
+            now = timezone.now()
+
+            # Enough quota left in the current period.
+            updated = GCCache.objects.filter(
+                pk=key, expire_on__gt=now
+            ).annotate(remaining=remaining).filter(
+                remaining__gte=amount
+            ).update(value=Cast(remaining - amount, models.TextField()))
+            if updated == 1:
+                GCCache.forget(key)
+                return True
+
+            # The period is over. Only one worker gets to reset it.
+            expired = models.Q(expire_on__isnull=True)
+            expired |= models.Q(expire_on__lte=now)
+            updated = GCCache.objects.filter(expired, pk=key).update(
+                value=str(limit - amount), expire_on=now + period)
+            if updated == 1:
+                GCCache.forget(key)
+                return True
+
+            if GCCache.objects.filter(pk=key).exists():
+                return False
+
+            try:
+                with transaction.atomic():
+                    GCCache.objects.create(
+                        key=key,
+                        value=str(limit - amount),
+                        expire_on=now + period
+                    )
+            except IntegrityError:
+                # Someone else created it first. Try again.
+                continue
+            else:
+                GCCache.forget(key)
+                return True
+
+        return False
+
+    @staticmethod
+    def refund(key, amount):
+        """ Gives back quota that was reserved but not spent.
+        """
+        if amount != 0:
+            GCCache.objects.filter(pk=key).update(
+                value=Cast(
+                    Cast('value', models.BigIntegerField()) + amount,
+                    models.TextField()
+                )
+            )
+            GCCache.forget(key)
+        return None
+
+    @staticmethod
+    def remaining(key, limit, ttl=None):
+        """ Returns the quota that is left in the key.
+        """
+        c = GCCache.get_item(key, ttl)
+        if c is None or c.is_expired():
+            return limit
+        return int(c.value)
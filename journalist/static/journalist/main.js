@@ -1,8 +1,58 @@
 var pollInterval = 5000;
+var logCursor = null;
+var maxLogEntries = 1000;
+var currentJob = {id: null, onFinished: null};
+var stats = {discovered: 0, pages: 0, parsed: 0, saved: 0, edited: 0};
+var quotas = {};
+
+// Gets the log and the progress from the server as they happen. Browsers
+// without EventSource poll for them.
+function listenEvents() {
+    if (!window.EventSource) {
+        getData();
+        return;
+    }
+    const source = new EventSource('/api/events/');
+    source.onmessage = function(e) {
+        handleEvent(JSON.parse(e.data));
+    };
+};
+
+
+function handleEvent(event) {
+    const data = event.data;
+    if (event.kind == 'log') {
+        updateLogList([event]);
+    } else if (event.kind == 'job') {
+        updateJob(data.job, data.articles_to_edit);
+    } else if (event.kind == 'discovered') {
+        stats.discovered += data.urls;
+    } else if (event.kind == 'fetch') {
+        stats.pages += data.pages;
+        stats.parsed += data.parsed;
+        stats.saved += data.saved;
+    } else if (event.kind == 'edit') {
+        stats.edited += data.edited;
+    } else if (event.kind == 'quota') {
+        quotas[data.provider] = data.remaining + ' of ' + data.limit;
+        $('#quota-left').text('Translation quota left: ' + Object.keys(quotas).map(
+            function(provider) { return provider + ' ' + quotas[provider]; }
+        ).join(', '));
+    }
+    $('#scraping-stats').text(
+        stats.discovered + ' urls discovered, ' + stats.pages + ' pages fetched, ' +
+        stats.parsed + ' parsed, ' + stats.saved + ' saved, ' + stats.edited + ' edited.'
+    );
+};
 
 function getData() {
-    let jqxhr = $.getJSON('/api/get-data/', function(data) {
-      updateLogList(data.log);
+    const params = logCursor === null ? {} : {since: logCursor};
+    let jqxhr = $.getJSON('/api/get-data/', params, function(data) {
+      // The events come newest first.
+      for (const event of data.log.slice().reverse()) {
+          handleEvent(event);
+      }
+      logCursor = data.cursor;
     }).done(function() {
         setTimeout(getData, pollInterval);
     }).fail(function() {
@@ -12,47 +62,87 @@ function getData() {
 
 
 function updateLogList(log) {
+    // log has only the new entries, newest first.
+    log = log.filter(function(entry) { return entry.kind == 'log'; });
     const logList = $('#log-list');
     let entryClass = 'list-group-item-info';
-    if (logList.find('li').length < log.length) {
-        logList.empty();
-        for (const logEntry of log) {
-            if (logEntry.level == 'ERROR') {
-                entryClass = 'list-group-item-danger';
-            } else if (logEntry.level == 'WARNING') {
-                entryClass = 'list-group-item-warning';
-            } else {
-                entryClass = 'list-group-item-info';
-            }
-            logList.append('<li class="list-group-item '+entryClass+'">'+logEntry.msg+'</li>');
+    let items = [];
+    for (const logEntry of log) {
+        if (logEntry.level == 'ERROR') {
+            entryClass = 'list-group-item-danger';
+        } else if (logEntry.level == 'WARNING') {
+            entryClass = 'list-group-item-warning';
+        } else {
+            entryClass = 'list-group-item-info';
         }
+        items.push($('<li class="list-group-item '+entryClass+'"></li>').text(logEntry.msg));
     }
+    logList.prepend(items);
+    logList.find('li').slice(maxLogEntries).remove();
 };
 
 
-function startScraping(onFinished, onError) {
-    let jqxhr = $.getJSON('/api/start-scraping', function(data) {
+function startScraping(onStarted, onError) {
+    $.getJSON('/api/start-scraping', function(data) {
         console.log(data);
-    }).done(onFinished()).fail(onError());
+        onStarted(data.job_id);
+    }).fail(onError);
+};
+
+
+function updateJob(job, articlesToEdit) {
+    if (job.id != currentJob.id) {
+        return;
+    }
+    $('#scraping-progress').text(
+        job.status + ': ' + (job.tasks_done + job.tasks_failed) + ' of ' +
+        job.tasks_total + ' tasks, ' + job.articles_saved + ' new articles, ' +
+        articlesToEdit + ' articles waiting to be edited.'
+    );
+    if (job.finished && currentJob.onFinished !== null) {
+        const onFinished = currentJob.onFinished;
+        currentJob.onFinished = null;
+        onFinished(job);
+    }
+};
+
+
+// The job events update the progress. Its status is read once in case the
+// job was started before the page was loaded.
+function watchJob(jobId, onFinished) {
+    currentJob = {id: jobId, onFinished: onFinished};
+    $.getJSON('/api/jobs/' + jobId, function(data) {
+        updateJob(data.job, data.articles_to_edit);
+    }).fail(function() {
+        console.log( "Failed to fetch data from server." );
+    });
 };
 
 
 $(document).ready(function() {
     console.log('Ready!');
-    getData();
+    listenEvents();
 
     $('#get-latest-articles-btn').on('click', function(e) {
         let el = $(this);
         el.prop('disabled', true);
         $('#scraping-loading').slideDown('fast');
         startScraping(
-            function() {
-                el.prop('disabled', false);
-                $('#scraping-loading').slideUp('fast');
+            function(jobId) {
+                stats = {discovered: 0, pages: 0, parsed: 0, saved: 0, edited: 0};
+                $('#cancel-scraping-btn').data('job-id', jobId);
+                watchJob(jobId, function() {
+                    el.prop('disabled', false);
+                    $('#scraping-loading').slideUp('fast');
+                });
             },
             function() {
                 console.log( "Failed to fetch data from server." );
             }
         )
     });
-});
\ No newline at end of file
+
+    $('#cancel-scraping-btn').on('click', function(e) {
+        $.getJSON('/api/jobs/' + $(this).data('job-id') + '/cancel');
+    });
+});
@@ -1,3 +1,1098 @@
-from django.test import TestCase
+import gzip
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from scipy import sparse
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from journalist.core import jobs, editing, reparse, search, recommend
+from journalist.core import journalist_globals as jg
+from journalist.core.articles_factory import article_editor
+from journalist.core.articles_factory import translator, translation_memory
+from journalist.core.articles_factory import scraper, politeness, html_store
+from journalist.core.articles_factory import extractor, sitemap, fetcher
+from journalist.core.articles_factory import links
+from journalist.core.utils import update_log
+from journalist.models import Topic, Source, Job, Task, Article, LogEntry
+from journalist.models import GCCache, TranslationMemory, StoredPage
+from journalist.models import FETCH, PARSED, QUEUED, RUNNING, DONE, FAILED
+from journalist.models import DISCOVER, READY, MYMEMORY
+
+
+def make_source(root_url='http://news.test/sitemap.xml', topic='World',
+                **fields):
+    topic, created = Topic.objects.get_or_create(title=topic)
+    fields.setdefault('url_filter', 'http://news.test/')
+    return Source.objects.create(
+        topic=topic, root_url=root_url, language='en', **fields)
+
+
+def make_article(number, topic=None, **fields):
+    if topic is None:
+        topic, created = Topic.objects.get_or_create(title='World')
+    sentences = ' '.join(
+        'Sentence number {} of the story {} about the harbour.'.format(
+            i, number)
+        for i in range(12)
+    )
+    fields.setdefault('original_language', 'en')
+    fields.setdefault('original_text', sentences)
+    return Article.objects.create(
+        source='http://news.test/{}'.format(number), topic=topic,
+        original_title='Story {}'.format(number), **fields)
+
+
+def make_page(number, title=None):
+    sentences = ' '.join(
+        'Sentence {0} of the story {1} about the harbour, line {0}.'.format(
+            i, number)
+        for i in range(60)
+    )
+    title = title or 'Story {}'.format(number)
+    return (
+        '<html><head><title>{}</title></head><body><article>'
+        '<p>{}</p></article></body></html>'.format(
+            title, sentences)
+    ).encode('utf-8')
+
+
+def make_sitemap(*urls, lastmod='2020-09-21T10:00:00+03:00', tag='url'):
+    entries = ''.join(
+        '<{0}><loc>{1}</loc><lastmod>{2}</lastmod></{0}>'.format(
+            tag, url, lastmod)
+        for url in urls
+    )
+    root = 'urlset' if tag == 'url' else 'sitemapindex'
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<{0} xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        '{1}</{0}>'.format(root, entries)
+    ).encode('utf-8')
+
+
+def chunks_of(data, size=7):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.text = content.decode('utf-8', 'replace')
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """ Answers with the (status, body, headers) of pages[url], or 404.
+    Keeps the headers of every request.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append((url, headers))
+        status, body, response_headers = self.pages.get(url, (404, b'', {}))
+        return FakeResponse(status, body, response_headers)
+
+
+def use_temp_store(test):
+    """ Keeps the HTML store of a test in a temporary directory.
+    """
+    root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, root, ignore_errors=True)
+    settings = override_settings(HTML_STORE_ROOT=root)
+    settings.enable()
+    test.addCleanup(settings.disable)
+
+
+def make_job(status=RUNNING, **fields):
+    fields.setdefault('discovery_done', True)
+    return Job.objects.create(status=status, **fields)
+
+
+def make_task(job, url='http://news.test/1', kind=FETCH, source=None,
+              **fields):
+    return Task.objects.create(
+        job=job, kind=kind, url=url, language='en',
+        topic=source.topic if source else None, source=source, **fields)
+
+
+class WorkerTests(TestCase):
+
+    def setUp(self):
+        self.job = make_job()
+        self.task = make_task(self.job)
+
+    def test_failing_task_does_not_stop_the_worker(self):
+        with mock.patch.object(
+            jobs, 'run_fetch_tasks', side_effect=RuntimeError('boom')
+        ) as run_fetch_tasks:
+            jobs.run_worker(stages=(jobs.SCRAPE_STAGE,), once=True)
+
+        self.assertEqual(run_fetch_tasks.call_count, jg.TASK_MAX_ATTEMPTS)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, FAILED)
+        self.assertEqual(self.task.attempts, jg.TASK_MAX_ATTEMPTS)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, DONE)
+        self.assertEqual(self.job.tasks_failed, 1)
+
+    def test_release_tasks_counts_the_attempts(self):
+        other = make_task(self.job, url='http://news.test/2')
+        Task.objects.filter(pk=self.task.pk).update(
+            status=RUNNING, worker='w', attempts=1)
+        Task.objects.filter(pk=other.pk).update(
+            status=RUNNING, worker='w', attempts=jg.TASK_MAX_ATTEMPTS)
+
+        jobs.release_tasks('w')
+
+        self.task.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.task.status, QUEUED)
+        self.assertIsNone(self.task.worker)
+        self.assertEqual(other.status, FAILED)
+
+    def test_heartbeat_keeps_long_tasks(self):
+        old = timezone.now() - timedelta(seconds=jg.TASK_TIMEOUT + 1)
+        Task.objects.filter(pk=self.task.pk).update(
+            status=RUNNING, worker='w', date_modified=old)
+
+        with mock.patch.object(jobs, 'LAST_HEARTBEAT', 0.0):
+            jobs.heartbeat('w')
+        jobs.requeue_stale_tasks()
+
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.worker), (RUNNING, 'w'))
+
+    def test_stale_tasks_are_queued_again(self):
+        old = timezone.now() - timedelta(seconds=jg.TASK_TIMEOUT + 1)
+        Task.objects.filter(pk=self.task.pk).update(
+            status=RUNNING, worker='w', attempts=1, date_modified=old)
+
+        jobs.requeue_stale_tasks()
+
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.worker), (QUEUED, None))
+        self.assertEqual(
+            [task.pk for task in jobs.claim_tasks('w2', FETCH, 10)],
+            [self.task.pk])
+
+    def test_task_of_another_worker_is_not_finished(self):
+        Task.objects.filter(pk=self.task.pk).update(
+            status=RUNNING, worker='w2')
+
+        jobs.finish_tasks([(self.task, DONE, PARSED, 1)], 'w')
+
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.worker), (RUNNING, 'w2'))
+        self.job.refresh_from_db()
+        self.assertEqual(
+            (self.job.tasks_done, self.job.articles_saved), (0, 0))
+
+    def test_tasks_are_claimed_once(self):
+        make_task(self.job, url='http://news.test/2')
+        make_task(self.job, url='http://news.test/3')
+
+        first = jobs.claim_tasks('w1', FETCH, 2)
+        second = jobs.claim_tasks('w2', FETCH, 2)
+
+        self.assertEqual((len(first), len(second)), (2, 1))
+        self.assertEqual(jobs.claim_tasks('w3', FETCH, 2), [])
+        self.assertFalse(
+            {task.pk for task in first} & {task.pk for task in second})
+        self.assertEqual(
+            {(task.worker, task.attempts) for task in second}, {('w2', 1)})
+
+    def test_waiting_tasks_and_idle_jobs_are_not_claimed(self):
+        Task.objects.filter(pk=self.task.pk).update(
+            not_before=timezone.now() + timedelta(minutes=1))
+        make_task(make_job(status=FAILED), url='http://news.test/2')
+
+        self.assertEqual(jobs.claim_tasks('w', FETCH, 10), [])
+
+    def test_broken_discovery_fails_the_job(self):
+        Job.objects.all().delete()
+        job = make_job(status=QUEUED, discovery_done=False)
+        with mock.patch.object(
+            jobs.scraper, 'test_connection',
+            side_effect=RuntimeError('offline')
+        ):
+            jobs.run_worker(stages=(jobs.SCRAPE_STAGE,), once=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, FAILED)
+        self.assertEqual(job.error, 'offline')
+
+
+class EditTests(TestCase):
+
+    def test_batches_share_one_pool(self):
+        for number in range(jg.EDIT_BATCH_SIZE + 2):
+            make_article(number)
+
+        # Threads stand in for the processes, the pool is what is counted.
+        with mock.patch.object(
+            article_editor, 'ProcessPoolExecutor', wraps=ThreadPoolExecutor
+        ) as pool:
+            editing.edit_new_articles()
+
+        self.assertEqual(pool.call_count, 1)
+        self.assertIsNone(article_editor.POOL)
+        self.assertEqual(
+            Article.objects.filter(status=READY).count(),
+            jg.EDIT_BATCH_SIZE + 2)
+
+
+class TranslationMemoryTests(TestCase):
+
+    def setUp(self):
+        translation_memory.store(
+            {'Καλημέρα.': 'Good morning.'}, 'el-en', MYMEMORY)
+
+    def translate(self, text):
+        with mock.patch.object(
+            translator, 'watson_translate_sentences', return_value={}
+        ), mock.patch.object(
+            translator, 'mymemory_translate_sentences', return_value={}
+        ):
+            return translator.translate_texts([text], 'el-en')
+
+    def test_hit_rate_is_logged(self):
+        self.assertEqual(self.translate('Καλημέρα.'), ['Good morning.'])
+        self.assertEqual(self.translate('Καλησπέρα.'), [None])
+
+        stats = translation_memory.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertTrue(LogEntry.objects.filter(
+            msg__contains='(hit rate 50%)').exists())
+
+    def test_hit_rate_is_shown_in_the_admin(self):
+        self.translate('Καλημέρα.')
+        User.objects.create_superuser('admin', 'admin@news.test', 'pass')
+        self.client.login(username='admin', password='pass')
+
+        response = self.client.get(
+            '/admin/journalist/translationmemory/')
+        self.assertContains(response, '100% hit rate (1 hits, 0 misses)')
+
+
+class MyMemoryTests(TestCase):
+
+    SENTENCES = ['Πρώτη πρόταση.', 'Δεύτερη πρόταση.', 'Τρίτη πρόταση.']
+
+    def request(self, text, langpair):
+        # The lines of a chunk come back merged into one.
+        if '\n' in text:
+            return text.replace('\n', ' ')
+        return 'EN ' + text
+
+    def translate(self):
+        with mock.patch.object(
+            translator, 'mymemory_request', side_effect=self.request
+        ) as request:
+            translated = translator.mymemory_translate_sentences(
+                self.SENTENCES, 'el-en')
+        return translated, request.call_count
+
+    def test_misaligned_chunk_is_sent_again_one_by_one(self):
+        translated, requests = self.translate()
+
+        self.assertEqual(requests, 1 + len(self.SENTENCES))
+        self.assertEqual(
+            translated, {s: 'EN ' + s for s in self.SENTENCES})
+        self.assertEqual(
+            set(TranslationMemory.objects.values_list(
+                'translation', flat=True)),
+            {'EN ' + s for s in self.SENTENCES})
+
+    def test_resent_sentences_reserve_their_words(self):
+        self.translate()
+
+        words = translator.count_words(self.SENTENCES)
+        self.assertEqual(
+            GCCache.remaining(
+                translator.MYMEMORY_QUOTA_KEY,
+                translator.MYMEMORY_DAILY_LIMIT),
+            translator.MYMEMORY_DAILY_LIMIT - 2 * words)
+
+    def test_resent_sentences_stop_at_the_limit(self):
+        words = translator.count_words(self.SENTENCES)
+        # Enough for the chunk and one of the sentences.
+        with mock.patch.object(
+            translator, 'MYMEMORY_DAILY_LIMIT', words + 2
+        ):
+            translated, requests = self.translate()
+
+        self.assertEqual(requests, 2)
+        self.assertEqual(list(translated), self.SENTENCES[:1])
+
+
+class CrawlTests(TestCase):
+
+    SITEMAP = 'http://news.test/sitemap.xml'
+    PAGES = ['http://news.test/1', 'http://news.test/2']
+
+    def setUp(self):
+        use_temp_store(self)
+        politeness.HOSTS.clear()
+        self.source = make_source(self.SITEMAP)
+        self.session = FakeSession({
+            self.SITEMAP: (
+                200, make_sitemap(*self.PAGES), {'ETag': '"v1"'}),
+            self.PAGES[0]: (200, make_page(1), {}),
+        })
+
+    def crawl(self):
+        jobs.enqueue_scrape()
+        with mock.patch.object(
+            scraper, 'get_session', return_value=self.session
+        ):
+            jobs.run_worker(stages=(jobs.SCRAPE_STAGE,), once=True)
+        self.assertFalse(Job.objects.exclude(status=DONE).exists())
+        self.source.refresh_from_db()
+
+    def test_sources_can_share_a_root_page(self):
+        world = 'http://news.test/world/1'
+        sports = 'http://news.test/sports/1'
+        Source.objects.filter(pk=self.source.pk).update(
+            url_filter='http://news.test/world/')
+        make_source(self.SITEMAP, topic='Sports',
+                    url_filter='http://news.test/sports/')
+        self.session.pages.update({
+            self.SITEMAP: (200, make_sitemap(world, sports), {}),
+            world: (200, make_page(1), {}),
+            sports: (200, make_page(2), {}),
+        })
+
+        self.crawl()
+
+        self.assertEqual(Task.objects.filter(kind=DISCOVER).count(), 2)
+        self.assertEqual(
+            dict(Article.objects.values_list('source', 'topic__title')),
+            {world: 'World', sports: 'Sports'})
+        self.assertTrue(LogEntry.objects.filter(
+            msg__contains='2 sources to check').exists())
+
+    def test_links_of_a_root_page_in_its_charset(self):
+        root = 'http://news.test/ειδήσεις/'
+        Source.objects.filter(pk=self.source.pk).update(
+            root_url=root, url_filter=root)
+        self.session.pages[root] = (
+            200,
+            '<a href="άρθρο-1">Άρθρο</a>'.encode('windows-1253'),
+            {'Content-Type': 'text/html; charset=windows-1253'}
+        )
+
+        self.crawl()
+
+        self.assertEqual(
+            list(Task.objects.filter(kind=FETCH).values_list(
+                'url', flat=True)),
+            [root + 'άρθρο-1'])
+
+    def test_failed_url_is_found_again(self):
+        self.crawl()
+        self.assertEqual(
+            list(Article.objects.values_list('source', flat=True)),
+            self.PAGES[:1])
+        self.assertIsNone(self.source.sitemap_lastmod)
+
+        # The sitemap changed since, so it is read again.
+        new = 'http://news.test/3'
+        self.session.pages.update({
+            self.SITEMAP: (200, make_sitemap(*self.PAGES, new), {}),
+            self.PAGES[1]: (200, make_page(2), {}),
+            new: (200, make_page(3), {}),
+        })
+        self.crawl()
+        self.assertEqual(
+            set(Article.objects.values_list('source', flat=True)),
+            set(self.PAGES + [new]))
+        self.assertIsNotNone(self.source.sitemap_lastmod)
+
+    def test_validators_wait_for_the_fetches(self):
+        self.crawl()
+        self.assertIsNone(self.source.etag)
+        self.assertIsNone(self.source.content_hash)
+
+        self.session.pages[self.PAGES[1]] = (200, make_page(2), {})
+        self.crawl()
+        self.assertEqual(self.source.etag, '"v1"')
+        self.assertIsNotNone(self.source.content_hash)
+
+    def test_unchanged_root_page_is_skipped(self):
+        self.session.pages[self.PAGES[1]] = (200, make_page(2), {})
+        self.crawl()
+        # The server ignores If-None-Match but sends the same sitemap.
+        self.session.pages[self.SITEMAP] = (
+            200, make_sitemap(*self.PAGES), {'ETag': '"v2"'})
+        self.crawl()
+
+        self.assertEqual(Task.objects.filter(kind=FETCH).count(), 2)
+        self.assertEqual(self.source.etag, '"v2"')
+
+    def test_root_page_is_asked_conditionally(self):
+        self.session.pages[self.PAGES[1]] = (200, make_page(2), {})
+        self.crawl()
+        self.session.pages[self.SITEMAP] = (304, b'', {})
+        self.crawl()
+
+        url, headers = [
+            request for request in self.session.requests
+            if request[0] == self.SITEMAP
+        ][-1]
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+        self.assertEqual(Task.objects.filter(kind=FETCH).count(), 2)
+
+
+class PolitenessTests(TestCase):
+
+    ROBOTS = 'http://news.test/robots.txt'
+
+    def setUp(self):
+        politeness.HOSTS.clear()
+        self.addCleanup(politeness.HOSTS.clear)
+        clock = mock.patch.object(politeness, 'time')
+        self.clock = clock.start().monotonic
+        self.addCleanup(clock.stop)
+        self.clock.return_value = 1000.0
+        self.session = FakeSession({})
+
+    def get_page(self, url, stream=False, any_status=False):
+        with mock.patch.object(
+            scraper, 'get_session', return_value=self.session
+        ):
+            return scraper.get_page(url, stream, any_status=any_status)
+
+    def wait(self, seconds):
+        self.clock.return_value += seconds
+
+    def test_tokens_come_at_the_rate_of_the_host(self):
+        host = politeness.Host()
+
+        self.assertEqual([host.take() for i in range(jg.HOST_BURST)],
+                         [0.0] * jg.HOST_BURST)
+        self.assertAlmostEqual(host.take(), 1 / jg.HOST_RATE)
+        self.wait(0.5 / jg.HOST_RATE)
+        self.assertAlmostEqual(host.take(), 0.5 / jg.HOST_RATE)
+        self.wait(0.5 / jg.HOST_RATE)
+        self.assertEqual(host.take(), 0.0)
+
+    def test_rate_grows_slowly_and_is_cut_in_half(self):
+        host = politeness.Host()
+
+        host.record(200)
+        self.assertAlmostEqual(host.rate, jg.HOST_RATE + jg.HOST_RATE_STEP)
+        host.record(404)
+        self.assertAlmostEqual(host.rate, jg.HOST_RATE + jg.HOST_RATE_STEP)
+        host.record(503)
+        self.assertAlmostEqual(
+            host.rate, (jg.HOST_RATE + jg.HOST_RATE_STEP) * jg.HOST_BACKOFF)
+        # No burst after a slow down.
+        self.assertGreater(host.take(), 0)
+
+        for i in range(100):
+            host.record(None)
+        self.assertEqual(host.rate, jg.HOST_MIN_RATE)
+        for i in range(100):
+            host.record(200)
+        self.assertEqual(host.rate, jg.HOST_MAX_RATE)
+
+    def test_retry_after_holds_the_host(self):
+        host = politeness.Host()
+
+        host.record(429, retry_after=120)
+        self.assertAlmostEqual(host.take(), 120)
+        host.record(503, retry_after=10 ** 6)
+        self.assertAlmostEqual(host.take(), jg.HOST_MAX_WAIT)
+        self.wait(jg.HOST_MAX_WAIT)
+        self.assertEqual(host.take(), 0.0)
+
+    def test_parse_retry_after(self):
+        in_two_minutes = http_date(time.time() + 120)
+
+        self.assertEqual(politeness.parse_retry_after('120'), 120.0)
+        self.assertEqual(politeness.parse_retry_after('-5'), 0.0)
+        self.assertAlmostEqual(
+            politeness.parse_retry_after(in_two_minutes), 120, delta=2)
+        self.assertEqual(politeness.parse_retry_after(
+            'Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+        for value in (None, '', 'soon'):
+            self.assertIsNone(politeness.parse_retry_after(value))
+
+    def test_robots_txt_rules_and_crawl_delay(self):
+        self.session.pages[self.ROBOTS] = (
+            200, b'User-agent: *\nCrawl-delay: 5\nDisallow: /private/\n', {})
+
+        self.assertIsNone(
+            politeness.check_robots('http://news.test/1', self.get_page))
+        self.assertEqual(
+            politeness.check_robots(
+                'http://news.test/private/1', self.get_page),
+            (politeness.DISALLOWED, None))
+
+        host = politeness.host_for(self.ROBOTS)
+        self.assertEqual(host.rate, 0.2)
+        for i in range(100):
+            host.record(200)
+        self.assertEqual(host.rate, 0.2)
+        # Read once every ROBOTS_TTL.
+        self.assertEqual(len(self.session.requests), 1)
+
+    def test_missing_robots_txt_allows_everything(self):
+        self.assertIsNone(
+            politeness.check_robots('http://news.test/1', self.get_page))
+
+        self.assertFalse(LogEntry.objects.filter(
+            msg__contains='Got response code').exists())
+
+    def test_broken_robots_txt_holds_the_host(self):
+        self.session.pages[self.ROBOTS] = (503, b'', {})
+
+        self.assertEqual(
+            politeness.check_robots('http://news.test/1', self.get_page),
+            (503, jg.ROBOTS_RETRY))
+        self.assertEqual(
+            politeness.check_robots('http://news.test/2', self.get_page),
+            (503, jg.ROBOTS_RETRY))
+        self.assertGreaterEqual(
+            politeness.take('http://news.test/1'), jg.ROBOTS_RETRY - 1)
+        self.assertEqual(len(self.session.requests), 1)
+
+        self.session.pages[self.ROBOTS] = (404, b'', {})
+        self.wait(jg.ROBOTS_RETRY)
+        self.assertIsNone(
+            politeness.check_robots('http://news.test/1', self.get_page))
+
+    def test_unreachable_robots_txt_holds_the_host(self):
+        self.assertEqual(
+            politeness.check_robots(
+                'http://news.test/1', lambda url, any_status: None),
+            (None, jg.ROBOTS_RETRY))
+
+    def test_pages_of_a_held_host_are_deferred(self):
+        politeness.host_for('http://slow.test/').record(503, retry_after=600)
+        self.session.pages['http://fast.test/1'] = (200, b'page', {})
+        entries = [
+            ('http://slow.test/1',), ('http://fast.test/1',),
+            ('http://slow.test/2',),
+        ]
+
+        results = {
+            entry[0]: (response, failure)
+            for entry, response, failure in fetcher.fetch_pages(
+                entries, self.get_page)
+        }
+
+        self.assertEqual(results['http://fast.test/1'][0].content, b'page')
+        for url in ('http://slow.test/1', 'http://slow.test/2'):
+            response, (status, wait_for) = results[url]
+            self.assertIsNone(response)
+            self.assertEqual(status, politeness.DEFERRED)
+            self.assertAlmostEqual(wait_for, 600)
+        self.assertNotIn(
+            'slow.test', ' '.join(url for url, h in self.session.requests))
+
+
+class LinksTests(TestCase):
+
+    BASE = 'http://news.test/world/index.html'
+
+    def test_links_are_absolute_and_unique(self):
+        html = (
+            '<a href="/world/1">1</a><a href="2#comments">2</a>'
+            '<a href="../sports/3">3</a><a href="//cdn.test/4">4</a>'
+            '<a href="https://other.test/5">5</a><a href="2">2</a>'
+            '<!-- <a href="/hidden">x</a> -->'
+        ).encode('utf-8')
+
+        self.assertEqual(links.extract_links(html, self.BASE), [
+            'http://news.test/world/1', 'http://news.test/world/2',
+            'http://news.test/sports/3', 'http://cdn.test/4',
+            'https://other.test/5',
+        ])
+
+    def test_base_href_is_used(self):
+        html = (
+            b'<html><head><base href="/archive/"></head>'
+            b'<body><a href="1">1</a><a href="/world/2">2</a></body></html>'
+        )
+
+        self.assertEqual(links.extract_links(html, self.BASE), [
+            'http://news.test/archive/1', 'http://news.test/world/2'])
+
+    def test_greek_links_are_not_read_as_latin1(self):
+        html = '<p>Ειδήσεις</p><a href="/ειδήσεις/1">1</a>'
+        url = 'http://news.test/ειδήσεις/1'
+
+        urls = links.extract_links(html.encode('utf-8'), self.BASE)
+        self.assertEqual(urls, [url])
+        self.assertEqual(
+            links.filter_links(urls, 'http://news.test/ειδήσεις/'), [url])
+
+        self.assertEqual(links.extract_links(
+            html.encode('windows-1253'), self.BASE, 'windows-1253'), [url])
+        meta = '<meta charset="iso-8859-7">' + html
+        self.assertEqual(links.extract_links(
+            meta.encode('iso-8859-7'), self.BASE), [url])
+
+
+class ReparseTests(TestCase):
+
+    def setUp(self):
+        use_temp_store(self)
+        self.source = make_source()
+
+    def reparse(self, **filters):
+        # Threads stand in for the processes.
+        with mock.patch.object(
+            reparse, 'ProcessPoolExecutor', wraps=ThreadPoolExecutor
+        ):
+            return reparse.reparse_pages(StoredPage.objects.filter(**filters))
+
+    def test_rejected_pages_become_articles(self):
+        html_store.put('http://news.test/5', make_page(5))
+        html_store.put('http://other.test/5', make_page(5, 'Other'))
+
+        counts = self.reparse()
+
+        self.assertEqual((counts['new'], counts['no_source']), (1, 1))
+        article = Article.objects.get()
+        self.assertEqual(article.source, 'http://news.test/5')
+        self.assertEqual(article.topic_id, self.source.topic_id)
+        self.assertEqual(article.original_language, 'en')
+
+    def test_changed_articles_are_checked_for_duplicates(self):
+        html_store.put('http://news.test/5', make_page(5))
+        self.reparse(url='http://news.test/5')
+        original = Article.objects.get()
+        article = make_article(6)
+        html_store.put(article.source, make_page(5, 'Story 6'))
+
+        counts = self.reparse(url=article.source)
+
+        self.assertEqual(counts['changed'], 1)
+        article.refresh_from_db()
+        self.assertEqual(article.original_title, 'Story 6')
+        self.assertEqual(article.duplicate_of, original)
+
+
+class ExtractorTests(TestCase):
+
+    def test_article_in_a_form_is_extracted_from_one_parse(self):
+        html = make_page(1).replace(b'<article>', b'<form><header>').replace(
+            b'</article>', b'</header></form><nav>Home News Sports</nav>')
+
+        with mock.patch.object(
+            extractor, 'parse_document', wraps=extractor.parse_document
+        ) as parse_document:
+            article = extractor.extract(html, extractor.LXML, 500)
+
+        self.assertEqual(parse_document.call_count, 1)
+        self.assertEqual(article.title, 'Story 1')
+        self.assertTrue(article.text.startswith('Sentence 0 of the story 1'))
+        self.assertNotIn('Sports', article.text)
+
+    def greek_page(self, encoding, meta=''):
+        text = ' '.join(
+            'Το λιμάνι του Πειραιά, πρόταση {}.'.format(i) for i in range(60))
+        return (
+            '<html><head>{}<title>Το λιμάνι</title></head>'
+            '<body><article><p>{}</p></article></body></html>'.format(
+                meta, text)
+        ).encode(encoding)
+
+    def test_utf8_page_without_charset_is_not_read_as_latin1(self):
+        html = self.greek_page('utf-8')
+
+        article = extractor.extract(html, extractor.LXML, 100)
+        self.assertEqual(article.title, 'Το λιμάνι')
+        self.assertIn('Πειραιά', article.text)
+        # Newspaper looks for English stopwords so it finds no Greek text.
+        article = extractor.extract(html, extractor.NEWSPAPER, 100)
+        self.assertEqual(article.title, 'Το λιμάνι')
+
+    def test_charset_of_the_response_is_used(self):
+        html = self.greek_page('windows-1253')
+
+        article = extractor.extract(
+            html, extractor.LXML, 100, charset='windows-1253')
+
+        self.assertEqual(article.title, 'Το λιμάνι')
+        self.assertIn('Πειραιά', article.text)
+
+    def test_meta_charset_is_used(self):
+        html = self.greek_page(
+            'iso-8859-7', '<meta charset="iso-8859-7">')
+
+        article = extractor.extract(html, extractor.LXML, 100)
+
+        self.assertEqual(article.title, 'Το λιμάνι')
+
+
+class SearchTests(TestCase):
+
+    def test_index_follows_the_articles_after_the_migrations(self):
+        self.assertTrue(search.has_fts())
+        article = make_article(1)
+
+        found, count = search.search(q='harbour')
+        self.assertEqual((found, count), ([article], 1))
+
+        article.original_text = 'A story about the lighthouse.'
+        article.save()
+        self.assertEqual(search.search(q='harbour')[1], 0)
+        self.assertEqual(search.search(q='lighthouse')[1], 1)
+
+        article.delete()
+        self.assertEqual(search.search(q='lighthouse')[1], 0)
+
+    def test_missing_triggers_are_restored(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DROP TRIGGER {}_ai'.format(search.FTS_TABLE))
+        search.HAS_FTS = None
+        self.addCleanup(setattr, search, 'HAS_FTS', None)
+        article = make_article(1)
+
+        # The index misses the article so LIKE is used instead.
+        self.assertFalse(search.has_fts())
+        self.assertEqual(search.search(q='harbour')[1], 1)
+
+        self.assertEqual(
+            search.restore_triggers(), [search.FTS_TABLE + '_ai'])
+        self.assertTrue(search.has_fts())
+        self.assertEqual(search.search(q='harbour'), ([article], 1))
+        self.assertEqual(search.restore_triggers(), [])
+
+    def test_title_matches_come_first(self):
+        in_title = make_article(1, title='The lighthouse keeper')
+        in_text = make_article(
+            2, original_text='A night at the lighthouse of the harbour.')
+        in_summary = make_article(3, summary='The lighthouse is closed.')
+
+        found, count = search.search(q='lighthouse')
+
+        # bm25 with SEARCH_WEIGHTS, not the newest first.
+        self.assertEqual(found, [in_title, in_summary, in_text])
+        self.assertEqual(search.search(q='lighthouse keeper')[0], [in_title])
+
+    def test_filters(self):
+        sports, created = Topic.objects.get_or_create(title='Sports')
+        first = make_article(1, keywords='Ports, Ships')
+        second = make_article(2, topic=sports, status=READY)
+        make_article(3, keywords='Weather')
+        search.set_keywords(Article.objects.all())
+
+        self.assertEqual(
+            search.search(q='harbour', keyword=' ports '), ([first], 1))
+        self.assertEqual(search.search(keyword='ships'), ([first], 1))
+        self.assertEqual(
+            search.search(q='harbour', topic='Sports'), ([second], 1))
+        self.assertEqual(search.search(status=READY), ([second], 1))
+        self.assertEqual(
+            search.search(q='harbour', topic='Sports', keyword='ports'),
+            ([], 0))
+
+    def test_pages(self):
+        articles = [make_article(i) for i in range(5)]
+
+        pages = [
+            search.search(q='harbour', page=page, per_page=2)
+            for page in (1, 2, 3, 4)
+        ]
+
+        self.assertEqual([count for found, count in pages], [5] * 4)
+        self.assertEqual(
+            [len(found) for found, count in pages], [2, 2, 1, 0])
+        self.assertEqual(
+            {article for found, count in pages for article in found},
+            set(articles))
+
+    def test_endpoint(self):
+        for i in range(3):
+            make_article(i)
+
+        response = self.client.get(
+            '/api/search/', {'q': 'harbour', 'per_page': 2, 'page': 2})
+        data = response.json()
+
+        self.assertEqual(
+            (data['count'], data['page'], data['pages']), (3, 2, 2))
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['results'][0]['topic'], 'World')
+        self.assertEqual(
+            self.client.get('/api/search/', {'page': 'x'}).status_code, 400)
+
+
+class RecommendTests(TestCase):
+
+    # Rows 1 and 2 are the same story (0.96), row 3 is like nothing else.
+    VECTORS = [[1, 0, 0], [0.8, 0.6, 0], [0.6, 0.8, 0], [0, 0, 1]]
+
+    def setUp(self):
+        self.matrix = sparse.csr_matrix(
+            np.array(self.VECTORS, dtype=np.float32))
+
+    def columns(self, found):
+        return {
+            row: [column for column, similarity in columns]
+            for row, columns in found.items()
+        }
+
+    def test_top_k(self):
+        # One row per block.
+        with mock.patch.object(jg, 'RECOMMEND_BLOCK_CELLS', 4):
+            found = recommend.top_k(self.matrix, [0, 1, 3], 2)
+
+        self.assertEqual(
+            self.columns(found), {0: [1, 2], 1: [0], 3: []})
+        self.assertAlmostEqual(found[0][0][1], 0.8, places=5)
+        self.assertAlmostEqual(found[0][1][1], 0.6, places=5)
+
+    def test_affected_rows(self):
+        self.assertEqual(recommend.affected_rows(self.matrix, []), [])
+        self.assertEqual(
+            recommend.affected_rows(self.matrix, [0]), [0, 1, 2])
+        self.assertEqual(recommend.affected_rows(self.matrix, [3]), [3])
+
+    def test_only_new_and_affected_articles_are_updated(self):
+        titles = [
+            'Harbour strike in Piraeus', 'Harbour strike ends',
+            'Football final tonight', 'Football final result',
+        ]
+        articles = [
+            make_article(i, title=title, status=READY)
+            for i, title in enumerate(titles)
+        ]
+        self.assertEqual(recommend.update_recommendations(), 4)
+        self.assertEqual(recommend.update_recommendations(), 0)
+
+        new = make_article(4, title='Harbour strike talks', status=READY)
+
+        self.assertEqual(recommend.update_recommendations(), 3)
+        self.assertIn(
+            new.source,
+            articles[0].url_recommendations.values_list('url', flat=True))
+        self.assertFalse(Article.objects.filter(
+            status=READY, date_recommended__isnull=True).exists())
+
+
+class LogTests(TestCase):
+
+    def test_buffered_entries_are_written_at_the_end(self):
+        with update_log.buffered():
+            for i in range(3):
+                update_log.info('Line {}'.format(i))
+            update_log.event('fetch', pages=3)
+            self.assertEqual(LogEntry.objects.count(), 0)
+
+        self.assertEqual(
+            [entry.msg[-6:] for entry in LogEntry.objects.order_by('pk')],
+            ['Line 0', 'Line 1', 'Line 2', ''])
+
+    def test_full_buffer_is_written_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            with update_log.buffered():
+                for i in range(jg.LOG_FLUSH_SIZE):
+                    update_log.info('Line {}'.format(i))
+                self.assertEqual(
+                    LogEntry.objects.count(), jg.LOG_FLUSH_SIZE)
+
+        inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+    def test_old_entries_are_trimmed(self):
+        with mock.patch.object(
+            jg, 'LOG_MAX_ENTRIES', 20
+        ), mock.patch.object(jg, 'LOG_TRIM_EVERY', 10):
+            with update_log.buffered():
+                for i in range(35):
+                    update_log.info('Line {}'.format(i))
+
+        self.assertEqual(LogEntry.objects.count(), 20)
+
+
+class QuotaTests(TestCase):
+
+    KEY = 'quota'
+    DAY = timedelta(days=1)
+
+    def remaining(self):
+        return GCCache.remaining(self.KEY, 10)
+
+    def test_reserve_stops_at_the_limit(self):
+        self.assertTrue(GCCache.reserve(self.KEY, 6, 10, self.DAY))
+        self.assertFalse(GCCache.reserve(self.KEY, 5, 10, self.DAY))
+        self.assertTrue(GCCache.reserve(self.KEY, 4, 10, self.DAY))
+        self.assertEqual(self.remaining(), 0)
+        self.assertFalse(GCCache.reserve(self.KEY, 11, 10, self.DAY))
+
+    def test_refund_gives_the_quota_back(self):
+        GCCache.reserve(self.KEY, 10, 10, self.DAY)
+        GCCache.refund(self.KEY, 3)
+
+        self.assertEqual(self.remaining(), 3)
+        self.assertTrue(GCCache.reserve(self.KEY, 3, 10, self.DAY))
+
+    def test_quota_is_reset_every_period(self):
+        GCCache.reserve(self.KEY, 10, 10, self.DAY)
+        GCCache.objects.filter(pk=self.KEY).update(
+            expire_on=timezone.now() - timedelta(seconds=1))
+
+        self.assertTrue(GCCache.reserve(self.KEY, 4, 10, self.DAY))
+        self.assertEqual(self.remaining(), 6)
+
+
+class SitemapTests(TestCase):
+
+    URLS = ['http://news.test/1', 'http://news.test/2']
+
+    def parse(self, data, since=None):
+        return list(sitemap.parse_sitemap(
+            chunks_of(data), get_page=None, since=since))
+
+    def test_sitemap_is_read_in_chunks(self):
+        entries = self.parse(make_sitemap(*self.URLS))
+
+        self.assertEqual([url for url, lastmod in entries], self.URLS)
+        self.assertEqual(
+            entries[0][1], sitemap.parse_lastmod('2020-09-21T07:00:00Z'))
+
+    def test_gzipped_sitemap_is_read_in_chunks(self):
+        entries = self.parse(gzip.compress(make_sitemap(*self.URLS)))
+
+        self.assertEqual([url for url, lastmod in entries], self.URLS)
+
+    def test_entries_that_did_not_change_are_skipped(self):
+        since = sitemap.parse_lastmod('2020-09-21T07:00:00Z')
+        data = make_sitemap(*self.URLS).replace(
+            b'</urlset>',
+            b'<url><loc>http://news.test/3</loc>'
+            b'<lastmod>2020-09-22</lastmod></url></urlset>')
+
+        entries = self.parse(data, since=since)
+
+        self.assertEqual(
+            [url for url, lastmod in entries], ['http://news.test/3'])
+
+    def test_index_is_followed(self):
+        session = FakeSession({
+            'http://news.test/index.xml': (
+                200, make_sitemap(
+                    'http://news.test/news.xml', tag='sitemap'), {}),
+            'http://news.test/news.xml': (200, make_sitemap(*self.URLS), {}),
+        })
+
+        followed = []
+        entries = list(sitemap.iter_sitemap(
+            'http://news.test/index.xml',
+            lambda url, stream=False: session.get(url),
+            followed=followed
+        ))
+
+        self.assertEqual([url for url, lastmod in entries], self.URLS)
+        self.assertEqual(followed, ['http://news.test/news.xml'])
+
+
+class CacheTests(TestCase):
+
+    FUTURE = timedelta(days=1)
+
+    def setUp(self):
+        GCCache.LOCAL.clear()
+
+    def statements(self, context):
+        # Leaves out the savepoints of transaction.atomic().
+        return [
+            query['sql'] for query in context.captured_queries
+            if 'SAVEPOINT' not in query['sql']
+        ]
+
+    def test_get_many_uses_one_query(self):
+        for i in range(5):
+            GCCache.set_item('key{}'.format(i), str(i))
+        keys = ['key{}'.format(i) for i in range(7)]
+
+        with CaptureQueriesContext(connection) as context:
+            items = GCCache.get_many(keys, ttl=60)
+        self.assertEqual(len(self.statements(context)), 1)
+        self.assertEqual(
+            {key: c.value for key, c in items.items()},
+            {'key{}'.format(i): str(i) for i in range(5)}
+        )
+
+        # Both the items and the missing keys are kept for the ttl.
+        with self.assertNumQueries(0):
+            self.assertEqual(len(GCCache.get_many(keys, ttl=60)), 5)
+
+    def test_set_many_uses_one_query_per_step(self):
+        GCCache.set_item('old1', 'a')
+        GCCache.set_item('old2', 'b')
+        values = {'old1': 'x', 'old2': 'y', 'new1': 'z', 'new2': 'w'}
+
+        with CaptureQueriesContext(connection) as context:
+            GCCache.set_many(values)
+
+        # One SELECT of the existing keys, one UPDATE and one INSERT.
+        self.assertEqual(
+            [sql.split()[0] for sql in self.statements(context)],
+            ['SELECT', 'UPDATE', 'INSERT']
+        )
+        self.assertEqual(
+            {c.key: c.value for c in GCCache.objects.all()}, values)
+
+    def test_get_or_set_resets_expired_keys(self):
+        GCCache.set_item(
+            'key', 'old', expire_on=timezone.now() - timedelta(seconds=1))
+        GCCache.set_item(
+            'fresh', 'kept', expire_on=timezone.now() + self.FUTURE)
+
+        c = GCCache.get_or_set(
+            'key', lambda: 'new', expire_on=timezone.now() + self.FUTURE)
+        self.assertEqual(c.value, 'new')
+        self.assertFalse(GCCache.objects.get(pk='key').is_expired())
+
+        c = GCCache.get_or_set('fresh', 'other')
+        self.assertEqual(c.value, 'kept')
+
+    def test_ttl_copies_are_dropped_on_change(self):
+        GCCache.set_item('key', 'old')
+        self.assertEqual(GCCache.get_item('key', ttl=60).value, 'old')
+
+        # Changes from other processes show up after the ttl.
+        GCCache.objects.filter(pk='key').update(value='other')
+        self.assertEqual(GCCache.get_item('key', ttl=60).value, 'old')
+        GCCache.forget('key')
+        self.assertEqual(GCCache.get_item('key', ttl=60).value, 'other')
+
+        # Changes from this process show up at once.
+        GCCache.set_item('key', 'new')
+        self.assertEqual(GCCache.get_item('key', ttl=60).value, 'new')
+        GCCache.increment('count')
+        GCCache.get_item('count', ttl=60)
+        GCCache.increment('count')
+        self.assertEqual(GCCache.get_item('count', ttl=60).value, '2')
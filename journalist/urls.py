@@ -5,7 +5,11 @@ urlpatterns = [
     path('', views.index, name='index'),
 
     path('api/get-data/', views.get_data, name='get_data'),
+    path('api/events/', views.stream_events, name='events'),
     path('api/start-scraping', views.start_scaping, name="start_scraping"),
+    path('api/jobs/<int:pk>', views.job_status, name="job_status"),
+    path('api/jobs/<int:pk>/cancel', views.cancel_job, name="cancel_job"),
+    path('api/search/', views.search_articles, name="search"),
 
     path('edit-article/<int:pk>', views.edit_article, name="edit_article"),
 ]
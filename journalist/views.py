@@ -1,11 +1,13 @@
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.http import HttpResponseRedirect
 
-from .core.app import get_latest_articles
 from .core.articles_factory import article_editor
+from .core import jobs
+from .core import search
+from .core import events
 from .core import journalist_globals as jg
-from .models import Article
+from .models import Article, Job, LogEntry, NEW, EDITING
 
 
 def index(request):
@@ -16,16 +18,108 @@ def index(request):
 
 
 def get_data(request):
+    """ Returns the log entries that were added after the since GET parameter
+    (the cursor of the previous poll), newest first, and the new cursor.
+    Without since the last entries are returned.
+    """
+    try:
+        since = request.GET.get('since')
+        since = int(since) if since else None
+    except ValueError:
+        return JsonResponse({"status": "BAD_REQUEST"}, status=400)
+
+    entries = LogEntry.since(since, jg.LOG_PAGE_SIZE)
     context = {
         "status": "OK",
-        "log": jg.LOG
+        "log": [entry.to_dict() for entry in reversed(entries)],
+        "cursor": entries[-1].pk if len(entries) > 0 else since,
     }
     return JsonResponse(context)
 
 
+def stream_events(request):
+    """ Streams the log and the progress events as Server-Sent Events.
+    Starts after the Last-Event-ID header (or the since GET parameter) if
+    there is one.
+    """
+    try:
+        since = (
+            request.META.get('HTTP_LAST_EVENT_ID') or
+            request.GET.get('since')
+        )
+        since = int(since) if since else None
+    except ValueError:
+        return JsonResponse({"status": "BAD_REQUEST"}, status=400)
+
+    response = StreamingHttpResponse(
+        events.stream(since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def start_scaping(request):
-    get_latest_articles()
-    return JsonResponse({"status": "OK"})
+    """ Queues a scraping run for the workers and returns its job id.
+    If a run is allready queued or running its job id is returned instead.
+    """
+    job = jobs.enqueue_scrape()
+    if job is None:
+        job = jobs.get_active_job()
+        return JsonResponse({
+            "status": "RUNNING",
+            "job_id": job.pk if job is not None else None
+        })
+    return JsonResponse({"status": "OK", "job_id": job.pk})
+
+
+def job_status(request, pk):
+    try:
+        job = Job.objects.get(pk=pk)
+    except Job.DoesNotExist:
+        return JsonResponse({"status": "NOT_FOUND"}, status=404)
+    return JsonResponse({
+        "status": "OK",
+        "job": jobs.job_to_dict(job),
+        "articles_to_edit": Article.objects.filter(
+            status__in=[NEW, EDITING]).count()
+    })
+
+
+def cancel_job(request, pk):
+    if jobs.cancel_job(pk):
+        return JsonResponse({"status": "OK"})
+    return JsonResponse({"status": "NOT_ACTIVE"})
+
+
+def search_articles(request):
+    """ Searches the articles. Takes the q, keyword, topic, status, page and
+    per_page GET parameters.
+    """
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        per_page = min(
+            max(int(request.GET.get('per_page', jg.SEARCH_PAGE_SIZE)), 1),
+            jg.SEARCH_MAX_PAGE_SIZE
+        )
+    except ValueError:
+        return JsonResponse({"status": "BAD_REQUEST"}, status=400)
+
+    articles, count = search.search(
+        q=request.GET.get('q', ''),
+        keyword=request.GET.get('keyword'),
+        topic=request.GET.get('topic'),
+        status=request.GET.get('status'),
+        page=page,
+        per_page=per_page
+    )
+    return JsonResponse({
+        "status": "OK",
+        "count": count,
+        "page": page,
+        "pages": (count + per_page - 1) // per_page,
+        "results": [search.article_to_dict(a) for a in articles],
+    })
 
 
 def edit_article(request, pk):
@@ -141,7 +141,25 @@ STATICFILES_DIRS = (
     os.path.join(BASE_DIR, "static"),
 )
 
+# The scraper and MyMemory requests go through Tor.
+SCRAPER_PROXIES = {
+    'http': 'socks5://127.0.0.1:9050',
+    'https': 'socks5://127.0.0.1:9050',
+}
+
 # Watson settings
 WATSON_IAM_KEY = "I hope you're not thinking of putting this here"
 WATSON_VERSION = "2018-05-01"
 WATSON_SERVICE_URL = "https://gateway-fra.watsonplatform.net/language-translator/api"
+WATSON_TIMEOUT = 60
+# A fixed bearer token to use instead of the IAM key, e.g. for a local
+# stand-in service.
+WATSON_BEARER_TOKEN = None
+
+# MyMemory settings
+MYMEMORY_URL = "http://api.mymemory.translated.net/get"
+
+# HTML store settings
+# Every fetched page is kept here (gzipped) so that the articles can be
+# parsed again without scraping. Set it to None to turn the store off.
+HTML_STORE_ROOT = os.path.join(BASE_DIR, "html_store")